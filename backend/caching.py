@@ -0,0 +1,181 @@
+"""Response caching for anonymous reads.
+
+Views opt in per action, listing the models each cached action reads.
+Every model has a version number in the cache; saving or deleting an
+instance bumps it, which retires every cached response that depends on
+that model without having to find and delete them. Code that writes
+through ``bulk_create`` or ``update`` calls ``invalidate_models`` itself.
+
+On a miss one request rebuilds the response while concurrent requests for
+the same key wait briefly for it instead of all hitting the database.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date
+
+# Model labels that some cached action depends on
+tracked_models = set()
+
+LOCK_SECONDS = 10
+LOCK_WAIT_SECONDS = 2
+LOCK_POLL_SECONDS = 0.05
+
+
+def _version_key(label):
+    return f'response-cache-version:{label}'
+
+
+def _modified_key(label):
+    return f'response-cache-modified:{label}'
+
+
+def fresh_version():
+    # A version that was never used before, in case the old one was evicted
+    return time.time_ns()
+
+
+def invalidate_models(labels):
+    """Retire cached responses that depend on any of these model labels"""
+    now = time.time()
+    for label in labels:
+        try:
+            cache.incr(_version_key(label))
+        except ValueError:
+            cache.set(_version_key(label), fresh_version(), None)
+        cache.set(_modified_key(label), now, None)
+
+
+def model_versions(labels):
+    keys = [_version_key(label) for label in labels]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, fresh_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def models_modified(labels):
+    """Unix time of the latest invalidation of any of these model labels"""
+    keys = [_modified_key(label) for label in labels]
+    times = cache.get_many(keys)
+    for key in keys:
+        if key not in times:
+            # Unknown (never bumped, or evicted): assume it changed just now
+            now = time.time()
+            cache.add(key, now, None)
+            times[key] = cache.get(key) or now
+    return max(times.values(), default=None)
+
+
+def _invalidate_sender(sender, **kwargs):
+    label = sender._meta.label_lower
+    if label in tracked_models:
+        transaction.on_commit(lambda: invalidate_models([label]))
+
+
+post_save.connect(_invalidate_sender, dispatch_uid='response-cache-post-save')
+post_delete.connect(_invalidate_sender, dispatch_uid='response-cache-post-delete')
+
+
+class CachedResponseMixin:
+    """Cache anonymous GET responses for the actions in ``cache_actions``.
+
+    ``cache_actions`` maps an action name to the model labels
+    (``app_label.modelname``) its response is built from.
+    """
+    cache_actions = {}
+    cache_timeout = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for labels in cls.cache_actions.values():
+            tracked_models.update(label.lower() for label in labels)
+
+    def dispatch(self, request, *args, **kwargs):
+        labels = self._cached_models(request)
+        if labels is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = self._response_cache_key(request, labels)
+        cached = cache.get(key)
+        if cached is None:
+            lock_key = f'{key}:lock'
+            if cache.add(lock_key, 1, LOCK_SECONDS):
+                try:
+                    return self._render_and_store(request, key, *args, **kwargs)
+                finally:
+                    cache.delete(lock_key)
+            cached = self._wait_for(key)
+            if cached is None:
+                return super().dispatch(request, *args, **kwargs)
+        return self._from_cache(request, cached)
+
+    def _cached_models(self, request):
+        """Dependencies of this request's action, or None if it is not cacheable"""
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        # Only anonymous traffic is shared; any credentials bypass the cache
+        if 'HTTP_AUTHORIZATION' in request.META or settings.SESSION_COOKIE_NAME in request.COOKIES:
+            return None
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        return self.cache_actions.get(action)
+
+    def _response_cache_key(self, request, labels):
+        labels = sorted(label.lower() for label in labels)
+        versions = model_versions(labels)
+        fingerprint = '|'.join([
+            f'{type(self).__module__}.{type(self).__name__}',
+            request.get_host(),
+            request.path,
+            '&'.join(sorted(f'{name}={value}' for name, values in request.GET.lists() for value in values)),
+            request.META.get('HTTP_ACCEPT', ''),
+            ','.join(f'{label}={version}' for label, version in zip(labels, versions)),
+        ])
+        return 'response-cache:' + hashlib.sha256(fingerprint.encode()).hexdigest()
+
+    def _render_and_store(self, request, key, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code != 200 or response.streaming:
+            return response
+        if hasattr(response, 'render'):
+            response.render()
+        validators = {
+            header: response[header] for header in ('ETag', 'Last-Modified') if response.has_header(header)
+        }
+        cached = (response.content, response['Content-Type'], validators)
+        timeout = self.cache_timeout if self.cache_timeout is not None else settings.RESPONSE_CACHE_SECONDS
+        cache.set(key, cached, timeout)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def _wait_for(self, key):
+        deadline = time.monotonic() + LOCK_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_SECONDS)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        return None
+
+    def _from_cache(self, request, cached):
+        content, content_type, validators = cached
+        last_modified = validators.get('Last-Modified')
+        response = get_conditional_response(
+            request,
+            etag=validators.get('ETag'),
+            last_modified=last_modified and parse_http_date(last_modified),
+        )
+        if response is None:
+            response = HttpResponse(content, content_type=content_type)
+        for header, value in validators.items():
+            response[header] = value
+        response['X-Cache'] = 'HIT'
+        return response
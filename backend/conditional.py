@@ -0,0 +1,80 @@
+"""Conditional GET for list and detail endpoints.
+
+Validators are cheap: one ``Max`` over the same filtered queryset the
+endpoint would serialize, plus the model versions kept in
+``backend.caching``. The version of the endpoint's own model changes on
+every save, delete and bulk write, so edits that leave
+``conditional_field`` alone and deletions change the ETag without
+counting rows. Related data such as the current prices shown on a product
+is covered by the versions of ``conditional_models``. Last-Modified is the
+later of the newest ``conditional_field`` value and the last time any of
+those versions was bumped.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .caching import model_versions, models_modified, tracked_models
+
+
+class ConditionalGetMixin:
+    """ETag and Last-Modified for ``list`` and ``retrieve``, with 304 responses.
+
+    ``conditional_field`` names the timestamp that changes whenever a row
+    does; ``conditional_models`` lists other model labels the serialized
+    output depends on. The viewset's own model is always included; views
+    without a ``queryset`` attribute must list it themselves.
+    """
+    conditional_field = 'updated_at'
+    conditional_models = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        tracked_models.update(cls._conditional_labels(getattr(cls, 'queryset', None)))
+
+    @classmethod
+    def _conditional_labels(cls, queryset):
+        labels = [queryset.model._meta.label_lower] if queryset is not None else []
+        return labels + [label.lower() for label in cls.conditional_models if label.lower() not in labels]
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._conditional(request, queryset, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.get_queryset().filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            # A lookup value of the wrong type, as get_object() would treat it
+            raise Http404
+        return self._conditional(request, queryset, super().retrieve, *args, **kwargs)
+
+    def _validators(self, request, queryset):
+        labels = self._conditional_labels(queryset)
+        newest = queryset.order_by().aggregate(newest=Max(self.conditional_field))['newest']
+        fingerprint = '|'.join(map(str, [
+            request.get_full_path(),
+            request.user.pk,
+            newest and newest.isoformat(),
+            *model_versions(labels),
+        ]))
+        etag = '"%s"' % hashlib.md5(fingerprint.encode()).hexdigest()
+        modified = [value for value in (newest and newest.timestamp(), models_modified(labels)) if value]
+        last_modified = int(max(modified)) if modified else None
+        return etag, last_modified
+
+    def _conditional(self, request, queryset, handler, *args, **kwargs):
+        etag, last_modified = self._validators(request, queryset)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
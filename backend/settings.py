@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
@@ -79,6 +80,24 @@ if DATABASE_URL:
     import dj_database_url
     DATABASES['default'] = dj_database_url.parse(DATABASE_URL)
 
+# Cache: Redis when REDIS_URL is set, otherwise per-process local memory
+REDIS_URL = config('REDIS_URL', default=None)
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Lifetime of cached anonymous API responses; model changes retire them sooner
+RESPONSE_CACHE_SECONDS = config('RESPONSE_CACHE_SECONDS', default=600, cast=int)
+
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -156,4 +175,45 @@ CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = TIME_ZONE
\ No newline at end of file
+CELERY_TIMEZONE = TIME_ZONE
+
+# Currency that prices are normalised to for sorting, minimums and alerts;
+# rates for other currencies come from the FXRate table
+PRICE_BASE_CURRENCY = config('PRICE_BASE_CURRENCY', default='USD')
+FX_CACHE_SECONDS = config('FX_CACHE_SECONDS', default=60, cast=int)
+
+# Retention: raw prices and hourly rollups are pruned by prune_price_history;
+# daily rollups are kept
+PRICE_RETENTION_DAYS = config('PRICE_RETENTION_DAYS', default=90, cast=int)
+PRICE_HOURLY_ROLLUP_RETENTION_DAYS = config('PRICE_HOURLY_ROLLUP_RETENTION_DAYS', default=365, cast=int)
+SCRAPE_LOG_RETENTION_DAYS = config('SCRAPE_LOG_RETENTION_DAYS', default=90, cast=int)
+
+# Cold storage: archive_prices moves raw prices older than this many days
+# into Parquet files under PRICE_ARCHIVE_DIR; keep it below the retention
+# period so rows are archived before they would be pruned
+PRICE_ARCHIVE_DAYS = config('PRICE_ARCHIVE_DAYS', default=60, cast=int)
+PRICE_ARCHIVE_DIR = config('PRICE_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'prices'))
+
+# Price ingestion: only store a new Price row when price, currency or
+# availability changed; unchanged observations extend last_seen instead
+PRICE_SKIP_UNCHANGED = config('PRICE_SKIP_UNCHANGED', default=True, cast=bool)
+# Cached price statistics are also invalidated whenever a product gets new prices
+PRICE_STATISTICS_CACHE_SECONDS = config('PRICE_STATISTICS_CACHE_SECONDS', default=3600, cast=int)
+
+# Autocomplete index rebuild interval; product saves apply immediately in between
+SUGGEST_REFRESH_SECONDS = config('SUGGEST_REFRESH_SECONDS', default=300, cast=int)
+
+# Price scraper
+SCRAPER_CONCURRENCY = config('SCRAPER_CONCURRENCY', default=64, cast=int)
+SCRAPER_PER_PROVIDER_CONCURRENCY = config('SCRAPER_PER_PROVIDER_CONCURRENCY', default=4, cast=int)
+SCRAPER_POLITENESS_DELAY = config('SCRAPER_POLITENESS_DELAY', default=0.25, cast=float)  # seconds between requests to one provider
+SCRAPER_TIMEOUT = config('SCRAPER_TIMEOUT', default=15, cast=float)
+SCRAPER_MAX_PAGE_BYTES = config('SCRAPER_MAX_PAGE_BYTES', default=2 * 1024 * 1024, cast=int)
+SCRAPER_PARSE_BUDGET_MS = config('SCRAPER_PARSE_BUDGET_MS', default=50, cast=float)  # parser CPU time per page
+# Adaptive scheduling, all intervals in seconds
+SCRAPER_BASE_INTERVAL = config('SCRAPER_BASE_INTERVAL', default=6 * 3600, cast=int)
+SCRAPER_MIN_INTERVAL = config('SCRAPER_MIN_INTERVAL', default=15 * 60, cast=int)
+SCRAPER_MAX_INTERVAL = config('SCRAPER_MAX_INTERVAL', default=48 * 3600, cast=int)
+SCRAPER_LEASE_SECONDS = config('SCRAPER_LEASE_SECONDS', default=15 * 60, cast=int)
+SCRAPER_VOLATILITY_WINDOW_DAYS = config('SCRAPER_VOLATILITY_WINDOW_DAYS', default=14, cast=int)
+SCRAPER_USER_AGENT = config('SCRAPER_USER_AGENT', default='PricePulseBot/1.0')
\ No newline at end of file
@@ -12,7 +12,7 @@ from rest_framework_simplejwt.views import (
 )
 
 from products.views import (
-    CategoryViewSet, SubcategoryViewSet, LocationViewSet,
+    CatalogTreeView, CategoryViewSet, SubcategoryViewSet, LocationViewSet,
     ProviderViewSet, ProductViewSet, VariantViewSet, ProductProviderViewSet
 )
 from prices.views import PriceViewSet, PriceAlertViewSet, PriceScrapeLogViewSet
@@ -28,7 +28,7 @@ router.register(r'products', ProductViewSet)
 router.register(r'variants', VariantViewSet)
 router.register(r'product-providers', ProductProviderViewSet)
 router.register(r'prices', PriceViewSet)
-router.register(r'price-alerts', PriceAlertViewSet)
+router.register(r'price-alerts', PriceAlertViewSet, basename='pricealert')
 router.register(r'scrape-logs', PriceScrapeLogViewSet)
 router.register(r'users', UserViewSet)
 
@@ -40,6 +40,7 @@ urlpatterns = [
     path('api/auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     
     # API Routes
+    path('api/catalog/tree/', CatalogTreeView.as_view(), name='catalog_tree'),
     path('api/', include(router.urls)),
     
     # API Authentication browsable interface
@@ -0,0 +1,193 @@
+"""Price trend analytics computed with NumPy over whole daily series.
+
+Series come from the daily all-providers rollups, so they reach back past
+archived or pruned raw prices. Products become rows of a (products x days)
+matrix holding each day's lowest price in the base currency. A price stays
+in effect until it changes, so a day without observations carries the
+previous day's lowest price forward. Every metric is then a few array operations across
+all rows at once, which keeps category-wide rankings to two queries and no
+per-product Python.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db.models import FloatField, Min, OuterRef, Subquery
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import PriceRollup
+
+SHORT_WINDOW = 7
+LONG_WINDOW = 30
+DEFAULT_DAYS = 90
+MAX_DAYS = 3650
+
+# Metrics that category rankings can be ordered by, largest first
+RANKINGS = {
+    'drop': 'drop_from_high_percent',
+    'volatility': 'volatility_percent',
+}
+
+
+def _daily(product_ids):
+    return PriceRollup.objects.filter(
+        product_id__in=product_ids, resolution=PriceRollup.DAY, provider__isnull=True,
+    )
+
+
+def _history(product_ids, start):
+    """Per product: the last daily low before ``start`` and the all-time low, in one query"""
+    from products.models import Product
+
+    rollups = PriceRollup.objects.filter(
+        product=OuterRef('pk'), resolution=PriceRollup.DAY, provider__isnull=True,
+    ).order_by()
+    rows = Product.objects.filter(pk__in=product_ids).annotate(
+        seed=Subquery(
+            rollups.filter(bucket_start__lt=start).order_by('-bucket_start')
+            .values(value=Cast('low', FloatField()))[:1]
+        ),
+        all_time_low=Subquery(
+            rollups.values('product').annotate(value=Cast(Min('low'), FloatField())).values('value')[:1]
+        ),
+    ).values_list('pk', 'seed', 'all_time_low')
+    return {pk: (seed, low) for pk, seed, low in rows}
+
+
+def _fill_forward(matrix):
+    """Replace NaNs with the nearest value to their left in the same row"""
+    columns = np.arange(matrix.shape[1])
+    last = np.maximum.accumulate(np.where(np.isnan(matrix), 0, columns), axis=1)
+    return matrix[np.arange(matrix.shape[0])[:, None], last]
+
+
+def _window_sums(matrix, window):
+    """Sum and count of non-NaN values over the trailing ``window`` columns, at every column"""
+    valid = ~np.isnan(matrix)
+    sums = np.zeros((matrix.shape[0], matrix.shape[1] + 1))
+    counts = np.zeros_like(sums)
+    np.cumsum(np.where(valid, matrix, 0), axis=1, out=sums[:, 1:])
+    np.cumsum(valid, axis=1, out=counts[:, 1:])
+    lower = np.maximum(np.arange(matrix.shape[1]) + 1 - window, 0)
+    return sums[:, 1:] - sums[:, lower], counts[:, 1:] - counts[:, lower]
+
+
+def moving_average(matrix, window):
+    sums, counts = _window_sums(matrix, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def _row_max(matrix):
+    highest = np.max(np.where(np.isnan(matrix), -np.inf, matrix), axis=1)
+    return np.where(np.isinf(highest), np.nan, highest)
+
+
+def volatility(matrix):
+    """Standard deviation of day-to-day log returns per row, as a percentage"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = np.diff(np.log(matrix), axis=1)
+        valid = np.isfinite(returns)
+        counts = valid.sum(axis=1)
+        mean = np.where(valid, returns, 0).sum(axis=1) / counts
+        deviations = np.where(valid, returns - mean[:, None], 0) ** 2
+        spread = np.sqrt(deviations.sum(axis=1) / counts) * 100
+    return np.where(counts >= 2, spread, np.nan)
+
+
+def load_series(product_ids, days):
+    """(product ids, first day, price matrix, all-time lows); the matrix has one row per product and one column per day"""
+    product_ids = sorted(set(product_ids))
+    today = PriceRollup.bucket_for(timezone.now(), PriceRollup.DAY)
+    start = today - timedelta(days=days - 1)
+    history = _history(product_ids, start)
+
+    known = [history.get(pk, (None, None)) for pk in product_ids]
+    # NumPy reads None as NaN in a float array
+    seeds = np.array([seed for seed, _ in known], dtype=float)
+    all_time_lows = np.array([low for _, low in known], dtype=float)
+
+    rows = np.array(product_ids, dtype=np.int64)
+    # Column 0 holds the last low before the range
+    lows = np.full((len(rows), days + 1), np.nan)
+    lows[:, 0] = seeds
+
+    points = list(
+        _daily(product_ids).filter(bucket_start__gte=start)
+        .annotate(low_value=Cast('low', FloatField()))
+        .values_list('product_id', 'bucket_start', 'low_value')
+    )
+    if points:
+        product_col, buckets, low_col = zip(*points)
+        row_index = np.searchsorted(rows, np.array(product_col, dtype=np.int64))
+        day_index = np.array([(bucket - start).days for bucket in buckets])
+        lows[row_index, day_index + 1] = low_col
+
+    # A day without a new price keeps the low of the last day that had one
+    prices = _fill_forward(lows)[:, 1:]
+    return rows, start, prices, all_time_lows
+
+
+def compute_insights(product_ids, days=DEFAULT_DAYS, series=False):
+    """Map product id to its trend metrics, amounts in the base currency.
+
+    With ``series`` each product also gets its daily prices and moving
+    averages over the last ``days`` days.
+    """
+    days = min(days, MAX_DAYS)
+    # The long-window metrics need a month of history whatever is shown
+    span = max(days, LONG_WINDOW + 1)
+    rows, start, prices, all_time_lows = load_series(product_ids, span)
+    current = prices[:, -1]
+    short_average = moving_average(prices, SHORT_WINDOW)
+    long_average = moving_average(prices, LONG_WINDOW)
+    high = _row_max(prices[:, -LONG_WINDOW:])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        drop = (high - current) / high * 100
+    spread = volatility(prices[:, -(LONG_WINDOW + 1):])
+    # Rollups keep cents, so a half-cent margin absorbs float rounding
+    at_low = current <= all_time_lows + 0.005
+
+    insights = {}
+    for index, product_id in enumerate(rows.tolist()):
+        insights[product_id] = {
+            'product': product_id,
+            'current_price': _amount(current[index]),
+            'moving_average_short': _amount(short_average[index, -1]),
+            'moving_average_long': _amount(long_average[index, -1]),
+            'high_30d': _amount(high[index]),
+            'drop_from_high_percent': _percent(drop[index]),
+            'volatility_percent': _percent(spread[index]),
+            'all_time_low': _amount(all_time_lows[index]),
+            'is_all_time_low': bool(at_low[index]),
+        }
+        if series:
+            insights[product_id]['series'] = [
+                {
+                    'date': (start + timedelta(days=offset)).date(),
+                    'price': _amount(prices[index, offset]),
+                    'moving_average_short': _amount(short_average[index, offset]),
+                    'moving_average_long': _amount(long_average[index, offset]),
+                }
+                for offset in range(span - days, span)
+                if not np.isnan(prices[index, offset])
+            ]
+    return insights
+
+
+def rank_insights(product_ids, ordering='drop', limit=50, days=DEFAULT_DAYS):
+    """Insights for many products, largest ``ordering`` metric first; products without one are left out"""
+    metric = RANKINGS[ordering]
+    insights = compute_insights(product_ids, days)
+    ranked = [item for item in insights.values() if item[metric] is not None]
+    ranked.sort(key=lambda item: (-item[metric], item['product']))
+    return ranked[:limit]
+
+
+def _amount(value):
+    return None if np.isnan(value) else Decimal(f'{value:.2f}')
+
+
+def _percent(value):
+    return None if np.isnan(value) else round(float(value), 2)
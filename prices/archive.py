@@ -0,0 +1,196 @@
+"""Cold storage of old price history in Parquet files.
+
+``archive_prices`` moves rows older than a cutoff out of the database into
+one zstd-compressed Parquet file per product and month::
+
+    PRICE_ARCHIVE_DIR/2024-03/product-17.parquet
+
+Files use the export columns (``export.COLUMNS``), so archived rows read
+back in the same shape the export writes. Reads go through memory-mapped
+files in record batches, only open the months and product files a request
+covers, and skip row groups whose statistics rule out the provider or time
+window. A row is either in the
+database or in the archive, never both, so readers merge the two without
+deduplicating. Writing a month that already has a file merges into it, so
+an interrupted run can simply be repeated.
+
+Daily rollups are unaffected, so long-range charts do not need the archive.
+"""
+import heapq
+import os
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .export import COLUMNS, TIMESTAMP_INDEX, parquet_schema, sort_key
+from .partitioning import month_start
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # the archive is optional
+    pa = pc = pq = None
+
+MONTH_RE = re.compile(r'^(\d{4})-(\d{2})$')
+FILE_RE = re.compile(r'^product-(\d+)\.parquet$')
+PROVIDER_INDEX = COLUMNS.index('provider_id')
+# Rows per row group written, and per record batch held in memory while reading
+ROW_GROUP_ROWS = 10000
+BATCH_ROWS = 2048
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def available():
+    return pq is not None
+
+
+def root():
+    return settings.PRICE_ARCHIVE_DIR
+
+
+def month_path(product_id, month):
+    return os.path.join(root(), f'{month:%Y-%m}', f'product-{product_id}.parquet')
+
+
+def _months():
+    """(month start, directory) for every archived month, oldest first"""
+    if not available() or not os.path.isdir(root()):
+        return []
+    months = []
+    for name in os.listdir(root()):
+        match = MONTH_RE.match(name)
+        if match:
+            start = datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)
+            months.append((start, os.path.join(root(), name)))
+    return sorted(months)
+
+
+def _files(product_id=None, since=None, newest_first=False):
+    """Yield (month start, [paths]) for archived months that can hold rows from ``since`` on"""
+    months = _months()
+    if newest_first:
+        months.reverse()
+    for start, directory in months:
+        if since is not None and month_start(start, 1) <= since:
+            continue
+        if product_id is not None:
+            path = os.path.join(directory, f'product-{product_id}.parquet')
+            paths = [path] if os.path.exists(path) else []
+        else:
+            paths = sorted(
+                os.path.join(directory, name) for name in os.listdir(directory) if FILE_RE.match(name)
+            )
+        if paths:
+            yield start, paths
+
+
+def _row_groups(metadata, provider_ids=None, since=None):
+    """Indexes of the row groups whose statistics allow rows matching the filters"""
+    groups = []
+    for index in range(metadata.num_row_groups):
+        group = metadata.row_group(index)
+        providers = group.column(PROVIDER_INDEX).statistics
+        timestamps = group.column(TIMESTAMP_INDEX).statistics
+        if provider_ids and providers is not None and providers.has_min_max and not any(
+            providers.min <= provider_id <= providers.max for provider_id in provider_ids
+        ):
+            continue
+        if since is not None and timestamps is not None and timestamps.has_min_max and timestamps.max < since:
+            continue
+        groups.append(index)
+    return groups
+
+
+def _file_rows(path, provider_ids=None, since=None):
+    """A file's matching rows in COLUMNS order, sorted by (timestamp, id) as written.
+
+    Only row groups that can match are read, one record batch at a time;
+    a file with none is closed without reading any data.
+    """
+    with pq.ParquetFile(path, memory_map=True) as parquet_file:
+        groups = _row_groups(parquet_file.metadata, provider_ids, since)
+        if not groups:
+            return
+        for batch in parquet_file.iter_batches(batch_size=BATCH_ROWS, row_groups=groups, columns=COLUMNS):
+            if provider_ids:
+                batch = batch.filter(pc.is_in(batch.column('provider_id'), value_set=pa.array(provider_ids)))
+            if since is not None:
+                batch = batch.filter(pc.greater_equal(batch.column('timestamp'), pa.scalar(since)))
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+
+
+def read_rows(product_id=None, provider_ids=None, since=None):
+    """Archived rows from ``since`` on, in COLUMNS order and sorted by (timestamp, id).
+
+    Months are read one after the other. Within a month only the product's
+    own file is opened when ``product_id`` is given; otherwise the product
+    files are merged, holding one record batch of each file that has
+    matching row groups.
+    """
+    for _, paths in _files(product_id, since):
+        yield from heapq.merge(*(_file_rows(path, provider_ids, since) for path in paths), key=sort_key)
+
+
+def latest(product_id, limit, since=None):
+    """Up to ``limit`` of a product's newest archived rows from ``since`` on, as dicts, newest first"""
+    found = []
+    for _, paths in _files(product_id, since, newest_first=True):
+        found.extend(dict(zip(COLUMNS, row)) for row in _file_rows(paths[0], since=since))
+        # Earlier months only hold older rows
+        if len(found) >= limit:
+            break
+    found.sort(key=lambda row: (row['timestamp'], row['id']), reverse=True)
+    return found[:limit]
+
+
+def archived_ids(product_id, month):
+    """Ids of the rows in a product's file for ``month``; empty when there is none"""
+    path = month_path(product_id, month)
+    if not available() or not os.path.exists(path):
+        return set()
+    return set(pq.read_table(path, columns=['id'], memory_map=True).column('id').to_pylist())
+
+
+def write_month(product_id, month, rows):
+    """Add rows (COLUMNS order) to a product's file for ``month``; returns the number added"""
+    if not available():
+        raise ArchiveError('The price archive requires pyarrow')
+    schema = parquet_schema()
+    table = pa.Table.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(zip(*rows), schema)],
+        schema=schema,
+    )
+    path = month_path(product_id, month)
+    if os.path.exists(path):
+        # Rows already archived by an interrupted run are not added twice
+        existing = pq.read_table(path, memory_map=True)
+        table = table.filter(pc.invert(pc.is_in(table.column('id'), value_set=existing.column('id'))))
+        added = table.num_rows
+        if not added:
+            return 0
+        table = pa.concat_tables([existing, table])
+    else:
+        added = table.num_rows
+    table = table.sort_by([('timestamp', 'ascending'), ('id', 'ascending')])
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f'{path}.partial'
+    pq.write_table(table, partial, compression='zstd', row_group_size=ROW_GROUP_ROWS)
+    os.replace(partial, path)
+    return added
+
+
+def month_of(row):
+    return month_start(row[TIMESTAMP_INDEX])
+
+
+def read_feed(product_id=None, provider_id=None, days=30):
+    """Archived counterpart of ``PriceQuerySet.filter_feed``; ``days`` falsy means all history"""
+    since = timezone.now() - timedelta(days=days) if days else None
+    return read_rows(product_id or None, [provider_id] if provider_id else None, since)
@@ -0,0 +1,98 @@
+"""Side-by-side provider comparison for one or many products.
+
+Latest prices come straight from ``CurrentPrice``, which already holds one
+row per (product, provider, variant), so comparing any number of products
+takes two queries: the active product/provider links and their current
+prices. Offers are ranked on ``price_base`` and reported with their native
+price as well as converted into the display currency.
+"""
+from django.db.models import F
+
+from products.models import ProductProvider
+
+from .fx import base_currency, from_base
+from .models import CurrentPrice
+
+
+def _delta(price_base, cheapest, currency):
+    if price_base is None or cheapest is None:
+        return None, None
+    delta = price_base - cheapest
+    percent = round(float(delta / cheapest * 100), 2) if cheapest else None
+    return from_base(delta, currency), percent
+
+
+def compare_products(product_ids, currency=None):
+    """Map each product id to its per-provider comparison, cheapest first"""
+    currency = currency or base_currency()
+    product_ids = list(product_ids)
+    links = (
+        ProductProvider.objects
+        .filter(product_id__in=product_ids, is_active=True, provider__is_active=True)
+        .select_related('provider')
+    )
+    offers = {}
+    for link in links:
+        offers[(link.product_id, link.provider_id)] = {
+            'provider': link.provider_id,
+            'provider_name': link.provider.name,
+            'product_url': link.product_url,
+            'price': None,
+            'currency': None,
+            'price_base': None,
+            'is_available': False,
+            'observed_at': None,
+            'variants': [],
+        }
+
+    current_prices = (
+        CurrentPrice.objects
+        .filter(product_id__in=product_ids)
+        .select_related('variant')
+        .order_by('product_id', 'provider_id', F('price_base').asc(nulls_last=True))
+    )
+    for current in current_prices:
+        offer = offers.get((current.product_id, current.provider_id))
+        if offer is None:
+            continue
+        if current.variant_id is not None:
+            offer['variants'].append({
+                'variant': current.variant_id,
+                'variant_name': current.variant.name,
+                'price': current.price,
+                'currency': current.currency,
+                'converted_price': from_base(current.price_base, currency),
+                'is_available': current.is_available,
+                'observed_at': current.observed_at,
+            })
+        # A provider's headline offer is its cheapest available row
+        if current.is_available and not offer['is_available']:
+            offer.update(
+                price=current.price, currency=current.currency, price_base=current.price_base,
+                is_available=True, observed_at=current.observed_at,
+            )
+        elif offer['price'] is None:
+            offer.update(
+                price=current.price, currency=current.currency, price_base=current.price_base,
+                observed_at=current.observed_at,
+            )
+
+    comparison = {product_id: [] for product_id in product_ids}
+    for (product_id, _), offer in offers.items():
+        comparison[product_id].append(offer)
+    for product_offers in comparison.values():
+        available = [
+            offer['price_base'] for offer in product_offers
+            if offer['is_available'] and offer['price_base'] is not None
+        ]
+        cheapest = min(available) if available else None
+        for offer in product_offers:
+            offer['converted_price'] = from_base(offer['price_base'], currency)
+            offer['delta'], offer['delta_percent'] = _delta(
+                offer['price_base'] if offer['is_available'] else None, cheapest, currency
+            )
+        product_offers.sort(key=lambda offer: (
+            not offer['is_available'], offer['price_base'] is None, offer['price_base'] or 0,
+            offer['provider_name'],
+        ))
+    return comparison
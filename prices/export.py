@@ -0,0 +1,178 @@
+"""Streaming exports of price history.
+
+Rows are read through a server-side cursor and encoded chunk by chunk,
+so memory use stays flat however many rows match. Archived history can be
+merged in as a second sorted row stream.
+"""
+import csv
+import heapq
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('product_id', 'product_id'),
+    ('product', 'product__name'),
+    ('provider_id', 'provider_id'),
+    ('provider', 'provider__name'),
+    ('variant_id', 'variant_id'),
+    ('variant', 'variant__name'),
+    ('price', 'price'),
+    ('currency', 'currency'),
+    ('price_base', 'price_base'),
+    ('is_available', 'is_available'),
+    ('timestamp', 'timestamp'),
+    ('last_seen', 'last_seen'),
+]
+COLUMNS = [name for name, _ in EXPORT_FIELDS]
+TIMESTAMP_INDEX = COLUMNS.index('timestamp')
+
+# Bytes buffered before a chunk is handed to the response
+FLUSH_BYTES = 64 * 1024
+
+
+class ExportError(Exception):
+    pass
+
+
+def export_rows(queryset, chunk_size=5000):
+    """Yield tuples in COLUMNS order using a server-side cursor"""
+    lookups = [lookup for _, lookup in EXPORT_FIELDS]
+    return queryset.order_by('timestamp', 'id').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+def sort_key(row):
+    return row[TIMESTAMP_INDEX], row[0]
+
+
+def ndjson_chunks(rows):
+    encoder = DjangoJSONEncoder()
+    buffer = []
+    size = 0
+    for row in rows:
+        line = encoder.encode(dict(zip(COLUMNS, row))) + '\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for row in rows:
+        writer.writerow([
+            value.isoformat() if hasattr(value, 'isoformat') else value for value in row
+        ])
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written so far on demand"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('product_id', pa.int64()),
+        ('product', pa.string()),
+        ('provider_id', pa.int64()),
+        ('provider', pa.string()),
+        ('variant_id', pa.int64()),
+        ('variant', pa.string()),
+        ('price', pa.decimal128(10, 2)),
+        ('currency', pa.string()),
+        ('price_base', pa.decimal128(12, 2)),
+        ('is_available', pa.bool_()),
+        ('timestamp', pa.timestamp('us', tz='UTC')),
+        ('last_seen', pa.timestamp('us', tz='UTC')),
+    ])
+
+
+def parquet_chunks(rows, row_group_size=50000):
+    """Encode rows as Parquet, emitting one row group at a time"""
+    if pq is None:
+        raise ExportError('Parquet export requires pyarrow')
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    def row_group(batch):
+        columns = list(zip(*batch))
+        return pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema,
+        )
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= row_group_size:
+            writer.write_table(row_group(batch))
+            batch = []
+            yield sink.drain()
+    if batch:
+        writer.write_table(row_group(batch))
+    writer.close()
+    yield sink.drain()
+
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson', ndjson_chunks),
+    'csv': ('text/csv', 'csv', csv_chunks),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', parquet_chunks),
+}
+
+
+def export_chunks(queryset, file_format, chunk_size=5000, archived=None):
+    """Byte chunks for ``queryset`` in the given format.
+
+    ``archived`` is an optional iterable of rows, in COLUMNS order and
+    sorted by (timestamp, id), that is merged with the database rows.
+    """
+    try:
+        encode = FORMATS[file_format][2]
+    except KeyError:
+        raise ExportError(f'Unknown export format "{file_format}"')
+    if file_format == 'parquet' and pq is None:
+        raise ExportError('Parquet export requires pyarrow')
+    rows = export_rows(queryset, chunk_size)
+    if archived is not None:
+        rows = heapq.merge(archived, rows, key=sort_key)
+    return encode(rows)
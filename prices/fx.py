@@ -0,0 +1,103 @@
+"""Currency conversion against the local FX rate table.
+
+Every price is stored with ``price_base``, its value in
+``PRICE_BASE_CURRENCY`` at ingest time, so ordering, minimums and alert
+checks compare like with like inside the database. Conversion for display
+happens on the way out, in the currency the reader asked for.
+
+The latest rate per currency is held in an in-process snapshot that is
+reloaded every ``FX_CACHE_SECONDS`` and dropped as soon as a rate is
+saved in this process.
+"""
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+CENT = Decimal('0.01')
+
+
+class UnknownCurrency(ValueError):
+    pass
+
+
+_snapshot = None
+_loaded_at = 0
+_lock = threading.Lock()
+
+
+def base_currency():
+    return settings.PRICE_BASE_CURRENCY
+
+
+def current_rates():
+    """Map currency code to the value of one unit in the base currency"""
+    global _snapshot, _loaded_at
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - _loaded_at < settings.FX_CACHE_SECONDS:
+        return snapshot
+    with _lock:
+        if _snapshot is snapshot:
+            from .models import FXRate
+            rates = {}
+            history = FXRate.objects.filter(effective_at__lte=timezone.now()).order_by('currency', '-effective_at')
+            for currency, rate in history.values_list('currency', 'rate'):
+                rates.setdefault(currency, rate)
+            rates[base_currency()] = Decimal(1)
+            _snapshot, _loaded_at = rates, time.monotonic()
+        return _snapshot
+
+
+def reset_rates():
+    """Forget the cached snapshot; the next conversion reloads it"""
+    global _snapshot
+    _snapshot = None
+
+
+def is_supported(currency):
+    return currency in current_rates()
+
+
+def rate(currency):
+    try:
+        return current_rates()[currency]
+    except KeyError:
+        raise UnknownCurrency(f'No exchange rate for "{currency}"')
+
+
+def to_base(amount, currency):
+    """Convert an amount in ``currency`` to the base currency"""
+    if amount is None:
+        return None
+    return (Decimal(amount) * rate(currency)).quantize(CENT)
+
+
+def from_base(amount, currency):
+    """Convert an amount in the base currency to ``currency``"""
+    if amount is None:
+        return None
+    return (Decimal(amount) / rate(currency)).quantize(CENT)
+
+
+def context_currency(context):
+    """Display currency for a serializer context, resolved once per response"""
+    if 'currency' not in context:
+        context['currency'] = display_currency(context.get('request'))
+    return context['currency']
+
+
+def display_currency(request):
+    """Currency to present prices in: ?currency=, then the user's preference, then the base currency"""
+    if request is None:
+        return base_currency()
+    requested = request.query_params.get('currency', '').upper()
+    if requested and is_supported(requested):
+        return requested
+    user = request.user
+    if user.is_authenticated:
+        profile = getattr(user, 'profile', None)
+        if profile is not None and is_supported(profile.preferred_currency):
+            return profile.preferred_currency
+    return base_currency()
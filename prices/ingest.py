@@ -0,0 +1,229 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from backend.caching import invalidate_models
+from products.models import Product, Provider, Variant
+from .fx import UnknownCurrency, to_base
+from .models import LOWEST_PRICE_LABEL, Price, CurrentPrice, AlertTrigger, PriceRollup, PriceScrapeLog
+from .statistics import invalidate_statistics
+
+# Models whose cached responses go stale when prices are ingested
+PRICE_MODELS = ['prices.price', 'prices.currentprice', 'prices.pricerollup']
+
+
+def process_new_prices(prices):
+    """Run the bookkeeping that follows a batch of Price inserts"""
+    prices = list(prices)
+    if not prices:
+        return
+    product_ids = {price.product_id for price in prices}
+    previous_lows = CurrentPrice.objects.lowest_by_product(product_ids)
+    CurrentPrice.objects.record(prices)
+    # Alerts fire on drops below the minimum as it stood before this batch
+    AlertTrigger.objects.record_drops(
+        prices, {product_id: lowest[0] for product_id, lowest in previous_lows.items()}
+    )
+    PriceRollup.objects.record(
+        (price.product_id, price.provider_id, price.price_base, price.timestamp)
+        for price in prices if price.is_available and price.price_base is not None
+    )
+    labels = list(PRICE_MODELS)
+    # Most batches leave every lowest price as it was; product listings keep their cache then
+    if CurrentPrice.objects.lowest_by_product(product_ids) != previous_lows:
+        labels.append(LOWEST_PRICE_LABEL)
+    transaction.on_commit(lambda: invalidate_statistics(product_ids))
+    transaction.on_commit(lambda: invalidate_models(labels))
+
+
+class PriceWriter:
+    """Validate and insert price rows in batches.
+
+    Foreign keys are checked against id sets fetched once per batch rather
+    than per row, rows are inserted with bulk_create, and rows that fail
+    validation are reported without aborting the rest of the batch.
+
+    With ``skip_unchanged`` an observation that matches the current price,
+    currency and availability for its (product, provider, variant) only
+    extends ``last_seen`` on the existing row instead of inserting a new one.
+    """
+
+    def __init__(self, batch_size=1000, scrape_log=None, skip_unchanged=None):
+        self.batch_size = batch_size
+        self.scrape_log = scrape_log
+        if skip_unchanged is None:
+            skip_unchanged = settings.PRICE_SKIP_UNCHANGED
+        self.skip_unchanged = skip_unchanged
+        self.created = 0
+        self.unchanged = 0
+        self.errors = []
+        self._pending = []
+        self._product_ids = set()
+        self._provider_ids = set()
+        self._variant_products = {}
+
+    def add(self, index, data):
+        """Queue one validated row dict; ``index`` is used for error reporting"""
+        self._pending.append((index, data))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def add_error(self, index, errors):
+        self.errors.append({'row': index, 'errors': errors})
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        self._prefetch(pending)
+
+        prices = []
+        for index, data in pending:
+            errors = self._check_relations(data)
+            currency = data.get('currency', 'USD')
+            try:
+                price_base = to_base(data['price'], currency)
+            except UnknownCurrency as exc:
+                errors['currency'] = [str(exc)]
+            if errors:
+                self.add_error(index, errors)
+                continue
+            prices.append((index, Price(
+                product_id=data['product'],
+                provider_id=data['provider'],
+                variant_id=data.get('variant'),
+                price=data['price'],
+                currency=currency,
+                price_base=price_base,
+                is_available=data.get('is_available', True),
+            )))
+        if self.skip_unchanged:
+            prices = self._drop_unchanged(prices)
+        self._insert(prices)
+
+    def close(self):
+        """Flush remaining rows and return a summary of the run"""
+        self.flush()
+        self.errors.sort(key=lambda error: error['row'])
+        return {'created': self.created, 'unchanged': self.unchanged, 'errors': self.errors}
+
+    def _prefetch(self, pending):
+        product_ids = {data['product'] for _, data in pending} - self._product_ids
+        provider_ids = {data['provider'] for _, data in pending} - self._provider_ids
+        variant_ids = {
+            data['variant'] for _, data in pending if data.get('variant') is not None
+        } - self._variant_products.keys()
+
+        if product_ids:
+            self._product_ids.update(
+                Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True)
+            )
+        if provider_ids:
+            self._provider_ids.update(
+                Provider.objects.filter(pk__in=provider_ids).values_list('pk', flat=True)
+            )
+        if variant_ids:
+            self._variant_products.update(
+                Variant.objects.filter(pk__in=variant_ids).values_list('pk', 'product_id')
+            )
+
+    def _check_relations(self, data):
+        errors = {}
+        if data['product'] not in self._product_ids:
+            errors['product'] = [f"Invalid pk \"{data['product']}\" - object does not exist."]
+        if data['provider'] not in self._provider_ids:
+            errors['provider'] = [f"Invalid pk \"{data['provider']}\" - object does not exist."]
+        variant = data.get('variant')
+        if variant is not None:
+            if variant not in self._variant_products:
+                errors['variant'] = [f'Invalid pk "{variant}" - object does not exist.']
+            elif self._variant_products[variant] != data['product']:
+                errors['variant'] = ['Variant does not belong to this product.']
+        return errors
+
+    def _drop_unchanged(self, prices):
+        """Split off observations that repeat the last known state and touch their rows"""
+        keys = {(price.product_id, price.provider_id, price.variant_id) for _, price in prices}
+        current_prices = CurrentPrice.objects.filter(
+            product_id__in={key[0] for key in keys},
+            provider_id__in={key[1] for key in keys},
+            source_price__isnull=False,
+        )
+        current = {}
+        for current_price in current_prices:
+            key = (current_price.product_id, current_price.provider_id, current_price.variant_id)
+            if key in keys:
+                current[key] = current_price
+
+        state = {
+            key: (current_price.price, current_price.currency, current_price.is_available)
+            for key, current_price in current.items()
+        }
+        now = timezone.now()
+        changed, repeats, confirmed, inserted = [], [], set(), {}
+        for index, price in prices:
+            key = (price.product_id, price.provider_id, price.variant_id)
+            observed = (price.price, price.currency, price.is_available)
+            if state.get(key) == observed:
+                repeats.append(price)
+                if key in inserted:
+                    inserted[key].last_seen = now
+                else:
+                    confirmed.add(key)
+                continue
+            state[key] = observed
+            inserted[key] = price
+            changed.append((index, price))
+
+        # Repeats are still observations as far as the rollups are concerned
+        PriceRollup.objects.record(
+            (price.product_id, price.provider_id, price.price_base, now)
+            for price in repeats if price.is_available
+        )
+
+        seen = [current[key] for key in confirmed]
+        if seen:
+            Price.objects.filter(
+                pk__in=[current_price.source_price_id for current_price in seen]
+            ).update(last_seen=now)
+            CurrentPrice.objects.filter(
+                pk__in=[current_price.pk for current_price in seen]
+            ).update(last_seen=now)
+        if repeats:
+            transaction.on_commit(lambda: invalidate_models(PRICE_MODELS))
+        self.unchanged += len(repeats)
+        self._count_scraped(len(repeats))
+        return changed
+
+    def _count_scraped(self, count):
+        if self.scrape_log is not None and count:
+            PriceScrapeLog.objects.filter(pk=self.scrape_log.pk).update(
+                prices_scraped=F('prices_scraped') + count
+            )
+
+    def _insert(self, prices):
+        if not prices:
+            return
+        try:
+            with transaction.atomic():
+                created = Price.objects.bulk_create([price for _, price in prices])
+                self._clamp_last_seen(created)
+                process_new_prices(created)
+        except IntegrityError as exc:
+            # A referenced row vanished mid-batch; report the whole batch
+            for index, _ in prices:
+                self.add_error(index, {'non_field_errors': [str(exc)]})
+            return
+
+        self.created += len(created)
+        self._count_scraped(len(created))
+
+    def _clamp_last_seen(self, created):
+        # Repeats within a batch stamp last_seen before bulk_create stamps
+        # the row's own timestamp; a row is never last seen before it was seen
+        early = [price for price in created if price.last_seen is not None and price.last_seen < price.timestamp]
+        for price in early:
+            price.last_seen = price.timestamp
+        if early:
+            Price.objects.filter(pk__in=[price.pk for price in early]).update(last_seen=F('timestamp'))
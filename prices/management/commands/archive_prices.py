@@ -0,0 +1,71 @@
+import itertools
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from backend.caching import invalidate_models
+from prices import archive
+from prices.export import export_rows
+from prices.models import CurrentPrice, Price
+from prices.statistics import invalidate_statistics
+
+
+class Command(BaseCommand):
+    help = (
+        'Move raw prices older than a cutoff into Parquet files (one per product and month) '
+        'and delete them from the database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.PRICE_ARCHIVE_DAYS)
+        parser.add_argument('--product', type=int, help='Only archive this product')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between products')
+        parser.add_argument('--keep', action='store_true', help='Write the files but leave the rows in place')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if not archive.available():
+            raise CommandError('The price archive requires pyarrow')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # As with retention, the row behind each current price stays in the
+        # database so current prices keep their source
+        candidates = Price.objects.filter(timestamp__lt=cutoff).exclude(
+            pk__in=CurrentPrice.objects.filter(source_price__isnull=False).values('source_price_id')
+        )
+        if options['product']:
+            candidates = candidates.filter(product_id=options['product'])
+        if options['dry_run']:
+            self.stdout.write(f'Prices older than {cutoff:%Y-%m-%d}: {candidates.count()} would be archived')
+            return
+
+        product_ids = list(candidates.order_by('product_id').values_list('product_id', flat=True).distinct())
+        archived = 0
+        for product_id in product_ids:
+            pks = []
+            rows = export_rows(candidates.filter(product_id=product_id))
+            for month, month_rows in itertools.groupby(rows, key=archive.month_of):
+                month_rows = list(month_rows)
+                archive.write_month(product_id, month, month_rows)
+                pks.extend(row[0] for row in month_rows)
+            if not options['keep']:
+                self.delete(pks, cutoff, options['batch_size'])
+                invalidate_statistics([product_id])
+            archived += len(pks)
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        if archived and not options['keep']:
+            invalidate_models(['prices.price'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} prices older than {cutoff:%Y-%m-%d} for {len(product_ids)} products '
+            f'to {archive.root()}'
+        ))
+
+    def delete(self, pks, cutoff, batch_size):
+        """Delete archived rows in short transactions, without per-row signals"""
+        for start in range(0, len(pks), batch_size):
+            Price.objects.filter(timestamp__lt=cutoff, pk__in=pks[start:start + batch_size]).purge()
@@ -0,0 +1,54 @@
+import json
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prices.scraping.parsers import parser_for, parse_stream
+
+FIXTURES_DIR = Path(__file__).resolve().parents[2] / 'scraping' / 'fixtures'
+
+
+class Command(BaseCommand):
+    help = 'Check and time the price parsers against saved fixture pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixtures', default=str(FIXTURES_DIR), help='Directory holding manifest.json and pages')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--chunk-size', type=int, default=16384, help='Characters fed to the parser per chunk')
+
+    def handle(self, *args, **options):
+        fixtures = Path(options['fixtures'])
+        try:
+            manifest = json.loads((fixtures / 'manifest.json').read_text())
+        except FileNotFoundError:
+            raise CommandError(f'No manifest.json in {fixtures}')
+
+        failures = 0
+        for case in manifest:
+            html = (fixtures / case['page']).read_text()
+            size = options['chunk_size']
+            chunks = [html[i:i + size] for i in range(0, len(html), size)]
+
+            parsed = parse_stream(parser_for(case['parser'], case['config']), chunks)
+            expected = case['expected']
+            ok = parsed is not None and (
+                parsed.price == Decimal(expected['price'])
+                and parsed.currency == expected['currency']
+                and parsed.is_available == expected['is_available']
+            )
+            failures += not ok
+
+            started = time.perf_counter()
+            for _ in range(options['iterations']):
+                parse_stream(parser_for(case['parser'], case['config']), chunks)
+            per_page = (time.perf_counter() - started) / options['iterations']
+
+            status = self.style.SUCCESS('ok') if ok else self.style.ERROR(f'MISMATCH got {parsed}')
+            self.stdout.write(
+                f"{case['page']:<28} {case['parser']:<10} {per_page * 1e6:>9.1f} us/page  {status}"
+            )
+
+        if failures:
+            raise CommandError(f'{failures} fixture(s) parsed incorrectly')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from prices.fx import base_currency
+from prices.models import PriceAlert
+
+
+class Command(BaseCommand):
+    help = 'Find triggered price alerts for one user or the whole system'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only evaluate alerts for this user id')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        alerts = PriceAlert.objects.all()
+        if options['user']:
+            alerts = alerts.filter(user_id=options['user'])
+
+        triggered = 0
+        for chunk in alerts.triggered_in_chunks(options['chunk_size']):
+            triggered += len(chunk)
+            if options['verbosity'] > 1:
+                for alert in chunk:
+                    self.stdout.write(
+                        f'{alert} - target {alert.target_price} {alert.currency}, '
+                        f'current {alert.lowest_price} {base_currency()}'
+                    )
+
+        self.stdout.write(self.style.SUCCESS(f'{triggered} alerts triggered'))
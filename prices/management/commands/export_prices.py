@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prices import archive
+from prices.export import FORMATS, ExportError, export_chunks
+from prices.models import Price
+
+
+class Command(BaseCommand):
+    help = 'Stream price history to a file or stdout as NDJSON, CSV or Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='file_format', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--output', default='-', help='Output path, or - for stdout')
+        parser.add_argument('--product', type=int)
+        parser.add_argument('--provider', type=int)
+        parser.add_argument('--days', type=int, default=0, help='Only the last N days (0 for all history)')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-archive', dest='archive', action='store_false',
+            help='Leave out history that has been moved to the archive',
+        )
+
+    def handle(self, *args, **options):
+        feed = {
+            'product_id': options['product'],
+            'provider_id': options['provider'],
+            'days': options['days'],
+        }
+        queryset = Price.objects.filter_feed(**feed)
+        archived = archive.read_feed(**feed) if options['archive'] else None
+        try:
+            chunks = export_chunks(queryset, options['file_format'], options['chunk_size'], archived)
+            if options['output'] == '-':
+                for chunk in chunks:
+                    sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
+            else:
+                with open(options['output'], 'wb') as output:
+                    for chunk in chunks:
+                        output.write(chunk)
+        except ExportError as exc:
+            raise CommandError(str(exc))
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from prices import partitioning
+
+
+class Command(BaseCommand):
+    help = 'Convert the price table to monthly partitions, create upcoming ones and retire old ones (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help='Partition the existing price table')
+        parser.add_argument('--months-ahead', type=int, default=3)
+        parser.add_argument(
+            '--retain-days', type=int,
+            help='Detach partitions whose rows are all older than this many days',
+        )
+        parser.add_argument('--drop', action='store_true', help='Drop retired partitions instead of keeping them detached')
+
+    def handle(self, *args, **options):
+        if not partitioning.supported():
+            self.stdout.write('Partitioning needs PostgreSQL; the price table stays as it is')
+            return
+
+        if options['convert']:
+            if partitioning.convert():
+                self.stdout.write(self.style.SUCCESS('Converted the price table to monthly partitions'))
+            else:
+                self.stdout.write('The price table is already partitioned')
+        elif not partitioning.is_partitioned():
+            raise CommandError('The price table is not partitioned yet; run with --convert first')
+
+        created = partitioning.ensure_partitions(options['months_ahead'])
+        self.stdout.write(f'Partitions up to date through {created[-1] if created else "existing bounds"}')
+
+        if options['retain_days'] is not None:
+            before = timezone.now() - timedelta(days=options['retain_days'])
+            retired = partitioning.detach_partitions(before, drop=options['drop'])
+            action = 'Dropped' if options['drop'] else 'Detached'
+            self.stdout.write(self.style.SUCCESS(f'{action} {len(retired)} partitions: {", ".join(retired) or "none"}'))
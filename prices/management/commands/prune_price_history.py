@@ -0,0 +1,142 @@
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from backend.caching import invalidate_models
+from prices import archive, partitioning
+from prices.models import CurrentPrice, Price, PriceRollup, PriceScrapeLog
+from prices.statistics import invalidate_statistics
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete raw prices, hourly rollups and scrape logs past their retention period, '
+        'in small batches; daily rollups are kept'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--price-days', type=int, default=settings.PRICE_RETENTION_DAYS)
+        parser.add_argument('--hourly-rollup-days', type=int, default=settings.PRICE_HOURLY_ROLLUP_RETENTION_DAYS)
+        parser.add_argument('--scrape-log-days', type=int, default=settings.SCRAPE_LOG_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches')
+        parser.add_argument(
+            '--rollup', action='store_true',
+            help='Rebuild the rollups of the days being pruned first (for history recorded before rollups existed)',
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        self.batch_size = options['batch_size']
+        self.pause = options['sleep']
+        self.dry_run = options['dry_run']
+
+        price_cutoff = now - timedelta(days=options['price_days'])
+        deleted = self.prune_prices(price_cutoff, options['rollup'])
+        self.stdout.write(f'Prices older than {price_cutoff:%Y-%m-%d}: {deleted} removed')
+
+        rollup_cutoff = now - timedelta(days=options['hourly_rollup_days'])
+        deleted = self.prune(
+            PriceRollup.objects.filter(resolution=PriceRollup.HOUR, bucket_start__lt=rollup_cutoff)
+        )
+        self.stdout.write(f'Hourly rollups older than {rollup_cutoff:%Y-%m-%d}: {deleted} removed')
+
+        log_cutoff = now - timedelta(days=options['scrape_log_days'])
+        deleted = self.prune(PriceScrapeLog.objects.filter(started_at__lt=log_cutoff))
+        self.stdout.write(f'Scrape logs older than {log_cutoff:%Y-%m-%d}: {deleted} removed')
+
+        if not self.dry_run:
+            invalidate_models(['prices.price', 'prices.pricerollup', 'prices.pricescrapelog'])
+        self.stdout.write(self.style.SUCCESS('Retention run complete'))
+
+    def prune_prices(self, cutoff, rollup):
+        # The row behind each current price stays, so current prices keep
+        # their source and change detection keeps working
+        candidates = Price.objects.filter(timestamp__lt=cutoff).exclude(
+            pk__in=CurrentPrice.objects.filter(source_price__isnull=False).values('source_price_id')
+        )
+        if self.dry_run:
+            return candidates.count()
+        if rollup:
+            # Replacing the buckets rather than adding to them keeps reruns harmless
+            PriceRollup.objects.rebuild(until=cutoff, batch_size=self.batch_size)
+
+        removed = 0
+        if partitioning.is_partitioned():
+            # Whole months go with a catalog operation once they are in the
+            # archive; anything else is deleted in batches below
+            retiring = {}
+
+            def retire(name, lower, upper):
+                rows = candidates.filter(timestamp__lt=upper)
+                if lower is not None:
+                    rows = rows.filter(timestamp__gte=lower)
+                if not self.is_archived(rows):
+                    self.stdout.write(f'Partition {name} is not fully archived; deleting its rows in batches')
+                    return False
+                retiring[name] = (rows.count(), set(rows.values_list('product_id', flat=True).distinct()))
+                return True
+
+            for name in partitioning.detach_partitions(cutoff, drop=True, retire=retire):
+                count, product_ids = retiring[name]
+                invalidate_statistics(product_ids)
+                removed += count
+                self.stdout.write(f'Dropped partition {name}')
+
+        last_pk = 0
+        while True:
+            batch = list(
+                candidates.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'product_id')[:self.batch_size]
+            )
+            if not batch:
+                return removed
+            last_pk = batch[-1][0]
+            Price.objects.filter(timestamp__lt=cutoff, pk__in=[pk for pk, _ in batch]).purge()
+            invalidate_statistics({product_id for _, product_id in batch})
+            removed += len(batch)
+            self._pause()
+
+    def is_archived(self, rows):
+        """Whether every row in ``rows`` is in its product's archive file for the month.
+
+        A file existing is not enough: rows added to a month after it was
+        archived would be lost with the partition.
+        """
+        months = rows.annotate(
+            month=TruncMonth('timestamp', tzinfo=dt_timezone.utc)
+        ).values_list('product_id', 'month').distinct().order_by()
+        for product_id, month in months:
+            stored = set(
+                rows.filter(
+                    product_id=product_id, timestamp__gte=month, timestamp__lt=partitioning.month_start(month, 1),
+                ).values_list('pk', flat=True)
+            )
+            if not stored <= archive.archived_ids(product_id, month):
+                return False
+        return True
+
+    def prune(self, queryset):
+        """Delete ``queryset`` in primary-key batches, each in its own short transaction.
+
+        Rows are deleted without loading them; nothing else references
+        these tables, and per-row delete signals would only invalidate the
+        same caches once per row.
+        """
+        if self.dry_run:
+            return queryset.count()
+        removed = 0
+        while True:
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:self.batch_size])
+            if not pks:
+                return removed
+            removed += queryset.model.objects.filter(pk__in=pks)._raw_delete(queryset.db)
+            self._pause()
+
+    def _pause(self):
+        if self.pause:
+            time.sleep(self.pause)
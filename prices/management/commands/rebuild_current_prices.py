@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from backend.caching import invalidate_models
+from prices.models import LOWEST_PRICE_LABEL, Price, CurrentPrice
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the current price table from the full price history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, help='Only rebuild rows for this product id')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        history = Price.objects.order_by('product_id', 'provider_id', 'variant_id', '-timestamp', '-id')
+        current_prices = CurrentPrice.objects.all()
+        if options['product']:
+            history = history.filter(product_id=options['product'])
+            current_prices = current_prices.filter(product_id=options['product'])
+
+        # PostgreSQL hands back one row per key; elsewhere we skip older rows
+        # while streaming through the same ordering.
+        if connection.features.can_distinct_on_fields:
+            history = history.distinct('product_id', 'provider_id', 'variant_id')
+
+        created = 0
+        with transaction.atomic():
+            current_prices.delete()
+            batch, last_key = [], None
+            for price in history.iterator(chunk_size=batch_size):
+                key = (price.product_id, price.provider_id, price.variant_id)
+                if key == last_key:
+                    continue
+                last_key = key
+                batch.append(CurrentPrice(
+                    product_id=price.product_id,
+                    provider_id=price.provider_id,
+                    variant_id=price.variant_id,
+                    source_price=price,
+                    price=price.price,
+                    currency=price.currency,
+                    price_base=price.price_base,
+                    is_available=price.is_available,
+                    observed_at=price.timestamp,
+                    last_seen=price.last_seen,
+                ))
+                if len(batch) >= batch_size:
+                    CurrentPrice.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            CurrentPrice.objects.bulk_create(batch)
+            created += len(batch)
+
+        invalidate_models(['prices.currentprice', LOWEST_PRICE_LABEL])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} current prices'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from backend.caching import invalidate_models
+from prices.models import PriceRollup
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild hourly and daily price rollups from the stored price history; '
+        'days whose raw prices were pruned keep their rollups'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, help='Only rebuild rollups for this product id')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        processed = PriceRollup.objects.rebuild(product_id=options['product'], batch_size=options['batch_size'])
+        invalidate_models(['prices.pricerollup'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {processed} prices'))
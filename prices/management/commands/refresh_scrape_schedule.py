@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from prices.scraping.scheduler import ScrapeScheduler
+
+
+class Command(BaseCommand):
+    help = 'Create missing scrape schedules and recompute intervals from volatility, watchers and failures'
+
+    def handle(self, *args, **options):
+        created, updated = ScrapeScheduler().refresh()
+        self.stdout.write(self.style.SUCCESS(f'Created {created} and updated {updated} scrape schedules'))
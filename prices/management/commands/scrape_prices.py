@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from prices.scraping.engine import ScrapeEngine, active_targets
+from prices.scraping.scheduler import ScrapeScheduler
+
+
+class Command(BaseCommand):
+    help = 'Scrape prices for active product/provider links'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', type=int, action='append', help='Limit to this provider id (repeatable)')
+        parser.add_argument('--product', type=int, action='append', help='Limit to this product id (repeatable)')
+        parser.add_argument('--due', action='store_true', help='Only scrape links the scheduler says are due')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Links claimed per batch with --due')
+        parser.add_argument('--concurrency', type=int, help='Total requests in flight')
+        parser.add_argument('--per-provider', type=int, help='Requests in flight per provider')
+        parser.add_argument('--delay', type=float, help='Seconds between request starts per provider')
+        parser.add_argument('--timeout', type=float, help='Per-request timeout in seconds')
+
+    def handle(self, *args, **options):
+        engine = ScrapeEngine(
+            concurrency=options['concurrency'],
+            per_provider=options['per_provider'],
+            delay=options['delay'],
+            timeout=options['timeout'],
+        )
+        if options['due']:
+            self._scrape_due(engine, options['batch_size'])
+            return
+
+        targets = active_targets(options['provider'], options['product'])
+        logs = engine.run(targets)
+        for log in logs.values():
+            self.stdout.write(f'{log} - {log.prices_scraped} prices')
+        self.stdout.write(self.style.SUCCESS(f'Scraped {len(targets)} pages across {len(logs)} providers'))
+
+    def _scrape_due(self, engine, batch_size):
+        scheduler = ScrapeScheduler()
+        scraped = 0
+        while True:
+            targets = scheduler.claim(batch_size)
+            if not targets:
+                break
+            engine.run(targets)
+            scheduler.complete(engine.outcomes)
+            scraped += len(targets)
+            self.stdout.write(f'Scraped batch of {len(targets)} pages')
+        self.stdout.write(self.style.SUCCESS(f'Scraped {scraped} due pages'))
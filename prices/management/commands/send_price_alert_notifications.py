@@ -0,0 +1,46 @@
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from prices.models import AlertTrigger
+
+
+class Command(BaseCommand):
+    help = 'Email users about price alert triggers that have not been sent yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        sent = 0
+        while True:
+            batch = list(
+                AlertTrigger.objects.pending().select_related(
+                    'alert__product', 'alert__user__profile'
+                ).order_by('created_at')[:options['batch_size']]
+            )
+            if not batch:
+                break
+
+            for trigger in batch:
+                user = trigger.alert.user
+                profile = getattr(user, 'profile', None)
+                if profile is not None and not profile.email_notifications:
+                    continue
+                send_mail(
+                    subject=f'Price alert: {trigger.alert.product.name}',
+                    message=(
+                        f'{trigger.alert.product.name} is now {trigger.triggered_price} {trigger.alert.currency}, '
+                        f'at or below your target of {trigger.alert.target_price} {trigger.alert.currency}.'
+                    ),
+                    from_email=None,
+                    recipient_list=[user.email],
+                    fail_silently=True,
+                )
+                sent += 1
+
+            AlertTrigger.objects.filter(
+                pk__in=[trigger.pk for trigger in batch]
+            ).update(notified_at=timezone.now())
+
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent} price alert notifications'))
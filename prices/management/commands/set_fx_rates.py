@@ -0,0 +1,52 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from backend.caching import invalidate_models
+from prices import fx
+from prices.models import LOWEST_PRICE_LABEL, CurrentPrice, FXRate, PriceAlert
+
+
+class Command(BaseCommand):
+    help = 'Record exchange rates (value of one unit in the base currency), e.g. EUR=1.08 GBP=1.27'
+
+    def add_arguments(self, parser):
+        parser.add_argument('rates', nargs='+', metavar='CUR=RATE')
+        parser.add_argument(
+            '--reprice', action='store_true',
+            help='Also re-normalise current prices and alert targets at the new rates',
+        )
+
+    def handle(self, *args, **options):
+        rates = {}
+        for pair in options['rates']:
+            currency, _, value = pair.partition('=')
+            try:
+                rate = Decimal(value)
+            except InvalidOperation:
+                raise CommandError(f'Invalid rate "{pair}"')
+            if len(currency) != 3 or rate <= 0:
+                raise CommandError(f'Invalid rate "{pair}"')
+            rates[currency.upper()] = rate
+
+        now = timezone.now()
+        with transaction.atomic():
+            FXRate.objects.bulk_create([
+                FXRate(currency=currency, rate=rate, effective_at=now) for currency, rate in rates.items()
+            ])
+            if options['reprice']:
+                # Stored price history keeps the rate it was ingested at
+                for currency, rate in rates.items():
+                    CurrentPrice.objects.filter(currency=currency).update(price_base=F('price') * rate)
+                    PriceAlert.objects.filter(currency=currency).update(
+                        target_price_base=F('target_price') * rate
+                    )
+        fx.reset_rates()
+        labels = ['prices.fxrate']
+        if options['reprice']:
+            labels += ['prices.currentprice', LOWEST_PRICE_LABEL, 'prices.pricealert']
+        invalidate_models(labels)
+        self.stdout.write(self.style.SUCCESS(f'Recorded {len(rates)} exchange rates'))
@@ -1,6 +1,53 @@
-from django.db import models
-from django.contrib.auth.models import User
-from products.models import Product, Provider, Variant
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+from products.models import Product, Provider, Variant, ProductProvider
+
+
+class FXRate(models.Model):
+    """Value of one unit of ``currency`` in PRICE_BASE_CURRENCY from ``effective_at`` on"""
+    currency = models.CharField(max_length=3)
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    effective_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['currency', '-effective_at']
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'effective_at'], name='unique_fx_rate_per_instant'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} = {self.rate} {settings.PRICE_BASE_CURRENCY}"
+
+
+class PriceQuerySet(models.QuerySet):
+    def filter_feed(self, product_id=None, provider_id=None, days=30):
+        """Filters shared by the price feed and exports; ``days`` falsy means all history"""
+        queryset = self
+        if product_id:
+            queryset = queryset.filter(product_id=product_id)
+        if provider_id:
+            queryset = queryset.filter(provider_id=provider_id)
+        if days:
+            queryset = queryset.filter(timestamp__gte=timezone.now() - timedelta(days=int(days)))
+        return queryset
+
+    def purge(self):
+        """Delete these prices in one statement; returns the number deleted.
+
+        QuerySet.delete() would load every row to null the alert triggers and
+        current prices pointing at it, and send a delete signal per row. The
+        links are cleared in bulk here instead, and callers invalidate
+        caches once per batch.
+        """
+        pks = self.values('pk')
+        with transaction.atomic(using=self.db):
+            AlertTrigger.objects.filter(price__in=pks).update(price=None)
+            CurrentPrice.objects.filter(source_price__in=pks).update(source_price=None)
+            return self._raw_delete(self.db)
 
 
 class Price(models.Model):
@@ -9,56 +56,549 @@ class Price(models.Model):
     variant = models.ForeignKey(Variant, on_delete=models.SET_NULL, null=True, blank=True, related_name='prices')
     price = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, default='USD')
+    # ``price`` in PRICE_BASE_CURRENCY at the rate current when it was stored
+    price_base = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     is_available = models.BooleanField(default=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Unchanged observations set this instead of adding a row, so each row
+    # covers [timestamp, next row's timestamp) in the price history; null
+    # until the observation is first repeated
+    last_seen = models.DateTimeField(null=True, blank=True)
+
+    objects = PriceQuerySet.as_manager()
 
     class Meta:
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['product', '-timestamp']),
             models.Index(fields=['provider', '-timestamp']),
+            models.Index(fields=['-timestamp', '-id'], name='price_feed_cursor_idx'),
         ]
 
     def __str__(self):
         return f"{self.product.name} - {self.provider.name}: {self.currency} {self.price}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What price_base was computed from, to tell whether a save changes it
+        instance._stored_amount = {
+            name: value for name, value in zip(field_names, values) if name in ('price', 'currency')
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        # price_base keeps the rate it was stored at unless the amount changes
+        stored = getattr(self, '_stored_amount', {})
+        if self.price_base is None or any(getattr(self, name) != value for name, value in stored.items()):
+            from .fx import UnknownCurrency, to_base
+            try:
+                self.price_base = to_base(self.price, self.currency)
+            except UnknownCurrency:
+                self.price_base = None
+        super().save(*args, **kwargs)
+        self._stored_amount = {'price': self.price, 'currency': self.currency}
+
     @property
     def formatted_price(self):
         return f"{self.currency} {self.price}"
 
 
+# Response cache label (see backend.caching) for each product's lowest current
+# price, its provider and time; bumped only when one of those changes
+LOWEST_PRICE_LABEL = 'prices.lowestprice'
+
+
+class CurrentPriceManager(models.Manager):
+    def record(self, prices):
+        """Fold newly stored Price rows into the current price table"""
+        latest = {}
+        for price in prices:
+            key = (price.product_id, price.provider_id, price.variant_id)
+            seen = latest.get(key)
+            if seen is None or (price.timestamp, price.pk) > (seen.timestamp, seen.pk):
+                latest[key] = price
+        if not latest:
+            return
+
+        with transaction.atomic():
+            candidates = self.select_for_update().filter(
+                product_id__in={key[0] for key in latest},
+                provider_id__in={key[1] for key in latest},
+            )
+            existing = {
+                (current.product_id, current.provider_id, current.variant_id): current
+                for current in candidates
+            }
+
+            to_create, to_update = [], []
+            for key, price in latest.items():
+                current = existing.get(key)
+                if current is None:
+                    current = self.model(
+                        product_id=price.product_id,
+                        provider_id=price.provider_id,
+                        variant_id=price.variant_id,
+                    )
+                    to_create.append(current)
+                elif current.observed_at > price.timestamp:
+                    continue
+                else:
+                    to_update.append(current)
+                self._copy(current, price)
+
+            # A concurrent writer may have created some of the same keys
+            # first; those inserts are skipped and the rows re-read below
+            self.bulk_create(to_create, ignore_conflicts=True)
+            if to_create:
+                to_update.extend(self._newer_than_stored(
+                    {(current.product_id, current.provider_id, current.variant_id): current for current in to_create}
+                ))
+            self.bulk_update(to_update, self.RECORDED_FIELDS)
+
+    RECORDED_FIELDS = [
+        'source_price', 'price', 'currency', 'price_base', 'is_available', 'observed_at', 'last_seen',
+    ]
+
+    @staticmethod
+    def _copy(current, price):
+        current.source_price = price
+        current.price = price.price
+        current.currency = price.currency
+        current.price_base = price.price_base
+        current.is_available = price.is_available
+        current.observed_at = price.timestamp
+        current.last_seen = price.last_seen
+
+    def _newer_than_stored(self, pending):
+        """Stored rows that lost an insert race to ``pending`` but are older, updated to ours"""
+        stale = []
+        stored = self.select_for_update().filter(
+            product_id__in={key[0] for key in pending},
+            provider_id__in={key[1] for key in pending},
+        )
+        for current in stored:
+            ours = pending.get((current.product_id, current.provider_id, current.variant_id))
+            if ours is None or current.source_price_id == ours.source_price_id:
+                continue  # not ours to decide, or our own insert
+            if (current.observed_at, current.source_price_id or 0) < (ours.observed_at, ours.source_price_id):
+                self._copy(current, ours.source_price)
+                stale.append(current)
+        return stale
+
+    def lowest_by_product(self, product_ids):
+        """Map product id to (price_base, provider id, observed_at) of its lowest available current price.
+
+        Ties go to the latest observation, as in ProductQuerySet.with_lowest_price.
+        """
+        rows = self.filter(
+            product_id__in=product_ids,
+            is_available=True,
+            price_base__isnull=False,
+        ).order_by('product_id', 'price_base', '-observed_at').values_list(
+            'product_id', 'price_base', 'provider_id', 'observed_at',
+        )
+        lowest = {}
+        for product_id, *record in rows:
+            lowest.setdefault(product_id, tuple(record))
+        return lowest
+
+    def lowest_for(self, product):
+        """Get the cheapest available current price for a product"""
+        return self.filter(
+            product=product,
+            is_available=True,
+            price_base__isnull=False,
+        ).select_related('provider').order_by('price_base', '-observed_at').first()
+
+
+class CurrentPrice(models.Model):
+    """Latest observed price per product, provider and variant"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='current_prices')
+    provider = models.ForeignKey(Provider, on_delete=models.CASCADE, related_name='current_prices')
+    variant = models.ForeignKey(Variant, on_delete=models.CASCADE, null=True, blank=True, related_name='current_prices')
+    # Not enforced in the database so that Price can be partitioned (see prices.partitioning)
+    source_price = models.ForeignKey(
+        Price, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_constraint=False,
+    )
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default='USD')
+    price_base = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    is_available = models.BooleanField(default=True)
+    observed_at = models.DateTimeField()
+    last_seen = models.DateTimeField(null=True, blank=True)
+
+    objects = CurrentPriceManager()
+
+    class Meta:
+        ordering = ['price_base']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'provider', 'variant'],
+                condition=Q(variant__isnull=False),
+                name='unique_current_price_per_variant',
+            ),
+            models.UniqueConstraint(
+                fields=['product', 'provider'],
+                condition=Q(variant__isnull=True),
+                name='unique_current_price_without_variant',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'is_available', 'price_base']),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} - {self.provider.name}: {self.currency} {self.price}"
+
+
+class PriceAlertQuerySet(models.QuerySet):
+    def with_current_price(self):
+        """Annotate each alert with its product's lowest available current price in the base currency"""
+        lowest = CurrentPrice.objects.filter(
+            product=OuterRef('product'),
+            is_available=True,
+            price_base__isnull=False,
+        ).order_by('price_base')
+        return self.annotate(lowest_price=Subquery(lowest.values('price_base')[:1]))
+
+    def triggered(self):
+        """Active alerts whose target price is met, evaluated in a single query"""
+        return self.with_current_price().filter(
+            is_active=True,
+            target_price_base__isnull=False,
+            lowest_price__lte=F('target_price_base'),
+        )
+
+    def triggered_in_chunks(self, chunk_size=1000):
+        """Yield lists of triggered alerts, walking the alerts in primary key order"""
+        candidates = self.filter(is_active=True, target_price_base__isnull=False).order_by('pk')
+        last_pk = 0
+        while True:
+            chunk_pks = list(candidates.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+            if not chunk_pks:
+                return
+            last_pk = chunk_pks[-1]
+            yield list(self.filter(pk__in=chunk_pks).triggered().select_related('product'))
+
+
 class PriceAlert(models.Model):
     """User watchlist for price alerts"""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='price_alerts')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='price_alerts')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_alerts')
     target_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Currency target_price is expressed in, and the target in the base currency
+    currency = models.CharField(max_length=3, default='USD')
+    target_price_base = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PriceAlertQuerySet.as_manager()
+
     class Meta:
         unique_together = ['user', 'product']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', 'is_active', 'target_price_base']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
 
+    def save(self, *args, **kwargs):
+        from .fx import UnknownCurrency, to_base
+        try:
+            self.target_price_base = to_base(self.target_price, self.currency)
+        except UnknownCurrency:
+            self.target_price_base = None
+        super().save(*args, **kwargs)
+
     @property
     def current_lowest_price(self):
-        """Get current lowest price for the product"""
-        latest_price = Price.objects.filter(
-            product=self.product,
-            is_available=True
-        ).order_by('price').first()
-        return latest_price.price if latest_price else None
+        """Get current lowest price for the product in the base currency"""
+        if hasattr(self, 'lowest_price'):
+            return self.lowest_price
+        lowest = CurrentPrice.objects.lowest_for(self.product_id)
+        return lowest.price_base if lowest else None
 
     @property
     def alert_triggered(self):
         """Check if current price meets the target"""
-        if not self.target_price:
+        if self.target_price_base is None:
             return False
         current_price = self.current_lowest_price
-        return current_price and current_price <= self.target_price
+        return current_price is not None and current_price <= self.target_price_base
+
+
+class AlertTriggerManager(models.Manager):
+    # Products per alert lookup query; keeps the OR chain within index-friendly sizes
+    LOOKUP_CHUNK_SIZE = 500
+
+    def record_drops(self, prices, previous_lows):
+        """Record triggers for alerts hit by prices that undercut their product's minimum"""
+        drops = {}
+        for price in prices:
+            if not price.is_available or price.price_base is None:
+                continue
+            previous = previous_lows.get(price.product_id)
+            if previous is not None and price.price_base >= previous:
+                continue
+            best = drops.get(price.product_id)
+            if best is None or price.price_base < best.price_base:
+                drops[price.product_id] = price
+        if not drops:
+            return []
+
+        triggers = []
+        drop_list = list(drops.values())
+        for start in range(0, len(drop_list), self.LOOKUP_CHUNK_SIZE):
+            chunk = drop_list[start:start + self.LOOKUP_CHUNK_SIZE]
+            condition = Q()
+            for price in chunk:
+                condition |= Q(product_id=price.product_id, target_price_base__gte=price.price_base)
+            alerts = PriceAlert.objects.filter(condition, is_active=True).exclude(
+                user__profile__price_alert_notifications=False
+            ).only('id', 'product_id', 'currency')
+            for alert in alerts:
+                price = drops[alert.product_id]
+                triggers.append(self.model(
+                    alert=alert, price=price, triggered_price=self._in_alert_currency(price, alert),
+                ))
+
+        return self.bulk_create(triggers, ignore_conflicts=True)
+
+    def _in_alert_currency(self, price, alert):
+        from .fx import UnknownCurrency, from_base
+        if price.currency == alert.currency:
+            return price.price
+        try:
+            return from_base(price.price_base, alert.currency)
+        except UnknownCurrency:
+            return price.price
+
+    def pending(self):
+        return self.filter(notified_at__isnull=True)
+
+
+class AlertTrigger(models.Model):
+    """A price observation that met a price alert's target"""
+    alert = models.ForeignKey(PriceAlert, on_delete=models.CASCADE, related_name='triggers')
+    price = models.ForeignKey(
+        Price, on_delete=models.SET_NULL, null=True, blank=True, related_name='alert_triggers', db_constraint=False,
+    )
+    # In the alert's currency
+    triggered_price = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    objects = AlertTriggerManager()
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['alert', 'price'], name='unique_alert_trigger_per_price'),
+        ]
+        indexes = [
+            models.Index(fields=['notified_at', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.alert} at {self.triggered_price}"
+
+
+class PriceRollupManager(models.Manager):
+    def rebuild(self, product_id=None, until=None, batch_size=5000):
+        """Recompute rollups from the stored price history; returns the number of prices rolled up.
+
+        Retention deletes old prices but keeps their daily rollups, and keeps
+        the rows behind current prices however old. So only whole days from
+        the first day of the remaining history through ``until`` (default
+        now) are replaced; that first day is skipped when its rollup starts
+        before the history does. Repeated observations folded into
+        last_seen are not in the history, so rebuilt buckets count each
+        stored change once.
+        """
+        prices = Price.objects.all()
+        rollups = self.all()
+        if product_id:
+            prices = prices.filter(product_id=product_id)
+            rollups = rollups.filter(product_id=product_id)
+        kept = CurrentPrice.objects.filter(source_price__isnull=False).values('source_price_id')
+        first = prices.exclude(pk__in=kept).aggregate(first=Min('timestamp'))['first']
+        if first is None:
+            return 0
+        start = PriceRollup.bucket_for(first, PriceRollup.DAY)
+        if rollups.filter(resolution=PriceRollup.DAY, bucket_start=start, open_at__lt=first).exists():
+            start += timedelta(days=1)
+        end = PriceRollup.bucket_for(until or timezone.now(), PriceRollup.DAY) + timedelta(days=1)
+
+        history = (
+            prices.filter(is_available=True, price_base__isnull=False, timestamp__gte=start, timestamp__lt=end)
+            .order_by('product_id', 'timestamp')
+            .values_list('product_id', 'provider_id', 'price_base', 'timestamp')
+        )
+        processed = 0
+        with transaction.atomic():
+            rollups.filter(bucket_start__gte=start, bucket_start__lt=end).delete()
+            batch = []
+            for row in history.iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    self.record(batch)
+                    processed += len(batch)
+                    batch = []
+            self.record(batch)
+            processed += len(batch)
+        return processed
+
+    def record(self, observations):
+        """Fold (product_id, provider_id, price, observed_at) observations into the rollups.
+
+        Every observation lands in an hourly and a daily bucket, both for its
+        provider and for the all-providers series (provider is null).
+        """
+        partials = {}
+        for product_id, provider_id, price, observed_at in observations:
+            for resolution in (PriceRollup.HOUR, PriceRollup.DAY):
+                bucket = PriceRollup.bucket_for(observed_at, resolution)
+                for provider in (provider_id, None):
+                    key = (product_id, provider, resolution, bucket)
+                    partial = partials.get(key)
+                    if partial is None:
+                        partials[key] = self.model(
+                            product_id=product_id, provider_id=provider, resolution=resolution,
+                            bucket_start=bucket, open=price, close=price, low=price, high=price,
+                            price_sum=price, count=1, open_at=observed_at, close_at=observed_at,
+                        )
+                    else:
+                        partial.merge(price, price, price, price, price, 1, observed_at, observed_at)
+        if not partials:
+            return
+
+        # A concurrent writer can create the same bucket between our read and
+        # insert; re-reading and merging again resolves the conflict
+        for attempt in range(3):
+            try:
+                with transaction.atomic():
+                    self._merge(partials)
+                return
+            except IntegrityError:
+                if attempt == 2:
+                    raise
+
+    def _merge(self, partials):
+        existing = self.select_for_update().filter(
+            product_id__in={key[0] for key in partials},
+            bucket_start__in={key[3] for key in partials},
+        )
+        rows = {
+            (row.product_id, row.provider_id, row.resolution, row.bucket_start): row
+            for row in existing
+        }
+        to_create, to_update = [], []
+        for key, partial in partials.items():
+            row = rows.get(key)
+            if row is None:
+                to_create.append(partial)
+                continue
+            row.merge(
+                partial.open, partial.close, partial.low, partial.high,
+                partial.price_sum, partial.count, partial.open_at, partial.close_at,
+            )
+            to_update.append(row)
+        self.bulk_create(to_create)
+        self.bulk_update(to_update, [
+            'open', 'close', 'low', 'high', 'price_sum', 'count', 'open_at', 'close_at'
+        ])
+
+
+class PriceRollup(models.Model):
+    """OHLC price aggregate per product (and optionally provider) per hour or day"""
+    HOUR = 'hour'
+    DAY = 'day'
+    RESOLUTION_CHOICES = [
+        (HOUR, 'Hourly'),
+        (DAY, 'Daily'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_rollups')
+    # Null for the series across all providers
+    provider = models.ForeignKey(Provider, on_delete=models.CASCADE, null=True, blank=True, related_name='price_rollups')
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    open = models.DecimalField(max_digits=10, decimal_places=2)
+    close = models.DecimalField(max_digits=10, decimal_places=2)
+    low = models.DecimalField(max_digits=10, decimal_places=2)
+    high = models.DecimalField(max_digits=10, decimal_places=2)
+    price_sum = models.DecimalField(max_digits=18, decimal_places=2)
+    count = models.PositiveIntegerField()
+    open_at = models.DateTimeField()
+    close_at = models.DateTimeField()
+
+    objects = PriceRollupManager()
+
+    class Meta:
+        ordering = ['bucket_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'provider', 'resolution', 'bucket_start'],
+                condition=Q(provider__isnull=False),
+                name='unique_price_rollup_per_provider',
+            ),
+            models.UniqueConstraint(
+                fields=['product', 'resolution', 'bucket_start'],
+                condition=Q(provider__isnull=True),
+                name='unique_price_rollup_all_providers',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'resolution', 'provider', 'bucket_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.resolution} {self.bucket_start}: {self.low}-{self.high}"
+
+    # Upper bound on the points a chart request should return
+    MAX_CHART_POINTS = 1000
+
+    @classmethod
+    def resolution_for(cls, span, requested=None):
+        """Resolution for a chart over a timedelta; None means raw rows.
+
+        The finest one that keeps the chart within MAX_CHART_POINTS, or
+        ``requested`` when that is coarser.
+        """
+        hours = span.total_seconds() / 3600
+        if hours <= 48:
+            finest = None
+        elif hours <= cls.MAX_CHART_POINTS:
+            finest = cls.HOUR
+        else:
+            finest = cls.DAY
+        order = [None, cls.HOUR, cls.DAY]
+        return max(finest, requested, key=order.index)
+
+    @staticmethod
+    def bucket_for(moment, resolution):
+        moment = moment.replace(minute=0, second=0, microsecond=0)
+        if resolution == PriceRollup.DAY:
+            moment = moment.replace(hour=0)
+        return moment
+
+    @property
+    def average(self):
+        return self.price_sum / self.count if self.count else None
+
+    def merge(self, open_, close, low, high, price_sum, count, open_at, close_at):
+        if open_at < self.open_at:
+            self.open, self.open_at = open_, open_at
+        if close_at >= self.close_at:
+            self.close, self.close_at = close, close_at
+        self.low = min(self.low, low)
+        self.high = max(self.high, high)
+        self.price_sum += price_sum
+        self.count += count
 
 
 class PriceScrapeLog(models.Model):
@@ -80,6 +620,9 @@ class PriceScrapeLog(models.Model):
 
     class Meta:
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['-started_at', '-id'], name='scrape_log_cursor_idx'),
+        ]
 
     def __str__(self):
         return f"Scrape {self.provider.name} - {self.status}"
@@ -89,4 +632,23 @@ class PriceScrapeLog(models.Model):
         """Calculate scraping duration"""
         if self.completed_at and self.started_at:
             return self.completed_at - self.started_at
-        return None
\ No newline at end of file
+        return None
+
+
+class ScrapeSchedule(models.Model):
+    """When a product/provider link is next due for scraping"""
+    product_provider = models.OneToOneField(ProductProvider, on_delete=models.CASCADE, related_name='scrape_schedule')
+    interval_seconds = models.PositiveIntegerField()
+    next_due_at = models.DateTimeField()
+    leased_until = models.DateTimeField(null=True, blank=True)
+    last_scraped_at = models.DateTimeField(null=True, blank=True)
+    consecutive_failures = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['next_due_at']
+        indexes = [
+            models.Index(fields=['next_due_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_provider} due {self.next_due_at}"
@@ -0,0 +1,154 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination keyed on (ordering field, id).
+
+    Each page seeks past the last row of the previous one instead of
+    counting an OFFSET, so deep pages cost the same as the first. NULLs
+    of a nullable ordering field sort after every value in either
+    direction. The total count is included unless the client passes
+    ``?count=false``.
+    """
+    ordering = '-id'
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering_field(request, queryset, view)
+        self.nullable = queryset.model._meta.get_field(self.field).null
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = bool(cursor and cursor.get('r'))
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, 'true').lower() not in ('0', 'false', 'no'):
+            self.count = queryset.count()
+
+        # Walking backwards flips the seek direction and the sort order,
+        # NULL placement included
+        descending = self.descending != reverse
+        nulls_last = not reverse if self.nullable else None
+        if cursor is not None:
+            queryset = queryset.filter(self._seek(cursor['v'], cursor['id'], descending, nulls_last))
+        rows = list(queryset.order_by(*self._ordering(descending, nulls_last))[:self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = bool(rows), has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.rows = rows
+        return rows
+
+    def _seek(self, value, pk, descending, nulls_last=None):
+        after_pk = Q(id__lt=pk) if descending else Q(id__gt=pk)
+        if value is None:
+            # Past a NULL come later NULLs, and every value when NULLs sort first
+            seek = Q(**{f'{self.field}__isnull': True}) & after_pk
+            return seek if nulls_last else seek | Q(**{f'{self.field}__isnull': False})
+        # The leading inclusive bound keeps the predicate index-friendly
+        if descending:
+            seek = Q(**{f'{self.field}__lte': value}) & (Q(**{f'{self.field}__lt': value}) | after_pk)
+        else:
+            seek = Q(**{f'{self.field}__gte': value}) & (Q(**{f'{self.field}__gt': value}) | after_pk)
+        return seek | Q(**{f'{self.field}__isnull': True}) if nulls_last else seek
+
+    def _ordering(self, descending, nulls_last=None):
+        sign = '-' if descending else ''
+        if nulls_last is None:
+            return [f'{sign}{self.field}', f'{sign}id']
+        nulls = {'nulls_last': True} if nulls_last else {'nulls_first': True}
+        field = F(self.field).desc(**nulls) if descending else F(self.field).asc(**nulls)
+        return [field, f'{sign}id']
+
+    def get_ordering_field(self, request, queryset, view):
+        ordering = self.ordering
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                requested = backend().get_ordering(request, queryset, view)
+                if requested:
+                    ordering = requested[0]
+                break
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request, model):
+        """The cursor in the request with its value converted for ``self.field``, or None"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            value, pk = cursor['v'], cursor['id']
+            if type(pk) is not int or not (isinstance(value, str) or value is None and self.nullable):
+                raise ValueError(encoded)
+            if value is not None:
+                cursor['v'] = model._meta.get_field(self.field).to_python(value)
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, row, reverse):
+        value = getattr(row, self.field)
+        if value is not None:
+            value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        payload = {'v': value, 'id': row.pk}
+        if reverse:
+            payload['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.rows:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.rows[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+
+class PriceCursorPagination(KeysetPagination):
+    ordering = '-timestamp'
+
+
+class ScrapeLogCursorPagination(KeysetPagination):
+    ordering = '-started_at'
@@ -0,0 +1,41 @@
+import codecs
+import csv
+import json
+
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """Parse newline-delimited JSON into a lazy sequence of row dicts"""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        return self._rows(codecs.getreader(encoding)(stream))
+
+    def _rows(self, lines):
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Hand the raw line on so it is reported as a bad row
+                # instead of failing the rows around it
+                yield line
+
+
+class CSVParser(BaseParser):
+    """Parse CSV with a header row into a lazy sequence of row dicts"""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        return self._rows(csv.DictReader(codecs.getreader(encoding)(stream)))
+
+    def _rows(self, reader):
+        for row in reader:
+            # Empty cells mean "not provided" so optional fields fall back to defaults
+            yield {key: value for key, value in row.items() if key and value not in ('', None)}
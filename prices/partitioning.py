@@ -0,0 +1,189 @@
+"""Monthly range partitioning of the price history on PostgreSQL.
+
+``convert`` swaps ``prices_price`` for a table partitioned by
+``timestamp``. The existing rows become one partition covering everything
+before next month; new rows go into monthly partitions created ahead of
+time by ``ensure_partitions``, with a default partition catching anything
+outside them. Old months are retired with ``detach_partitions``, which is
+a catalog operation rather than a DELETE; the few rows behind current
+prices are carried over into the default partition.
+
+PostgreSQL requires the partition key in every unique constraint, so the
+primary key becomes (id, timestamp) and foreign keys to Price are not
+enforced by the database. Price's own foreign keys to products, providers
+and variants are recreated on the partitioned table and so cover every
+partition. Other backends keep the plain table.
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import AlertTrigger, CurrentPrice, Price
+
+TABLE = Price._meta.db_table
+BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+class PartitioningUnsupported(Exception):
+    pass
+
+
+def supported():
+    return connection.vendor == 'postgresql'
+
+
+def _require_postgres():
+    if not supported():
+        raise PartitioningUnsupported('Price partitioning needs PostgreSQL')
+
+
+def month_start(moment, offset=0):
+    """First instant (UTC) of the month ``offset`` months after ``moment``'s"""
+    moment = moment.astimezone(dt_timezone.utc)
+    months = moment.year * 12 + moment.month - 1 + offset
+    return datetime(months // 12, months % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(start):
+    return f'{TABLE}_p{start:%Y%m}'
+
+
+def is_partitioned():
+    if not supported():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions():
+    """(name, lower bound, upper bound) for each range partition; bounds None when unbounded"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [TABLE],
+        )
+        rows = cursor.fetchall()
+    result = []
+    for name, bound in rows:
+        match = BOUND_RE.search(bound)
+        if match is None:
+            continue  # the default partition
+        lower, upper = (_parse_bound(value) for value in match.groups())
+        result.append((name, lower, upper))
+    return sorted(result, key=lambda row: row[2] or datetime.max.replace(tzinfo=dt_timezone.utc))
+
+
+def _parse_bound(value):
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return datetime.fromisoformat(value.strip("'")).astimezone(dt_timezone.utc)
+
+
+def convert():
+    """Replace the price table with a partitioned one holding the same rows"""
+    _require_postgres()
+    if is_partitioned():
+        return False
+    legacy = f'{TABLE}_legacy'
+    boundary = month_start(timezone.now(), 1)
+    with transaction.atomic(), connection.cursor() as cursor, connection.schema_editor() as editor:
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {legacy}')
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)')
+        cursor.execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id, timestamp)')
+        # Added before the old table is attached, so its matching constraints
+        # are adopted rather than duplicated and checked again
+        for field in Price._meta.concrete_fields:
+            if field.remote_field and field.db_constraint:
+                editor.execute(editor._create_fk_sql(Price, field, '_fk_%(to_table)s_%(to_column)s'))
+        # Ids come from a sequence on the parent that continues after the old
+        # rows; the old table's own identity/default goes away
+        sequence = f'{TABLE}_id_partitioned_seq'
+        cursor.execute(f'CREATE SEQUENCE {sequence} OWNED BY {TABLE}.id')
+        cursor.execute(f"SELECT setval(%s, COALESCE((SELECT MAX(id) FROM {legacy}), 0) + 1, false)", [sequence])
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        cursor.execute(f'ALTER TABLE {legacy} ALTER COLUMN id DROP IDENTITY IF EXISTS')
+        cursor.execute(f'ALTER TABLE {legacy} ALTER COLUMN id DROP DEFAULT')
+        # Foreign keys into the old table cannot follow it into a partitioned one
+        for model, field in ((CurrentPrice, 'source_price'), (AlertTrigger, 'price')):
+            for name in editor._constraint_names(model, [model._meta.get_field(field).column], foreign_key=True):
+                cursor.execute(f'ALTER TABLE {model._meta.db_table} DROP CONSTRAINT {name}')
+        # The partition takes the parent's (id, timestamp) key in place of its own
+        cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [legacy])
+        for name, in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {legacy} DROP CONSTRAINT {name}')
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO (%s)',
+            [boundary],
+        )
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+        # Creating an index on the parent adopts a matching one on the
+        # partition, so the old table's indexes are renamed, not rebuilt
+        for index in Price._meta.indexes:
+            cursor.execute(f'ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_legacy')
+            editor.add_index(Price, index)
+    return True
+
+
+def ensure_partitions(months_ahead=3):
+    """Create monthly partitions from the newest bound through ``months_ahead`` months; returns their names"""
+    _require_postgres()
+    existing = partitions()
+    start = existing[-1][2] if existing and existing[-1][2] else month_start(timezone.now())
+    end = month_start(timezone.now(), months_ahead + 1)
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        while start < end:
+            upper = month_start(start, 1)
+            name = partition_name(start)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                [start, upper],
+            )
+            created.append(name)
+            start = upper
+    return created
+
+
+def detach_partitions(before, drop=False, retire=None):
+    """Detach (or drop) partitions whose rows are all older than ``before``; returns their names.
+
+    ``retire(name, lower, upper)`` can veto a partition. Rows behind a
+    current price are moved to the default partition first, so current
+    prices keep their source; alert triggers pointing at the other rows
+    lose their link rather than dangle.
+    """
+    _require_postgres()
+    columns = ', '.join(field.column for field in Price._meta.concrete_fields)
+    sources = (
+        f'SELECT source_price_id FROM {CurrentPrice._meta.db_table} WHERE source_price_id IS NOT NULL'
+    )
+    retired = []
+    for name, lower, upper in partitions():
+        if upper is None or upper > before:
+            continue
+        if retire is not None and not retire(name, lower, upper):
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {AlertTrigger._meta.db_table} SET price_id = NULL '
+                f'WHERE price_id IN (SELECT id FROM {name} WHERE id NOT IN ({sources}))'
+            )
+            cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+            # With the partition detached its range routes to the default partition
+            cursor.execute(
+                f'INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {name} WHERE id IN ({sources})'
+            )
+            if drop:
+                cursor.execute(f'DROP TABLE {name}')
+        retired.append(name)
+    return retired
@@ -0,0 +1,250 @@
+import asyncio
+import codecs
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from products.models import Provider, ProductProvider
+from prices.ingest import PriceWriter
+from prices.models import PriceScrapeLog
+from .parsers import parser_for, parse_stream
+
+logger = logging.getLogger(__name__)
+
+# Failure messages kept per provider for PriceScrapeLog.error_message
+MAX_LOGGED_ERRORS = 5
+
+
+@dataclass(frozen=True)
+class ScrapeTarget:
+    product_id: int
+    provider_id: int
+    url: str
+
+
+@dataclass
+class ProviderRun:
+    """Per-provider counters for one engine run"""
+    log: PriceScrapeLog
+    writer: PriceWriter
+    parser: tuple = ('auto', None)
+    fetched: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+
+    def record_error(self, url, error):
+        self.failed += 1
+        if len(self.errors) < MAX_LOGGED_ERRORS:
+            self.errors.append(f'{url}: {error}')
+
+
+class ProviderThrottle:
+    """Caps in-flight requests to one provider and spaces out their start times"""
+
+    def __init__(self, concurrency, delay):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.delay = delay
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+
+def active_targets(provider_ids=None, product_ids=None):
+    """Scrape targets for every active ProductProvider with a product URL"""
+    links = ProductProvider.objects.filter(
+        is_active=True,
+        provider__is_active=True,
+        product__is_active=True,
+        product_url__isnull=False,
+    ).exclude(product_url='')
+    if provider_ids:
+        links = links.filter(provider_id__in=provider_ids)
+    if product_ids:
+        links = links.filter(product_id__in=product_ids)
+    return [
+        ScrapeTarget(product_id, provider_id, url)
+        for product_id, provider_id, url in links.values_list('product_id', 'provider_id', 'product_url')
+    ]
+
+
+class ScrapeEngine:
+    """Fetch product pages concurrently and write the parsed prices.
+
+    Requests run on a thread pool sharing one pooled ``requests.Session``,
+    orchestrated by asyncio so that per-provider concurrency limits and
+    politeness delays can be enforced without blocking other providers.
+    Pages are decoded and fed to the provider's parser as they stream in,
+    and reading stops once a price is found. Parsed prices are handed to a
+    ``PriceWriter`` per provider in batches, and every provider touched by
+    a run gets its own ``PriceScrapeLog``.
+    """
+
+    def __init__(self, concurrency=None, per_provider=None, delay=None, timeout=None,
+                 batch_size=500, parse_budget_ms=None, session=None):
+        self.concurrency = concurrency or settings.SCRAPER_CONCURRENCY
+        self.per_provider = per_provider or settings.SCRAPER_PER_PROVIDER_CONCURRENCY
+        self.delay = settings.SCRAPER_POLITENESS_DELAY if delay is None else delay
+        self.timeout = timeout or settings.SCRAPER_TIMEOUT
+        self.max_page_bytes = settings.SCRAPER_MAX_PAGE_BYTES
+        self.batch_size = batch_size
+        self.parse_budget_ms = parse_budget_ms or settings.SCRAPER_PARSE_BUDGET_MS
+        self.session = session or self.build_session()
+        # ScrapeTarget -> whether a price was extracted, for the last run
+        self.outcomes = {}
+
+    def build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['User-Agent'] = settings.SCRAPER_USER_AGENT
+        return session
+
+    def run(self, targets):
+        """Scrape ``targets`` and return the finished PriceScrapeLog per provider id"""
+        targets = list(targets)
+        self.outcomes = {}
+        if not targets:
+            return {}
+
+        parsers = {
+            pk: (strategy, config)
+            for pk, strategy, config in Provider.objects.filter(
+                pk__in={target.provider_id for target in targets}
+            ).values_list('pk', 'parser', 'parser_config')
+        }
+        runs = {}
+        for provider_id in sorted({target.provider_id for target in targets}):
+            log = PriceScrapeLog.objects.create(provider_id=provider_id, status='running')
+            runs[provider_id] = ProviderRun(
+                log=log,
+                writer=PriceWriter(batch_size=self.batch_size, scrape_log=log),
+                parser=parsers.get(provider_id, ('auto', None)),
+            )
+
+        try:
+            asyncio.run(self._run(targets, runs))
+        except Exception as exc:
+            for run in runs.values():
+                self._finish(run, error=exc)
+            raise
+
+        for run in runs.values():
+            self._finish(run)
+        return {provider_id: run.log for provider_id, run in runs.items()}
+
+    async def _run(self, targets, runs):
+        loop = asyncio.get_running_loop()
+        throttles = {
+            provider_id: ProviderThrottle(self.per_provider, self.delay) for provider_id in runs
+        }
+        in_flight = asyncio.Semaphore(self.concurrency)
+        results = asyncio.Queue()
+        write = sync_to_async(self._write, thread_sensitive=True)
+
+        async def scrape(target):
+            async with throttles[target.provider_id], in_flight:
+                try:
+                    parsed = await loop.run_in_executor(
+                        executor, self._fetch, target.url, runs[target.provider_id].parser
+                    )
+                except Exception as exc:
+                    await results.put((target, None, exc))
+                else:
+                    await results.put((target, parsed, None))
+
+        async def drain():
+            batch = []
+            for _ in range(len(targets)):
+                batch.append(await results.get())
+                if len(batch) >= self.batch_size or results.empty():
+                    await write(batch, runs)
+                    batch = []
+            if batch:
+                await write(batch, runs)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            await asyncio.gather(drain(), *(scrape(target) for target in targets))
+        await sync_to_async(self._flush, thread_sensitive=True)(runs)
+
+    def _fetch(self, url, parser):
+        parser = parser_for(*parser)
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            return parse_stream(parser, self._decode(response), self.parse_budget_ms)
+
+    def _decode(self, response):
+        """Yield decoded text chunks until the body or the page size limit runs out"""
+        try:
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        received = 0
+        for chunk in response.iter_content(chunk_size=16384):
+            received += len(chunk)
+            yield decoder.decode(chunk)
+            if received >= self.max_page_bytes:
+                return
+        yield decoder.decode(b'', final=True)
+
+    def _write(self, batch, runs):
+        close_old_connections()
+        for target, parsed, error in batch:
+            run = runs[target.provider_id]
+            self.outcomes[target] = error is None and parsed is not None
+            if error is not None:
+                run.record_error(target.url, error)
+                continue
+            if parsed is None:
+                run.record_error(target.url, 'no price found')
+                continue
+            run.fetched += 1
+            run.writer.add(run.fetched, {
+                'product': target.product_id,
+                'provider': target.provider_id,
+                'price': parsed.price,
+                'currency': parsed.currency,
+                'is_available': parsed.is_available,
+            })
+
+    def _flush(self, runs):
+        for run in runs.values():
+            run.writer.flush()
+
+    def _finish(self, run, error=None):
+        result = run.writer.close()
+        for row_error in result['errors']:
+            run.record_error(f"row {row_error['row']}", row_error['errors'])
+
+        if error is not None:
+            run.errors.insert(0, f'run aborted: {error}')
+        log = run.log
+        log.status = 'failed' if error is not None or (run.failed and not run.fetched) else 'completed'
+        log.error_message = '\n'.join(
+            [f'{run.failed} pages failed'] + run.errors
+        ) if run.errors else None
+        log.completed_at = timezone.now()
+        log.save(update_fields=['status', 'error_message', 'completed_at'])
+        log.refresh_from_db(fields=['prices_scraped'])
+        logger.info(
+            'Scraped provider %s: %s prices, %s failures', log.provider_id, run.fetched, run.failed
+        )
@@ -0,0 +1,461 @@
+"""Per-provider price extraction strategies.
+
+Parsers are fed decoded chunks of a page as they arrive and return a
+``ParsedPrice`` as soon as they have one, so the fetcher can stop reading
+the response instead of downloading and building the whole document.
+Providers pick a strategy through ``Provider.parser`` / ``parser_config``.
+"""
+import json
+import re
+import time
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from html.parser import HTMLParser
+
+from django.utils.module_loading import import_string
+
+
+@dataclass
+class ParsedPrice:
+    price: Decimal
+    currency: str = 'USD'
+    is_available: bool = True
+
+
+class ParseBudgetExceeded(Exception):
+    pass
+
+
+def to_decimal(value):
+    """Parse a scraped price such as "1,299.00", "1.299,00", "12,5" or "$ 15" into a Decimal.
+
+    The rightmost of "." and "," is the decimal separator and the other one
+    groups thousands. When only one kind appears it groups thousands if it
+    is repeated ("1,299,000") or followed by exactly three digits after a
+    non-zero integer part ("1.299").
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return Decimal(str(value))
+    cleaned = re.sub(r'[^\d.,]', '', str(value))
+    separators = [char for char in cleaned if char in '.,']
+    if separators:
+        last = separators[-1]
+        whole, _, fraction = cleaned.rpartition(last)
+        digits = re.sub(r'\D', '', whole)
+        grouping = set(separators) == {last} and (
+            len(separators) > 1 or (len(fraction) == 3 and digits.lstrip('0') != '')
+        )
+        cleaned = digits + fraction if grouping else f'{digits}.{fraction}'
+    try:
+        return Decimal(cleaned) if cleaned.strip('.') else None
+    except InvalidOperation:
+        return None
+
+
+def is_available_text(value):
+    value = str(value or '')
+    return not any(marker in value for marker in ('OutOfStock', 'SoldOut', 'Discontinued'))
+
+
+PARSERS = {}
+
+
+def register(name):
+    """Class decorator adding a parser strategy to the registry"""
+    def decorator(cls):
+        cls.name = name
+        PARSERS[name] = cls
+        return cls
+    return decorator
+
+
+def parser_for(strategy='auto', config=None):
+    """Build a parser instance for a provider's ``parser`` and ``parser_config``"""
+    config = dict(config or {})
+    if strategy == 'custom':
+        cls = import_string(config.pop('class'))
+    else:
+        try:
+            cls = PARSERS[strategy or 'auto']
+        except KeyError:
+            raise ValueError(f'Unknown price parser "{strategy}"')
+    return cls(**config)
+
+
+def parse_stream(parser, chunks, budget_ms=None):
+    """Feed text chunks to ``parser`` until it finds a price.
+
+    Only time spent inside the parser counts against ``budget_ms``, so slow
+    networks do not eat into the CPU budget of a page.
+    """
+    budget = budget_ms / 1000 if budget_ms else None
+    spent = 0.0
+    for chunk in chunks:
+        started = time.perf_counter()
+        result = parser.feed(chunk)
+        spent += time.perf_counter() - started
+        if result is not None:
+            return result
+        if budget is not None and spent > budget:
+            raise ParseBudgetExceeded(f'parse budget of {budget_ms}ms exceeded')
+    return parser.close()
+
+
+class PriceParser:
+    """Base class for incremental extraction strategies"""
+    name = None
+
+    def __init__(self, **config):
+        self.config = config
+
+    def feed(self, text):
+        """Consume the next chunk; return a ParsedPrice once one is found"""
+        raise NotImplementedError
+
+    def close(self):
+        """Called at end of document; return a late result if there is one"""
+        return None
+
+    def parse(self, html):
+        result = self.feed(html)
+        return result if result is not None else self.close()
+
+
+class _StopScan(Exception):
+    pass
+
+
+class _Scanner(HTMLParser):
+    """HTMLParser that forwards events to a parser and can be halted mid-document"""
+
+    def __init__(self, owner):
+        super().__init__(convert_charrefs=True)
+        self.owner = owner
+
+    def handle_starttag(self, tag, attrs):
+        self.owner.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.owner.start(tag, dict(attrs))
+        self.owner.end(tag)
+
+    def handle_endtag(self, tag):
+        self.owner.end(tag)
+
+    def handle_data(self, data):
+        self.owner.data(data)
+
+
+class _TagScanningParser(PriceParser):
+    """Shared plumbing for parsers driven by start/end/data events"""
+
+    def __init__(self, **config):
+        super().__init__(**config)
+        self._scanner = _Scanner(self)
+        self.result = None
+
+    def feed(self, text):
+        if self.result is not None:
+            return self.result
+        try:
+            self._scanner.feed(text)
+        except _StopScan:
+            pass
+        return self.result
+
+    def close(self):
+        if self.result is None:
+            try:
+                self._scanner.close()
+            except _StopScan:
+                pass
+            self.finish()
+        return self.result
+
+    def stop(self, result):
+        self.result = result
+        raise _StopScan
+
+    def start(self, tag, attrs):
+        pass
+
+    def end(self, tag):
+        pass
+
+    def data(self, text):
+        pass
+
+    def finish(self):
+        pass
+
+
+class Selector:
+    """A single compound selector: ``tag#id.class[attr=value]`` or ``//tag[@attr='value']``"""
+    _XPATH = re.compile(r"^//([\w*-]+)((?:\[@[\w:-]+(?:=['\"][^'\"]*['\"])?\])*)(?:/@([\w:-]+)|/text\(\))?$")
+    _XPATH_ATTR = re.compile(r"\[@([\w:-]+)(?:=['\"]([^'\"]*)['\"])?\]")
+    _CSS = re.compile(r"([#.]?)([\w:-]+)|\[([\w:-]+)(?:=['\"]?([^'\"\]]*)['\"]?)?\]")
+
+    def __init__(self, expression):
+        self.tag = None
+        self.id = None
+        self.classes = set()
+        self.attrs = []
+        self.value_attr = None
+
+        xpath = self._XPATH.match(expression.strip())
+        if xpath:
+            self.tag = None if xpath.group(1) == '*' else xpath.group(1).lower()
+            self.attrs = [(name, value) for name, value in self._XPATH_ATTR.findall(xpath.group(2))]
+            self.attrs = [(name, value if value != '' else None) for name, value in self.attrs]
+            self.value_attr = xpath.group(3)
+            return
+
+        for prefix, name, attr, value in self._CSS.findall(expression.strip()):
+            if attr:
+                self.attrs.append((attr, value or None))
+            elif prefix == '#':
+                self.id = name
+            elif prefix == '.':
+                self.classes.add(name)
+            else:
+                self.tag = name.lower()
+
+    def matches(self, tag, attrs):
+        if self.tag and tag != self.tag:
+            return False
+        if self.id and attrs.get('id') != self.id:
+            return False
+        if self.classes and not self.classes <= set((attrs.get('class') or '').split()):
+            return False
+        for name, value in self.attrs:
+            if name not in attrs or (value is not None and attrs[name] != value):
+                return False
+        return True
+
+
+@register('selector')
+class SelectorParser(_TagScanningParser):
+    """CSS/XPath selector extraction.
+
+    Config: ``price`` (selector, required), ``price_attr`` (read an attribute
+    instead of the text), ``currency`` (fixed code, default USD) and
+    ``unavailable`` (selector whose presence marks the product out of stock).
+    """
+
+    def __init__(self, price, price_attr=None, currency='USD', unavailable=None, **config):
+        super().__init__(**config)
+        self.price_selector = Selector(price)
+        self.price_attr = price_attr or self.price_selector.value_attr
+        self.currency = currency
+        self.unavailable_selector = Selector(unavailable) if unavailable else None
+        self.available = True
+        self.price = None
+        self._capture = None
+
+    def start(self, tag, attrs):
+        if self.unavailable_selector and self.unavailable_selector.matches(tag, attrs):
+            self.available = False
+            self._maybe_stop()
+        if self.price is None and self._capture is None and self.price_selector.matches(tag, attrs):
+            if self.price_attr:
+                self._set_price(attrs.get(self.price_attr))
+            else:
+                self._capture = [tag, 0, []]
+        elif self._capture is not None and tag == self._capture[0]:
+            self._capture[1] += 1
+
+    def end(self, tag):
+        if self._capture is None or tag != self._capture[0]:
+            return
+        if self._capture[1]:
+            self._capture[1] -= 1
+            return
+        text = ''.join(self._capture[2])
+        self._capture = None
+        self._set_price(text)
+
+    def data(self, text):
+        if self._capture is not None:
+            self._capture[2].append(text)
+
+    def _set_price(self, value):
+        self.price = to_decimal(value)
+        self._maybe_stop()
+
+    def _maybe_stop(self):
+        # Without an availability marker there is nothing left to look for
+        if self.price is not None and (self.unavailable_selector is None or not self.available):
+            self.stop(self._result())
+
+    def _result(self):
+        return ParsedPrice(price=self.price, currency=self.currency, is_available=self.available)
+
+    def finish(self):
+        if self.price is not None:
+            self.result = self._result()
+
+
+@register('microdata')
+class MicrodataParser(_TagScanningParser):
+    """schema.org microdata (``itemprop``) and Open Graph price meta tags.
+
+    Once a price is seen the parser reads on for ``window`` more characters
+    to pick up the currency and availability of the same offer, then stops.
+    """
+    PRICE_PROPS = {'price', 'product:price:amount', 'og:price:amount'}
+    CURRENCY_PROPS = {'pricecurrency', 'product:price:currency', 'og:price:currency'}
+
+    def __init__(self, window=2048, **config):
+        super().__init__(**config)
+        self.window = window
+        self.price = None
+        self.currency = None
+        self.available = True
+        self._availability_seen = False
+        self._remaining = None
+        self._capture = None
+
+    def feed(self, text):
+        if self.result is not None:
+            return self.result
+        if self._remaining is not None:
+            text = text[:self._remaining]
+            self._remaining -= len(text)
+        result = super().feed(text)
+        if result is None and self._remaining is not None and self._remaining <= 0:
+            self.result = self._result()
+        return self.result
+
+    def start(self, tag, attrs):
+        prop = (attrs.get('itemprop') or attrs.get('property') or '').lower()
+        if not prop:
+            return
+        value = attrs.get('content')
+        if prop == 'availability':
+            self.available = is_available_text(attrs.get('href') or value)
+            self._availability_seen = True
+            self._maybe_stop()
+        elif prop in self.PRICE_PROPS and self.price is None:
+            if value is None:
+                self._capture = ('price', tag, [])
+            else:
+                self._set('price', value)
+        elif prop in self.CURRENCY_PROPS and self.currency is None:
+            if value is None:
+                self._capture = ('currency', tag, [])
+            else:
+                self._set('currency', value)
+
+    def end(self, tag):
+        if self._capture is not None and tag == self._capture[1]:
+            name, _, parts = self._capture
+            self._capture = None
+            self._set(name, ''.join(parts))
+
+    def data(self, text):
+        if self._capture is not None:
+            self._capture[2].append(text)
+
+    def _set(self, name, value):
+        if name == 'price':
+            self.price = to_decimal(value)
+            if self.price is not None and self._remaining is None:
+                self._remaining = self.window
+        else:
+            self.currency = value.strip()[:3].upper() or None
+        self._maybe_stop()
+
+    def _maybe_stop(self):
+        if self.price is not None and self.currency is not None and self._availability_seen:
+            self.stop(self._result())
+
+    def _result(self):
+        return ParsedPrice(price=self.price, currency=self.currency or 'USD', is_available=self.available)
+
+    def finish(self):
+        if self.price is not None:
+            self.result = self._result()
+
+
+@register('jsonld')
+class JsonLdParser(PriceParser):
+    """schema.org ``Product``/``Offer`` data in JSON-LD script blocks"""
+    _BLOCK = re.compile(
+        r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+        re.IGNORECASE | re.DOTALL,
+    )
+    _OPEN = re.compile(r'<script[^>]+type=["\']application/ld\+json', re.IGNORECASE)
+
+    def __init__(self, **config):
+        super().__init__(**config)
+        self._buffer = ''
+
+    def feed(self, text):
+        self._buffer += text
+        while True:
+            match = self._BLOCK.search(self._buffer)
+            if match is None:
+                break
+            self._buffer = self._buffer[match.end():]
+            try:
+                result = offer_from_json_ld(json.loads(match.group(1)))
+            except ValueError:
+                continue
+            if result is not None:
+                return result
+        # Only keep the tail that may hold the start of an unfinished block
+        opening = self._OPEN.search(self._buffer)
+        self._buffer = self._buffer[opening.start():] if opening else self._buffer[-64:]
+        return None
+
+
+def offer_from_json_ld(data):
+    if isinstance(data, list):
+        for item in data:
+            parsed = offer_from_json_ld(item)
+            if parsed:
+                return parsed
+        return None
+    if not isinstance(data, dict):
+        return None
+    if '@graph' in data:
+        return offer_from_json_ld(data['@graph'])
+
+    offers = data.get('offers')
+    if offers is not None:
+        return offer_from_json_ld(offers)
+
+    price = to_decimal(data.get('price', data.get('lowPrice')))
+    if price is None:
+        return None
+    return ParsedPrice(
+        price=price,
+        currency=(data.get('priceCurrency') or 'USD')[:3],
+        is_available=is_available_text(data.get('availability')),
+    )
+
+
+@register('auto')
+class AutoParser(PriceParser):
+    """Default strategy: JSON-LD first, falling back to microdata and meta tags"""
+
+    def __init__(self, **config):
+        super().__init__(**config)
+        self.jsonld = JsonLdParser()
+        self.microdata = MicrodataParser(**config)
+
+    def feed(self, text):
+        result = self.jsonld.feed(text)
+        if result is None:
+            result = self.microdata.feed(text)
+        return result
+
+    def close(self):
+        return self.jsonld.close() or self.microdata.close()
+
+
+def extract_price(html, strategy='auto', config=None):
+    """Parse a complete page with the given strategy"""
+    return parser_for(strategy, config).parse(html)
@@ -0,0 +1,173 @@
+"""Adaptive scrape scheduling.
+
+Each active ProductProvider gets a ScrapeSchedule whose interval shrinks
+with observed price volatility and the number of users watching the
+product. Failed scrapes back off the next due time exponentially from that
+interval, counting the link's consecutive failures and its provider's
+failed runs over the last day; a successful scrape returns the link to
+its interval. Due links are handed out in batches from a priority queue
+ordered by due time.
+"""
+import heapq
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from products.models import ProductProvider
+from prices.models import Price, PriceAlert, PriceScrapeLog, ScrapeSchedule
+from .engine import ScrapeTarget
+
+# Exponent cap for failure backoff, i.e. at most 2 ** 5 times the interval
+MAX_BACKOFF_STEPS = 5
+
+
+class ScrapeScheduler:
+    def __init__(self, base_interval=None, min_interval=None, max_interval=None, lease=None):
+        self.base_interval = base_interval or settings.SCRAPER_BASE_INTERVAL
+        self.min_interval = min_interval or settings.SCRAPER_MIN_INTERVAL
+        self.max_interval = max_interval or settings.SCRAPER_MAX_INTERVAL
+        self.lease = lease or settings.SCRAPER_LEASE_SECONDS
+        self._queue = []
+
+    def interval_for(self, changes_per_day, watchers):
+        """Seconds between successful scrapes for one link"""
+        interval = self.base_interval / (1 + changes_per_day)
+        interval /= 1 + math.log2(1 + watchers)
+        return int(min(max(interval, self.min_interval), self.max_interval))
+
+    def backoff(self, interval, failures):
+        """Seconds before retrying a link with ``interval`` after ``failures`` failures"""
+        return int(min(interval * 2 ** min(failures, MAX_BACKOFF_STEPS), self.max_interval))
+
+    def refresh(self, batch_size=1000):
+        """Create missing schedules and recompute every interval from recent history"""
+        now = timezone.now()
+        window = timedelta(days=settings.SCRAPER_VOLATILITY_WINDOW_DAYS)
+
+        # Price rows are change points, so row counts measure volatility
+        changes = {
+            (row['product_id'], row['provider_id']): row['changes']
+            for row in Price.objects.filter(timestamp__gte=now - window)
+            .values('product_id', 'provider_id').annotate(changes=Count('id')).order_by()
+        }
+        watchers = dict(
+            PriceAlert.objects.filter(is_active=True)
+            .values_list('product_id').annotate(watchers=Count('id')).order_by()
+        )
+        schedules = {
+            schedule.product_provider_id: schedule for schedule in ScrapeSchedule.objects.all()
+        }
+
+        links = ProductProvider.objects.filter(
+            is_active=True, provider__is_active=True, product__is_active=True
+        ).exclude(Q(product_url__isnull=True) | Q(product_url='')).values_list('pk', 'product_id', 'provider_id')
+
+        to_create, to_update = [], []
+        for pk, product_id, provider_id in links.iterator(chunk_size=batch_size):
+            schedule = schedules.get(pk)
+            interval = self.interval_for(
+                changes.get((product_id, provider_id), 0) / window.days,
+                watchers.get(product_id, 0),
+            )
+            if schedule is None:
+                to_create.append(ScrapeSchedule(
+                    product_provider_id=pk, interval_seconds=interval, next_due_at=now
+                ))
+                continue
+            if schedule.interval_seconds == interval:
+                continue
+            schedule.interval_seconds = interval
+            # A failing link keeps the due time its backoff set
+            if schedule.last_scraped_at and not schedule.consecutive_failures:
+                # Pull the due time in when the link became hotter
+                schedule.next_due_at = min(
+                    schedule.next_due_at, schedule.last_scraped_at + timedelta(seconds=interval)
+                )
+            to_update.append(schedule)
+
+        ScrapeSchedule.objects.bulk_create(to_create, batch_size=batch_size, ignore_conflicts=True)
+        ScrapeSchedule.objects.bulk_update(
+            to_update, ['interval_seconds', 'next_due_at'], batch_size=batch_size
+        )
+        return len(to_create), len(to_update)
+
+    def claim(self, batch_size):
+        """Lease up to ``batch_size`` due links and return them as scrape targets"""
+        now = timezone.now()
+        # Only lease what this batch will scrape: rows waiting in memory
+        # could outlive their lease and be claimed by another worker
+        if len(self._queue) < batch_size:
+            self._fill(now, batch_size - len(self._queue))
+
+        claimed = []
+        while self._queue and len(claimed) < batch_size:
+            due_at, pk, target = self._queue[0]
+            if due_at > now:
+                break
+            heapq.heappop(self._queue)
+            claimed.append((pk, target))
+        return [target for _, target in claimed]
+
+    def _fill(self, now, limit):
+        """Pull the most overdue unleased links into the in-memory queue and lease them"""
+        queued = {pk for _, pk, _ in self._queue}
+        with transaction.atomic():
+            due = ScrapeSchedule.objects.filter(
+                Q(leased_until__isnull=True) | Q(leased_until__lt=now),
+                next_due_at__lte=now,
+            ).exclude(pk__in=queued).order_by('next_due_at')
+            if connection.features.has_select_for_update_skip_locked:
+                due = due.select_for_update(skip_locked=True, of=('self',))
+            rows = list(due.values_list(
+                'pk', 'next_due_at', 'product_provider__product_id',
+                'product_provider__provider_id', 'product_provider__product_url',
+            )[:limit])
+            ScrapeSchedule.objects.filter(pk__in=[row[0] for row in rows]).update(
+                leased_until=now + timedelta(seconds=self.lease)
+            )
+        for pk, due_at, product_id, provider_id, url in rows:
+            heapq.heappush(self._queue, (due_at, pk, ScrapeTarget(product_id, provider_id, url)))
+
+    def complete(self, outcomes):
+        """Reschedule scraped links; ``outcomes`` maps ScrapeTarget to success"""
+        if not outcomes:
+            return
+        now = timezone.now()
+        keys = {(target.product_id, target.provider_id): ok for target, ok in outcomes.items()}
+        provider_failures = dict(
+            PriceScrapeLog.objects.filter(
+                status='failed', started_at__gte=now - timedelta(days=1), provider_id__in={key[1] for key in keys},
+            ).values_list('provider_id').annotate(failures=Count('id')).order_by()
+        )
+        schedules = ScrapeSchedule.objects.filter(
+            product_provider__product_id__in={key[0] for key in keys},
+            product_provider__provider_id__in={key[1] for key in keys},
+        ).select_related('product_provider')
+
+        to_update = []
+        for schedule in schedules:
+            link = schedule.product_provider
+            ok = keys.get((link.product_id, link.provider_id))
+            if ok is None:
+                continue
+            if ok:
+                schedule.consecutive_failures = 0
+                schedule.last_scraped_at = now
+                delay = schedule.interval_seconds
+            else:
+                schedule.consecutive_failures += 1
+                delay = self.backoff(
+                    schedule.interval_seconds,
+                    schedule.consecutive_failures + provider_failures.get(link.provider_id, 0),
+                )
+            schedule.next_due_at = now + timedelta(seconds=delay)
+            schedule.leased_until = None
+            to_update.append(schedule)
+
+        ScrapeSchedule.objects.bulk_update(
+            to_update, ['consecutive_failures', 'last_scraped_at', 'next_due_at', 'leased_until']
+        )
@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Price, PriceAlert, PriceScrapeLog
+
+from .fx import base_currency, context_currency, from_base, is_supported
+from .models import Price, CurrentPrice, PriceAlert, PriceRollup, PriceScrapeLog
 
 
 class PriceSerializer(serializers.ModelSerializer):
@@ -10,29 +12,194 @@ class PriceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Price
+        fields = [
+            'id', 'product', 'product_name', 'provider', 'provider_name',
+            'variant', 'variant_name', 'price', 'currency', 'price_base', 'is_available',
+            'timestamp', 'last_seen', 'formatted_price'
+        ]
+        read_only_fields = ['id', 'price_base', 'timestamp', 'last_seen']
+
+    def validate_currency(self, value):
+        return validate_currency(value)
+
+
+def validate_currency(value):
+    value = value.upper()
+    if not is_supported(value):
+        raise serializers.ValidationError(f'No exchange rate for "{value}".')
+    return value
+
+
+class ArchivedPriceSerializer(serializers.Serializer):
+    """Renders a row read back from the price archive like ``PriceSerializer`` does"""
+    id = serializers.IntegerField()
+    product = serializers.IntegerField(source='product_id')
+    product_name = serializers.CharField(source='product')
+    provider = serializers.IntegerField(source='provider_id')
+    provider_name = serializers.CharField(source='provider')
+    variant = serializers.IntegerField(source='variant_id', allow_null=True)
+    variant_name = serializers.CharField(source='variant', allow_null=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    currency = serializers.CharField()
+    price_base = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+    is_available = serializers.BooleanField()
+    timestamp = serializers.DateTimeField()
+    last_seen = serializers.DateTimeField(allow_null=True)
+    formatted_price = serializers.SerializerMethodField()
+
+    def get_formatted_price(self, row):
+        return f"{row['currency']} {row['price']}"
+
+    def to_representation(self, row):
+        data = super().to_representation(row)
+        # PriceSerializer leaves variant_name out when there is no variant
+        if row['variant_id'] is None:
+            del data['variant_name']
+        return data
+
+
+class PriceRowSerializer(serializers.Serializer):
+    """Validates a single bulk-ingest row without touching the database"""
+    product = serializers.IntegerField()
+    provider = serializers.IntegerField()
+    variant = serializers.IntegerField(required=False, allow_null=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    currency = serializers.CharField(max_length=3, default='USD')
+    is_available = serializers.BooleanField(default=True)
+
+    def validate_currency(self, value):
+        return validate_currency(value)
+
+
+class CurrentPriceSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    provider_name = serializers.CharField(source='provider.name', read_only=True)
+    variant_name = serializers.CharField(source='variant.name', read_only=True)
+
+    class Meta:
+        model = CurrentPrice
         fields = [
             'id', 'product', 'product_name', 'provider', 'provider_name',
             'variant', 'variant_name', 'price', 'currency', 'is_available',
-            'timestamp', 'formatted_price'
+            'observed_at', 'last_seen'
         ]
-        read_only_fields = ['id', 'timestamp']
+        read_only_fields = fields
+
+
+class PriceRollupSerializer(serializers.ModelSerializer):
+    time = serializers.DateTimeField(source='bucket_start')
+    average = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        model = PriceRollup
+        fields = ['time', 'open', 'high', 'low', 'close', 'average', 'count']
+        read_only_fields = fields
+
+    def to_representation(self, instance):
+        # Rollups are kept in the base currency
+        data = super().to_representation(instance)
+        currency = context_currency(self.context)
+        for field in ('open', 'high', 'low', 'close', 'average'):
+            if data[field] is not None:
+                data[field] = str(from_base(data[field], currency))
+        return data
+
+
+class InsightPointSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    price = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+    moving_average_short = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+    moving_average_long = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+
+    def to_representation(self, instance):
+        return _converted(super().to_representation(instance), self.context, INSIGHT_POINT_AMOUNTS)
+
+
+class PriceInsightSerializer(serializers.Serializer):
+    """Trend metrics for one product, as built by prices.analytics"""
+    product = serializers.IntegerField()
+    current_price = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+    moving_average_short = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+    moving_average_long = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+    high_30d = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+    drop_from_high_percent = serializers.FloatField(allow_null=True)
+    volatility_percent = serializers.FloatField(allow_null=True)
+    all_time_low = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+    is_all_time_low = serializers.BooleanField()
+
+    def to_representation(self, instance):
+        data = _converted(super().to_representation(instance), self.context, INSIGHT_AMOUNTS)
+        if 'series' in instance:
+            data['series'] = InsightPointSerializer(instance['series'], many=True, context=self.context).data
+        return data
+
+
+INSIGHT_AMOUNTS = ['current_price', 'moving_average_short', 'moving_average_long', 'high_30d', 'all_time_low']
+INSIGHT_POINT_AMOUNTS = ['price', 'moving_average_short', 'moving_average_long']
+
+
+def _converted(data, context, fields):
+    # Analytics work in the base currency
+    currency = context_currency(context)
+    for field in fields:
+        if data[field] is not None:
+            data[field] = str(from_base(data[field], currency))
+    return data
+
+
+class VariantOfferSerializer(serializers.Serializer):
+    variant = serializers.IntegerField()
+    variant_name = serializers.CharField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    currency = serializers.CharField()
+    converted_price = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+    is_available = serializers.BooleanField()
+    observed_at = serializers.DateTimeField()
+
+
+class ProviderOfferSerializer(serializers.Serializer):
+    """One provider's latest offer for a product, as built by prices.compare"""
+    provider = serializers.IntegerField()
+    provider_name = serializers.CharField()
+    product_url = serializers.URLField(allow_null=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, allow_null=True)
+    currency = serializers.CharField(allow_null=True)
+    converted_price = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+    is_available = serializers.BooleanField()
+    observed_at = serializers.DateTimeField(allow_null=True)
+    # In the display currency
+    delta = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+    delta_percent = serializers.FloatField(allow_null=True)
+    variants = VariantOfferSerializer(many=True)
 
 
 class PriceAlertSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
-    current_lowest_price = serializers.ReadOnlyField()
+    current_lowest_price = serializers.SerializerMethodField()
+    current_lowest_price_currency = serializers.SerializerMethodField()
     alert_triggered = serializers.ReadOnlyField()
 
     class Meta:
         model = PriceAlert
         fields = [
-            'id', 'product', 'product_name', 'target_price', 'is_active',
-            'created_at', 'updated_at', 'current_lowest_price', 'alert_triggered'
+            'id', 'product', 'product_name', 'target_price', 'currency', 'is_active',
+            'created_at', 'updated_at', 'current_lowest_price', 'current_lowest_price_currency',
+            'alert_triggered'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'currency', 'created_at', 'updated_at']
+
+    def get_current_lowest_price(self, obj):
+        price = from_base(obj.current_lowest_price, self.get_current_lowest_price_currency(obj))
+        return None if price is None else str(price)
+
+    def get_current_lowest_price_currency(self, obj):
+        # The alert's currency, or the base currency once it has no rate
+        return obj.currency if is_supported(obj.currency) else base_currency()
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
+        # Targets are entered in the user's display currency
+        validated_data['currency'] = context_currency(self.context)
         return super().create(validated_data)
 
 
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import fx
+from .ingest import process_new_prices
+from .models import FXRate, Price
+
+
+@receiver(post_save, sender=Price)
+def handle_new_price(sender, instance, created, **kwargs):
+    """Apply ingest bookkeeping to single-row inserts"""
+    if created:
+        process_new_prices([instance])
+
+
+@receiver([post_save, post_delete], sender=FXRate)
+def reset_fx_rates(sender, **kwargs):
+    fx.reset_rates()
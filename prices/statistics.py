@@ -0,0 +1,161 @@
+"""Price statistics for a product over a time window and provider set.
+
+PostgreSQL computes everything, percentiles included, in one aggregate
+query; other backends fetch the sorted prices in one query and summarise
+them in Python. Prices moved to the Parquet archive count too: when the
+window reaches archived rows their values are read back and, on
+PostgreSQL, passed into the same aggregate query as an array unioned
+with the database rows, so those rows never leave the database. Prices
+that retention deleted without archiving them are gone, so windows
+reaching further back than that only cover what is left. Results are
+cached per product and invalidated whenever new prices for that product
+are ingested or archived.
+"""
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Aggregate, Avg, Count, FloatField, Max, Min, StdDev
+from django.utils import timezone
+
+from . import archive
+from .export import COLUMNS
+from .models import Price
+
+PERCENTILES = {'p10_price': 0.1, 'median_price': 0.5, 'p90_price': 0.9}
+PRICE_BASE_INDEX = COLUMNS.index('price_base')
+AVAILABLE_INDEX = COLUMNS.index('is_available')
+
+
+class Percentile(Aggregate):
+    """PostgreSQL ``percentile_cont`` ordered-set aggregate"""
+    function = 'PERCENTILE_CONT'
+    name = 'Percentile'
+    output_field = FloatField()
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def _version_key(product_id):
+    return f'price-stats-version:{product_id}'
+
+
+def invalidate_statistics(product_ids):
+    """Retire cached statistics for these products"""
+    for product_id in product_ids:
+        try:
+            cache.incr(_version_key(product_id))
+        except ValueError:
+            cache.set(_version_key(product_id), 1, None)
+
+
+def price_statistics(product_id, days=None, provider_ids=None):
+    """Summary statistics of available prices, served from cache when possible"""
+    provider_ids = sorted(set(provider_ids or []))
+    version = cache.get_or_set(_version_key(product_id), 1, None)
+    cache_key = 'price-stats:{}:{}:{}:{}'.format(
+        product_id, version, days or 'all', ','.join(map(str, provider_ids)) or 'all'
+    )
+    stats = cache.get(cache_key)
+    if stats is None:
+        stats = compute_statistics(product_id, days, provider_ids)
+        # Cache empty results too, under a sentinel that is not None
+        cache.set(cache_key, stats or {}, settings.PRICE_STATISTICS_CACHE_SECONDS)
+    return stats or None
+
+
+def compute_statistics(product_id, days=None, provider_ids=None):
+    # Statistics are in the base currency so that providers are comparable
+    since = timezone.now() - timedelta(days=days) if days else None
+    prices = Price.objects.filter(product_id=product_id, is_available=True, price_base__isnull=False)
+    if since:
+        prices = prices.filter(timestamp__gte=since)
+    if provider_ids:
+        prices = prices.filter(provider_id__in=provider_ids)
+    archived = [
+        row[PRICE_BASE_INDEX] for row in archive.read_rows(product_id, provider_ids, since)
+        if row[AVAILABLE_INDEX] and row[PRICE_BASE_INDEX] is not None
+    ]
+
+    if connection.vendor == 'postgresql':
+        return _aggregate_in_database(prices, archived)
+    return _aggregate_in_python(prices, archived)
+
+
+def _aggregate_in_database(prices, archived=()):
+    if archived:
+        stats = _aggregate_with_archived(prices, archived)
+    else:
+        stats = prices.order_by().aggregate(
+            min_price=Min('price_base'),
+            max_price=Max('price_base'),
+            avg_price=Avg('price_base'),
+            stddev=StdDev('price_base'),
+            count=Count('id'),
+            **{name: Percentile('price_base', fraction) for name, fraction in PERCENTILES.items()}
+        )
+    if not stats['count']:
+        return None
+    for name in ('stddev', *PERCENTILES):
+        stats[name] = _round(stats[name])
+    return stats
+
+
+def _aggregate_with_archived(prices, archived):
+    """The aggregate above over the database rows plus archived values sent as one array parameter"""
+    sql, params = prices.order_by().values('price_base').query.sql_with_params()
+    columns = {
+        'min_price': 'MIN(price_base)',
+        'max_price': 'MAX(price_base)',
+        'avg_price': 'AVG(price_base)',
+        'stddev': 'STDDEV_POP(price_base)',
+        'count': 'COUNT(*)',
+        **{
+            name: f'PERCENTILE_CONT({float(fraction)}) WITHIN GROUP (ORDER BY price_base)'
+            for name, fraction in PERCENTILES.items()
+        },
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT {", ".join(columns.values())} '
+            f'FROM ({sql} UNION ALL SELECT UNNEST(%s::numeric[])) AS prices (price_base)',
+            [*params, list(archived)],
+        )
+        return dict(zip(columns, cursor.fetchone()))
+
+
+def _aggregate_in_python(prices, archived=()):
+    values = sorted([*prices.order_by().values_list('price_base', flat=True), *archived])
+    if not values:
+        return None
+    count = len(values)
+    mean = sum(values) / count
+    variance = sum((value - mean) ** 2 for value in values) / count
+    stats = {
+        'min_price': values[0],
+        'max_price': values[-1],
+        'avg_price': mean,
+        'stddev': _round(math.sqrt(variance)),
+        'count': count,
+    }
+    for name, fraction in PERCENTILES.items():
+        stats[name] = _round(_percentile(values, fraction))
+    return stats
+
+
+def _percentile(sorted_values, fraction):
+    """Linear interpolation between closest ranks, matching percentile_cont"""
+    position = fraction * (len(sorted_values) - 1)
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    weight = Decimal(str(position - lower))
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * weight
+
+
+def _round(value):
+    return None if value is None else Decimal(str(value)).quantize(Decimal('0.01'))
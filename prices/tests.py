@@ -1,3 +1,873 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from products.models import Category, Product, ProductProvider, Provider, Variant
+from users.models import User, UserProfile
+from . import archive, fx, partitioning
+from .analytics import compute_insights, load_series, rank_insights
+from .export import COLUMNS
+from .ingest import PriceWriter
+from .models import (
+    AlertTrigger, CurrentPrice, CurrentPriceManager, FXRate, Price, PriceAlert, PriceRollup, PriceScrapeLog,
+    ScrapeSchedule,
+)
+from .scraping.engine import ScrapeEngine, active_targets
+from .scraping.parsers import to_decimal
+from .scraping.scheduler import ScrapeScheduler
+from .statistics import compute_statistics
+
+
+def create_catalog(products=1, providers=1):
+    category = Category.objects.create(name='Phones')
+    return (
+        [Product.objects.create(name=f'Phone {index}', category=category) for index in range(products)],
+        [Provider.objects.create(name=f'Shop {index}') for index in range(providers)],
+    )
+
+
+def row(product, provider, price, **extra):
+    """A bulk-ingest row as PriceRowSerializer validates it"""
+    return {
+        'product': product.pk, 'provider': provider.pk, 'price': Decimal(price),
+        'currency': 'USD', 'is_available': True, **extra,
+    }
+
+
+class ToDecimalTests(SimpleTestCase):
+    def test_grouping_and_decimal_separators(self):
+        cases = {
+            '1,299.00': Decimal('1299.00'),
+            '1.299,00': Decimal('1299.00'),
+            '€ 1.299,99': Decimal('1299.99'),
+            '1,299,000.50': Decimal('1299000.50'),
+            '1 299,00': Decimal('1299.00'),
+        }
+        for raw, expected in cases.items():
+            with self.subTest(raw=raw):
+                self.assertEqual(to_decimal(raw), expected)
+
+    def test_single_separator(self):
+        cases = {
+            '12,5': Decimal('12.5'),
+            '15.99': Decimal('15.99'),
+            '1.299': Decimal('1299'),
+            '1,299': Decimal('1299'),
+            '1.299.000': Decimal('1299000'),
+            '0.299': Decimal('0.299'),
+            '$ 15': Decimal('15'),
+        }
+        for raw, expected in cases.items():
+            with self.subTest(raw=raw):
+                self.assertEqual(to_decimal(raw), expected)
+
+    def test_numbers_and_garbage(self):
+        self.assertEqual(to_decimal(12.345), Decimal('12.345'))
+        self.assertEqual(to_decimal(1299), Decimal('1299'))
+        self.assertIsNone(to_decimal(None))
+        self.assertIsNone(to_decimal(''))
+        self.assertIsNone(to_decimal('n/a'))
+
+
+class CurrentPriceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.product,), (cls.provider,) = create_catalog()
+
+    def test_newest_price_per_variant_is_current(self):
+        variant = Variant.objects.create(product=self.product, name='128GB')
+        Price.objects.create(product=self.product, provider=self.provider, price=Decimal('100'))
+        newest = Price.objects.create(product=self.product, provider=self.provider, price=Decimal('90'))
+        large = Price.objects.create(
+            product=self.product, provider=self.provider, variant=variant, price=Decimal('120'),
+        )
+
+        current = {row.variant_id: row for row in CurrentPrice.objects.filter(product=self.product)}
+        self.assertEqual(set(current), {None, variant.pk})
+        self.assertEqual(current[None].source_price_id, newest.pk)
+        self.assertEqual(current[None].price, Decimal('90'))
+        self.assertEqual(current[variant.pk].source_price_id, large.pk)
+
+    def test_older_observation_is_ignored(self):
+        newest = Price.objects.create(product=self.product, provider=self.provider, price=Decimal('90'))
+        late = Price.objects.create(product=self.product, provider=self.provider, price=Decimal('80'))
+        Price.objects.filter(pk=late.pk).update(timestamp=newest.timestamp - timedelta(hours=1))
+        late.refresh_from_db()
+        CurrentPrice.objects.filter(product=self.product).update(source_price=newest, observed_at=newest.timestamp)
+
+        CurrentPrice.objects.record([late])
+        self.assertEqual(CurrentPrice.objects.get(product=self.product).source_price_id, newest.pk)
+
+    def test_lost_insert_race_is_resolved_by_age(self):
+        older = Price.objects.create(product=self.product, provider=self.provider, price=Decimal('90'))
+        newer = Price.objects.create(product=self.product, provider=self.provider, price=Decimal('80'))
+        key = (self.product.pk, self.provider.pk, None)
+        # As if a concurrent writer with the older price won the insert
+        CurrentPrice.objects.filter(product=self.product).update(
+            source_price=older, price=older.price, observed_at=older.timestamp,
+        )
+
+        for price, replaced in ((older, False), (newer, True)):
+            ours = CurrentPrice(product=self.product, provider=self.provider)
+            CurrentPriceManager._copy(ours, price)
+            with transaction.atomic():
+                stale = CurrentPrice.objects._newer_than_stored({key: ours})
+                CurrentPrice.objects.bulk_update(stale, CurrentPriceManager.RECORDED_FIELDS)
+            self.assertEqual(bool(stale), replaced)
+        self.assertEqual(CurrentPrice.objects.get(product=self.product).source_price_id, newer.pk)
+
+
+class AlertTriggerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.product,), (cls.first, cls.second) = create_catalog(providers=2)
+        cls.user = User.objects.create_user(username='watcher', email='watcher@example.com', password='x')
+        cls.alert = PriceAlert.objects.create(user=cls.user, product=cls.product, target_price=Decimal('85'))
+        Price.objects.create(product=cls.product, provider=cls.first, price=Decimal('100'))
+
+    def test_drop_below_target_triggers_once(self):
+        Price.objects.create(product=self.product, provider=self.first, price=Decimal('90'))
+        self.assertFalse(AlertTrigger.objects.exists())
+
+        hit = Price.objects.create(product=self.product, provider=self.first, price=Decimal('84'))
+        # Matching the new minimum elsewhere is not another drop
+        Price.objects.create(product=self.product, provider=self.second, price=Decimal('84'))
+        trigger = AlertTrigger.objects.get()
+        self.assertEqual((trigger.alert_id, trigger.price_id), (self.alert.pk, hit.pk))
+        self.assertEqual(trigger.triggered_price, Decimal('84'))
+
+    def test_batch_records_its_lowest_price(self):
+        writer = PriceWriter(skip_unchanged=False)
+        writer.add(0, row(self.product, self.first, '80'))
+        writer.add(1, row(self.product, self.second, '75'))
+        writer.close()
+        trigger = AlertTrigger.objects.get()
+        self.assertEqual(trigger.triggered_price, Decimal('75'))
+        self.assertEqual(AlertTrigger.objects.pending().count(), 1)
+
+    def test_opted_out_users_are_skipped(self):
+        UserProfile.objects.create(user=self.user, price_alert_notifications=False)
+        Price.objects.create(product=self.product, provider=self.first, price=Decimal('80'))
+        self.assertFalse(AlertTrigger.objects.exists())
+
+
+class PriceWriterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.product,), (cls.provider,) = create_catalog()
+
+    def write(self, *rows, skip_unchanged=True, scrape_log=None):
+        writer = PriceWriter(skip_unchanged=skip_unchanged, scrape_log=scrape_log)
+        for index, data in enumerate(rows):
+            writer.add(index, data)
+        return writer.close()
+
+    def test_repeated_observation_only_extends_last_seen(self):
+        log = PriceScrapeLog.objects.create(provider=self.provider)
+        self.assertEqual(self.write(row(self.product, self.provider, '10'))['created'], 1)
+        price = Price.objects.get(product=self.product)
+        self.assertIsNone(price.last_seen)
+
+        result = self.write(
+            row(self.product, self.provider, '10.00'), row(self.product, self.provider, '10'), scrape_log=log,
+        )
+        self.assertEqual((result['created'], result['unchanged']), (0, 2))
+        self.assertEqual(Price.objects.filter(product=self.product).count(), 1)
+        price.refresh_from_db()
+        current = CurrentPrice.objects.get(product=self.product)
+        self.assertGreaterEqual(price.last_seen, price.timestamp)
+        self.assertEqual(current.last_seen, price.last_seen)
+        log.refresh_from_db()
+        self.assertEqual(log.prices_scraped, 2)
+
+    def test_repeat_within_a_batch_is_not_seen_before_its_row(self):
+        result = self.write(row(self.product, self.provider, '10'), row(self.product, self.provider, '10'))
+        self.assertEqual((result['created'], result['unchanged']), (1, 1))
+        price = Price.objects.get(product=self.product)
+        self.assertGreaterEqual(price.last_seen, price.timestamp)
+        self.assertEqual(CurrentPrice.objects.get(product=self.product).last_seen, price.last_seen)
+
+    def test_changes_are_inserted(self):
+        self.write(row(self.product, self.provider, '10'))
+        result = self.write(
+            row(self.product, self.provider, '10', is_available=False),
+            row(self.product, self.provider, '10', is_available=False),
+            row(self.product, self.provider, '12'),
+        )
+        self.assertEqual((result['created'], result['unchanged']), (2, 1))
+        current = CurrentPrice.objects.get(product=self.product)
+        self.assertEqual((current.price, current.is_available), (Decimal('12'), True))
+
+    def test_every_row_is_inserted_without_skip_unchanged(self):
+        self.write(row(self.product, self.provider, '10'))
+        result = self.write(row(self.product, self.provider, '10'), skip_unchanged=False)
+        self.assertEqual((result['created'], result['unchanged']), (1, 0))
+        self.assertEqual(Price.objects.filter(product=self.product).count(), 2)
+
+    def test_invalid_relations_are_reported_per_row(self):
+        other = Product.objects.create(name='Other', category=self.product.category)
+        variant = Variant.objects.create(product=other, name='Blue')
+        result = self.write(
+            row(self.product, self.provider, '10'),
+            {**row(self.product, self.provider, '10'), 'product': 0},
+            row(self.product, self.provider, '11', variant=variant.pk),
+        )
+        self.assertEqual(result['created'], 1)
+        self.assertEqual([error['row'] for error in result['errors']], [1, 2])
+        self.assertIn('product', result['errors'][0]['errors'])
+        self.assertIn('variant', result['errors'][1]['errors'])
+
+    def test_rows_are_inserted_in_batches(self):
+        rows = [row(self.product, self.provider, str(10 + index)) for index in range(5)]
+        writer = PriceWriter(batch_size=2, skip_unchanged=False)
+        with CaptureQueriesContext(connection) as queries:
+            for index, data in enumerate(rows):
+                writer.add(index, data)
+            result = writer.close()
+        self.assertEqual(result['created'], 5)
+        self.assertEqual(Price.objects.filter(product=self.product).count(), 5)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "prices_price"')]
+        self.assertEqual(len(inserts), 3)
+
+
+class BulkIngestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.product,), (cls.provider,) = create_catalog()
+        cls.user = User.objects.create_user(username='ingest', email='ingest@example.com', password='x')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, body, **kwargs):
+        return self.client.post('/api/prices/bulk/?skip_unchanged=0', body, **kwargs)
+
+    def test_json_ndjson_and_csv_bodies(self):
+        rows = [{'product': self.product.pk, 'provider': self.provider.pk, 'price': '10'}]
+        ndjson = '\n'.join(json.dumps(item) for item in rows * 2)
+        csv = f'product,provider,variant,price,currency\n{self.product.pk},{self.provider.pk},,12.5,USD\n'
+        for response in (
+            self.post(rows, format='json'),
+            self.post(ndjson, content_type='application/x-ndjson'),
+            self.post(csv, content_type='text/csv'),
+        ):
+            self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Price.objects.filter(product=self.product).count(), 4)
+
+    def test_invalid_rows_do_not_abort_the_batch(self):
+        rows = [
+            {'product': self.product.pk, 'provider': self.provider.pk, 'price': '10'},
+            {'product': self.product.pk, 'provider': self.provider.pk, 'price': 'ten'},
+        ]
+        response = self.post(rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [1])
+
+    def test_all_unchanged_batch_is_ok(self):
+        rows = [{'product': self.product.pk, 'provider': self.provider.pk, 'price': '7'}]
+        self.client.post('/api/prices/bulk/', rows, format='json')
+        response = self.client.post('/api/prices/bulk/', rows * 2, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['created'], response.json()['unchanged']), (0, 2))
+
+    def test_non_list_bodies_are_rejected(self):
+        self.assertEqual(self.post(5, format='json').status_code, 400)
+        self.assertEqual(self.post('"abc"', content_type='application/json').status_code, 400)
+
+
+class ScrapeSchedulerTests(TestCase):
+    def setUp(self):
+        (product,), (provider,) = create_catalog()
+        ProductProvider.objects.create(product=product, provider=provider, product_url='http://shop.test/1/')
+        self.scheduler = ScrapeScheduler(base_interval=3600, min_interval=60, max_interval=86400, lease=600)
+        self.scheduler.refresh()
+        self.schedule = ScrapeSchedule.objects.get()
+        (self.target,) = self.scheduler.claim(10)
+
+    def complete(self, ok):
+        before = timezone.now()
+        self.scheduler.complete({self.target: ok})
+        self.schedule.refresh_from_db()
+        return (self.schedule.next_due_at - before).total_seconds()
+
+    def test_failures_back_off_once_and_success_resets(self):
+        self.assertEqual(self.schedule.interval_seconds, 3600)
+        self.assertAlmostEqual(self.complete(False), 2 * 3600, delta=5)
+        self.assertAlmostEqual(self.complete(False), 4 * 3600, delta=5)
+        self.assertEqual(self.schedule.consecutive_failures, 2)
+
+        # Recomputing intervals leaves the stored interval at its base
+        self.scheduler.refresh()
+        self.schedule.refresh_from_db()
+        self.assertEqual(self.schedule.interval_seconds, 3600)
+
+        self.assertAlmostEqual(self.complete(True), 3600, delta=5)
+        self.assertEqual(self.schedule.consecutive_failures, 0)
+        self.assertIsNone(self.schedule.leased_until)
+
+    def test_backoff_is_capped(self):
+        for _ in range(10):
+            delay = self.complete(False)
+        self.assertAlmostEqual(delay, 86400, delta=5)
+
+
+class PriceStatisticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.product,), (cls.provider, cls.other) = create_catalog(providers=2)
+        for amount in ('10', '20', '30', '40'):
+            Price.objects.create(product=cls.product, provider=cls.provider, price=Decimal(amount))
+        Price.objects.create(product=cls.product, provider=cls.other, price=Decimal('100'), is_available=False)
+
+    def test_summary_of_available_prices(self):
+        stats = compute_statistics(self.product.pk)
+        self.assertEqual(stats['count'], 4)
+        self.assertEqual((stats['min_price'], stats['max_price']), (Decimal('10'), Decimal('40')))
+        self.assertEqual(stats['avg_price'], Decimal('25'))
+        self.assertEqual(stats['stddev'], Decimal('11.18'))
+        self.assertEqual(
+            (stats['p10_price'], stats['median_price'], stats['p90_price']),
+            (Decimal('13.00'), Decimal('25.00'), Decimal('37.00')),
+        )
+
+    def test_window_and_providers(self):
+        Price.objects.filter(price__in=[10, 20]).update(timestamp=timezone.now() - timedelta(days=10))
+        self.assertEqual(compute_statistics(self.product.pk, days=5)['count'], 2)
+        self.assertIsNone(compute_statistics(self.product.pk, provider_ids=[self.other.pk]))
+
+    @skipUnless(archive.available(), 'the price archive requires pyarrow')
+    def test_archived_prices_are_included(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(PRICE_ARCHIVE_DIR=directory):
+            Price.objects.filter(price__in=[10, 20]).update(timestamp=timezone.now() - timedelta(days=100))
+            call_command('archive_prices', days=60, stdout=io.StringIO())
+            self.assertEqual(Price.objects.filter(product=self.product, provider=self.provider).count(), 2)
+
+            stats = compute_statistics(self.product.pk)
+            self.assertEqual((stats['count'], stats['min_price']), (4, Decimal('10')))
+            self.assertEqual(stats['median_price'], Decimal('25.00'))
+            self.assertEqual(stats['stddev'], Decimal('11.18'))
+            self.assertEqual(compute_statistics(self.product.pk, days=30)['count'], 2)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (product,), (provider,) = create_catalog()
+        for amount in range(7):
+            Price.objects.create(product=product, provider=provider, price=Decimal(100 + amount))
+
+    def setUp(self):
+        # Anonymous responses are cached and test transactions never commit
+        # the invalidations
+        cache.clear()
+        self.client = APIClient()
+
+    def test_pages_follow_each_other(self):
+        first = self.client.get('/api/prices/?page_size=3').json()
+        second = self.client.get(first['next']).json()
+        third = self.client.get(second['next']).json()
+
+        self.assertEqual(first['count'], 7)
+        ids = [item['id'] for page in (first, second, third) for item in page['results']]
+        self.assertEqual(ids, sorted(Price.objects.values_list('id', flat=True), reverse=True))
+        self.assertIsNone(third['next'])
+        self.assertEqual(self.client.get(second['previous']).json()['results'], first['results'])
+
+    def test_count_can_be_skipped(self):
+        response = self.client.get('/api/prices/?page_size=3&count=false').json()
+        self.assertIsNone(response.get('count'))
+        self.assertEqual(len(response['results']), 3)
+
+    def test_malformed_cursors_are_not_found(self):
+        def encode(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+        for cursor in ('zz', encode([1]), encode({'v': None, 'id': 1}), encode({'v': 'abc', 'id': 1}),
+                       encode({'v': '2024-01-01T00:00:00+00:00', 'id': 'x'})):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f'/api/prices/?cursor={cursor}').status_code, 404)
+
+
+
+    def test_nullable_ordering_field_pages_through_nulls(self):
+        (provider,) = Provider.objects.all()
+        finished = timezone.now()
+        for index in range(7):
+            log = PriceScrapeLog.objects.create(provider=provider)
+            if index % 3:
+                PriceScrapeLog.objects.filter(pk=log.pk).update(completed_at=finished - timedelta(minutes=index % 2))
+        self.client.force_authenticate(User.objects.create_user(username='ops', email='ops@example.com', password='x'))
+
+        for ordering in ('completed_at', '-completed_at'):
+            with self.subTest(ordering=ordering):
+                pages = [self.client.get(f'/api/scrape-logs/?ordering={ordering}&page_size=2').json()]
+                while pages[-1]['next']:
+                    response = self.client.get(pages[-1]['next'])
+                    self.assertEqual(response.status_code, 200)
+                    pages.append(response.json())
+                ids = [item['id'] for page in pages for item in page['results']]
+                self.assertEqual(sorted(ids), sorted(PriceScrapeLog.objects.values_list('id', flat=True)))
+                # NULLs come last whichever way the field is ordered
+                completed = [item['completed_at'] for page in pages for item in page['results']]
+                self.assertEqual(completed[-3:], [None] * 3)
+                self.assertNotIn(None, completed[:-3])
+                for page, previous in zip(pages, pages[1:]):
+                    self.assertEqual(self.client.get(previous['previous']).json()['results'], page['results'])
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.product, cls.other), (cls.provider,) = create_catalog(products=2)
+        cls.prices = [
+            Price.objects.create(product=product, provider=cls.provider, price=Decimal(amount))
+            for product, amount in ((cls.product, '10'), (cls.other, '20'), (cls.product, '12.50'))
+        ]
+        Price.objects.filter(pk=cls.prices[0].pk).update(timestamp=timezone.now() - timedelta(days=45))
+        cls.user = User.objects.create_user(username='export', email='export@example.com', password='x')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, **params):
+        response = self.client.get('/api/prices/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson_is_in_timestamp_order(self):
+        lines = [json.loads(line) for line in self.export(days=0).decode().splitlines()]
+        self.assertEqual([line['id'] for line in lines], [price.pk for price in self.prices])
+        self.assertEqual(list(lines[0]), COLUMNS)
+        self.assertEqual((lines[2]['product'], lines[2]['price']), ('Phone 0', '12.50'))
+
+    def test_filters(self):
+        lines = self.export(product_id=self.product.pk).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.prices[2].pk])
+        self.assertEqual(len(self.export(product_id=self.product.pk, days=0).decode().splitlines()), 2)
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.export(days=0, file_format='csv').decode())))
+        self.assertEqual(rows[0], COLUMNS)
+        self.assertEqual([int(row[0]) for row in rows[1:]], [price.pk for price in self.prices])
+
+    @skipUnless(archive.available(), 'Parquet export requires pyarrow')
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(io.BytesIO(self.export(days=0, file_format='parquet')))
+        self.assertEqual(table.column_names, COLUMNS)
+        self.assertEqual(table.column('id').to_pylist(), [price.pk for price in self.prices])
+
+    def test_invalid_parameters_are_named(self):
+        for name in ('product_id', 'provider_id', 'days'):
+            with self.subTest(name=name):
+                response = self.client.get('/api/prices/export/', {name: 'abc'})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], f'{name} must be an integer')
+        self.assertEqual(self.client.get('/api/prices/export/', {'file_format': 'xlsx'}).status_code, 400)
+
+    def test_export_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/prices/export/').status_code, 401)
+
+    def test_command_writes_a_file(self):
+        with tempfile.NamedTemporaryFile(suffix='.ndjson') as output:
+            call_command('export_prices', product=self.other.pk, output=output.name, archive=False)
+            lines = open(output.name).read().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.prices[1].pk])
+
+
+class FXTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.product,), (cls.provider,) = create_catalog()
+        FXRate.objects.create(currency='EUR', rate=Decimal('1.10'), effective_at=timezone.now() - timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+        fx.reset_rates()
+        self.client = APIClient()
+
+    def price(self, amount, currency='USD'):
+        return Price.objects.create(product=self.product, provider=self.provider, price=Decimal(amount), currency=currency)
+
+    def test_price_base_uses_the_current_rate(self):
+        self.assertEqual(self.price('10', 'EUR').price_base, Decimal('11.00'))
+        self.assertEqual(self.price('10').price_base, Decimal('10.00'))
+        self.assertIsNone(self.price('10', 'XYZ').price_base)
+        self.assertEqual(fx.from_base(Decimal('11'), 'EUR'), Decimal('10.00'))
+        with self.assertRaises(fx.UnknownCurrency):
+            fx.to_base(Decimal('1'), 'XYZ')
+
+    def test_price_base_keeps_its_rate_until_the_amount_changes(self):
+        pk = self.price('10', 'EUR').pk
+        FXRate.objects.create(currency='EUR', rate=Decimal('1.20'))
+        price = Price.objects.get(pk=pk)
+        price.is_available = False
+        price.save()
+        self.assertEqual(Price.objects.get(pk=pk).price_base, Decimal('11.00'))
+
+        price.price = Decimal('20')
+        price.save()
+        self.assertEqual(Price.objects.get(pk=pk).price_base, Decimal('24.00'))
+        price.currency = 'USD'
+        price.save()
+        self.assertEqual(Price.objects.get(pk=pk).price_base, Decimal('20.00'))
+
+    def test_ordering_by_price_compares_across_currencies(self):
+        self.price('10', 'EUR')
+        self.price('10.50')
+        self.price('10.80')
+
+        def prices(ordering, **params):
+            response = self.client.get('/api/prices/', {'ordering': ordering, **params})
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        expected = [('10.50', 'USD'), ('10.80', 'USD'), ('10.00', 'EUR')]
+        self.assertEqual([(row['price'], row['currency']) for row in prices('price')['results']], expected)
+        self.assertEqual([(row['price'], row['currency']) for row in prices('-price')['results']], expected[::-1])
+
+        # Cursors page on the same base-currency values
+        seen, page = [], prices('price', page_size=2)
+        while True:
+            seen += [(row['price'], row['currency']) for row in page['results']]
+            if not page['next']:
+                break
+            page = self.client.get(page['next']).json()
+        self.assertEqual(seen, expected)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Price partitioning needs PostgreSQL')
+class PartitioningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.product,), (cls.provider,) = create_catalog()
+        Price.objects.create(product=cls.product, provider=cls.provider, price=Decimal('10'))
+
+    def convert(self):
+        # Rows inserted earlier in the test transaction leave deferred
+        # constraint checks pending, which ALTER TABLE refuses to run with
+        connection.check_constraints()
+        return partitioning.convert()
+
+    def foreign_keys(self, table=Price._meta.db_table):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT confrelid::regclass::text FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+                [table],
+            )
+            return sorted(table for table, in cursor.fetchall())
+
+    def test_converted_table_keeps_its_rows_and_foreign_keys(self):
+        self.assertTrue(self.convert())
+        self.assertTrue(partitioning.is_partitioned())
+        self.assertFalse(self.convert())
+        self.assertEqual(self.foreign_keys(), ['products_product', 'products_provider', 'products_variant'])
+        # The old table's own constraints were adopted, not duplicated
+        self.assertEqual(self.foreign_keys(f'{Price._meta.db_table}_legacy'), self.foreign_keys())
+        self.assertEqual(Price.objects.count(), 1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Price.objects.bulk_create([Price(product_id=self.product.pk + 1000, provider=self.provider, price=1)])
+            connection.check_constraints()
+
+    def test_ingest_into_new_partitions(self):
+        self.convert()
+        later = partitioning.month_start(timezone.now(), 2)
+        self.assertIn(partitioning.partition_name(later), partitioning.ensure_partitions(months_ahead=2))
+
+        writer = PriceWriter()
+        writer.add(0, row(self.product, self.provider, '9'))
+        self.assertEqual(writer.close(), {'created': 1, 'unchanged': 0, 'errors': []})
+        price = Price.objects.latest('id')
+        self.assertEqual(CurrentPrice.objects.get(product=self.product).source_price_id, price.pk)
+
+        # Moving a row's timestamp moves it into that month's partition
+        Price.objects.filter(pk=price.pk).update(timestamp=later)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {partitioning.partition_name(later)}')
+            self.assertEqual(cursor.fetchall(), [(price.pk,)])
+        self.assertEqual(Price.objects.count(), 2)
+
+
+class RetentionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.product,), (cls.provider,) = create_catalog()
+        today = PriceRollup.bucket_for(timezone.now(), PriceRollup.DAY)
+        cls.old_day = today - timedelta(days=100)
+        history = [
+            (cls.old_day + timedelta(hours=10), '10'),
+            (cls.old_day + timedelta(hours=11), '12'),
+            (today - timedelta(days=2), '11'),
+            (today - timedelta(days=1), '9'),
+        ]
+        for timestamp, amount in history:
+            price = Price.objects.create(product=cls.product, provider=cls.provider, price=Decimal(amount))
+            Price.objects.filter(pk=price.pk).update(timestamp=timestamp)
+        # Live rollups used the insert time; start from history without any
+        PriceRollup.objects.all().delete()
+
+    def old_rollup(self):
+        rollup = PriceRollup.objects.get(resolution=PriceRollup.DAY, provider=None, bucket_start=self.old_day)
+        return rollup.low, rollup.high, rollup.count
+
+    def run_command(self, name, **options):
+        call_command(name, stdout=io.StringIO(), **options)
+
+    def test_rebuild_keeps_rollups_of_pruned_days(self):
+        self.run_command('rebuild_price_rollups')
+        self.assertEqual(self.old_rollup(), (Decimal('10'), Decimal('12'), 2))
+        rollups = PriceRollup.objects.count()
+
+        alert = PriceAlert.objects.create(
+            user=User.objects.create_user(username='watcher', email='watcher@example.com', password='pw'),
+            product=self.product,
+        )
+        trigger = AlertTrigger.objects.create(alert=alert, price=Price.objects.get(price=10), triggered_price=10)
+        self.run_command('prune_price_history', price_days=30)
+        self.assertEqual(sorted(Price.objects.values_list('price', flat=True)), [Decimal('9'), Decimal('11')])
+        trigger.refresh_from_db()
+        self.assertIsNone(trigger.price_id)
+
+        self.run_command('rebuild_price_rollups')
+        self.assertEqual(self.old_rollup(), (Decimal('10'), Decimal('12'), 2))
+        self.assertEqual(PriceRollup.objects.count(), rollups)
+
+    def test_prune_rollup_can_be_repeated(self):
+        # As if an earlier run rebuilt the rollups and stopped before deleting
+        PriceRollup.objects.rebuild(until=timezone.now() - timedelta(days=30))
+        self.run_command('prune_price_history', price_days=30, rollup=True)
+        self.run_command('prune_price_history', price_days=30, rollup=True)
+        self.assertEqual(self.old_rollup(), (Decimal('10'), Decimal('12'), 2))
+        self.assertEqual(Price.objects.count(), 2)
+
+    @skipUnless(archive.available(), 'the price archive requires pyarrow')
+    def test_archived_means_every_row_is_in_the_archive(self):
+        from .management.commands.prune_price_history import Command
+
+        old = Price.objects.filter(timestamp__lt=timezone.now() - timedelta(days=60))
+        with tempfile.TemporaryDirectory() as directory, override_settings(PRICE_ARCHIVE_DIR=directory):
+            self.assertFalse(Command().is_archived(old))
+            self.run_command('archive_prices', days=60, keep=True)
+            self.assertTrue(Command().is_archived(old))
+
+            # A row that reached the month after it was archived
+            late = Price.objects.create(product=self.product, provider=self.provider, price=Decimal('13'))
+            Price.objects.filter(pk=late.pk).update(timestamp=self.old_day + timedelta(hours=12))
+            self.assertFalse(Command().is_archived(old))
+
+
+@skipUnless(archive.available(), 'the price archive requires pyarrow')
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.product, cls.other), (cls.provider, cls.second) = create_catalog(products=2, providers=2)
+        now = timezone.now()
+        history = [
+            (cls.product, cls.provider, '10', 100),
+            (cls.product, cls.second, '11', 90),
+            (cls.other, cls.provider, '20', 95),
+            (cls.product, cls.provider, '12', 70),
+            (cls.product, cls.provider, '13', 0),
+            (cls.product, cls.second, '14', 0),
+            (cls.other, cls.provider, '21', 0),
+        ]
+        cls.prices = []
+        for product, provider, amount, days in history:
+            price = Price.objects.create(product=product, provider=provider, price=Decimal(amount))
+            if days:
+                Price.objects.filter(pk=price.pk).update(timestamp=now - timedelta(days=days))
+            cls.prices.append(price)
+        cls.user = User.objects.create_user(username='archive', email='archive@example.com', password='x')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(PRICE_ARCHIVE_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        self.client = APIClient()
+
+    def archive(self, **options):
+        call_command('archive_prices', days=60, stdout=io.StringIO(), **options)
+
+    def amounts(self, rows):
+        return [row[COLUMNS.index('price')] for row in rows]
+
+    def test_old_rows_move_to_the_archive(self):
+        self.archive()
+        self.assertEqual(self.amounts(archive.read_rows()), [Decimal('10'), Decimal('20'), Decimal('11'), Decimal('12')])
+        # The rows behind current prices stay whatever their age
+        self.assertEqual(
+            sorted(Price.objects.values_list('price', flat=True)), [Decimal('13'), Decimal('14'), Decimal('21')],
+        )
+        self.assertEqual(Price.objects.count() + len(list(archive.read_rows())), len(self.prices))
+
+    def test_rerunning_adds_nothing_twice(self):
+        self.archive(keep=True)
+        self.archive(keep=True)
+        self.assertEqual(len(list(archive.read_rows())), 4)
+        self.assertEqual(Price.objects.count(), len(self.prices))
+
+    def test_reads_filter_by_product_provider_and_time(self):
+        self.archive()
+        self.assertEqual(self.amounts(archive.read_rows(self.product.pk)), [Decimal('10'), Decimal('11'), Decimal('12')])
+        self.assertEqual(self.amounts(archive.read_rows(provider_ids=[self.second.pk])), [Decimal('11')])
+        since = timezone.now() - timedelta(days=80)
+        self.assertEqual(self.amounts(archive.read_rows(since=since)), [Decimal('12')])
+
+        latest = archive.latest(self.product.pk, 2)
+        self.assertEqual([row['price'] for row in latest], [Decimal('12'), Decimal('11')])
+        self.assertEqual([row['price'] for row in archive.latest(self.product.pk, 5, since)], [Decimal('12')])
+
+    def test_exports_merge_archived_rows(self):
+        self.archive()
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/prices/export/', {'days': 0, 'product_id': self.product.pk})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line['price'] for line in lines], ['10.00', '11.00', '12.00', '13.00', '14.00'])
+
+    def test_price_history_includes_archived_rows(self):
+        self.archive()
+        response = self.client.get(f'/api/products/{self.product.pk}/price_history/')
+        self.assertEqual(response.status_code, 200)
+        history = response.json()
+        self.assertEqual([row['price'] for row in history], ['14.00', '13.00', '12.00', '11.00', '10.00'])
+        self.assertEqual(history[2]['provider_name'], self.provider.name)
+
+
+class AnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.product, cls.quiet), (cls.provider, cls.second) = create_catalog(products=2, providers=2)
+        today = PriceRollup.bucket_for(timezone.now(), PriceRollup.DAY)
+        PriceRollup.objects.record([
+            (cls.product.pk, cls.provider.pk, Decimal('20'), today - timedelta(days=40, hours=-9)),
+            (cls.product.pk, cls.provider.pk, Decimal('10'), today - timedelta(days=3, hours=-9)),
+            # The day closes on the dearer provider
+            (cls.product.pk, cls.second.pk, Decimal('12'), today - timedelta(days=3, hours=-15)),
+            (cls.product.pk, cls.provider.pk, Decimal('11'), today - timedelta(days=1, hours=-9)),
+        ])
+
+    def test_gap_days_carry_the_previous_days_low(self):
+        rows, start, prices, all_time_lows = load_series([self.product.pk, self.quiet.pk], 4)
+        self.assertEqual(rows.tolist(), [self.product.pk, self.quiet.pk])
+        self.assertEqual(prices[0].tolist(), [10, 10, 11, 11])
+        self.assertTrue(np.isnan(prices[1]).all())
+        self.assertEqual(all_time_lows[0], 10)
+        # A range starting on a gap day begins from the last low before it
+        self.assertEqual(load_series([self.product.pk], 3)[2][0].tolist(), [10, 11, 11])
+
+    def test_insights(self):
+        insights = compute_insights([self.product.pk, self.quiet.pk], days=4, series=True)
+        product = insights[self.product.pk]
+        self.assertEqual([point['price'] for point in product['series']], [Decimal('10.00'), Decimal('10.00'), Decimal('11.00'), Decimal('11.00')])
+        self.assertEqual(product['current_price'], Decimal('11.00'))
+        self.assertEqual(product['moving_average_short'], Decimal('14.57'))
+        self.assertEqual(product['high_30d'], Decimal('20.00'))
+        self.assertEqual(product['drop_from_high_percent'], 45.0)
+        self.assertEqual((product['all_time_low'], product['is_all_time_low']), (Decimal('10.00'), False))
+        self.assertIsNone(insights[self.quiet.pk]['current_price'])
+        self.assertEqual(insights[self.quiet.pk]['series'], [])
+
+        ranked = rank_insights([self.product.pk, self.quiet.pk], 'drop')
+        self.assertEqual([item['product'] for item in ranked], [self.product.pk])
+
+
+class StubShopHandler(BaseHTTPRequestHandler):
+    """Serves /<price>/ as a JSON-LD product page, /broken/ as a 500 and anything else without a price"""
+    PAGE = (
+        '<html><head><script type="application/ld+json">{"@type": "Product", "offers": '
+        '{"price": "%s", "priceCurrency": "USD", "availability": "https://schema.org/InStock"}}'
+        '</script></head><body></body></html>'
+    )
+
+    def do_GET(self):
+        name = self.path.strip('/')
+        if name == 'broken':
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = self.PAGE % name if name.replace('.', '').isdigit() else '<html><body>Sold out</body></html>'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class ScrapeEngineTests(TransactionTestCase):
+    # Prices are written from the engine's worker thread, so test data has
+    # to be committed
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubShopHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.products, (self.shop, self.other) = create_catalog(products=3, providers=2)
+        links = [
+            (self.products[0], self.shop, '19.99'),
+            (self.products[1], self.shop, 'broken'),
+            (self.products[2], self.shop, 'missing'),
+            (self.products[0], self.other, '1299.00'),
+        ]
+        for product, provider, path in links:
+            ProductProvider.objects.create(product=product, provider=provider, product_url=f'{self.base_url}/{path}/')
+
+    def test_prices_and_failures_are_recorded_per_provider(self):
+        engine = ScrapeEngine(concurrency=4, per_provider=2, delay=0)
+        logs = engine.run(active_targets())
+
+        self.assertEqual(set(logs), {self.shop.pk, self.other.pk})
+        shop_log, other_log = logs[self.shop.pk], logs[self.other.pk]
+        self.assertEqual((shop_log.status, shop_log.prices_scraped), ('completed', 1))
+        self.assertIn('2 pages failed', shop_log.error_message)
+        self.assertIn('no price found', shop_log.error_message)
+        self.assertEqual((other_log.status, other_log.prices_scraped), ('completed', 1))
+        self.assertIsNone(other_log.error_message)
+
+        prices = Price.objects.order_by('provider_id').values_list('product_id', 'price', 'currency')
+        self.assertEqual(list(prices), [
+            (self.products[0].pk, Decimal('19.99'), 'USD'),
+            (self.products[0].pk, Decimal('1299.00'), 'USD'),
+        ])
+        self.assertEqual(sum(engine.outcomes.values()), 2)
+
+    def test_provider_with_only_failures_is_failed(self):
+        logs = ScrapeEngine(delay=0).run(active_targets(product_ids=[self.products[1].pk]))
+        self.assertEqual(logs[self.shop.pk].status, 'failed')
+        self.assertFalse(Price.objects.exists())
@@ -1,69 +1,188 @@
+from collections.abc import Iterator
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
-from django.db.models import Avg, Min, Max
-from datetime import datetime, timedelta
 
-from .models import Price, PriceAlert, PriceScrapeLog
-from .serializers import PriceSerializer, PriceAlertSerializer, PriceScrapeLogSerializer
+from backend.caching import CachedResponseMixin
+from backend.conditional import ConditionalGetMixin
+
+from . import archive
+from .export import FORMATS, ExportError, export_chunks
+from .fx import display_currency, from_base
+from .ingest import PriceWriter
+from .models import Price, CurrentPrice, PriceAlert, PriceScrapeLog
+from .pagination import PriceCursorPagination, ScrapeLogCursorPagination
+from .parsers import NDJSONParser, CSVParser
+from .serializers import (
+    PriceSerializer, PriceRowSerializer, CurrentPriceSerializer,
+    PriceAlertSerializer, PriceScrapeLogSerializer
+)
+from .statistics import price_statistics
+
 
+class PriceOrderingFilter(filters.OrderingFilter):
+    """Sorts ``?ordering=price`` on price_base, so prices in different currencies compare"""
+    aliases = {'price': 'price_base'}
 
-class PriceViewSet(viewsets.ModelViewSet):
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        fields = [
+            ('-' if term.startswith('-') else '') + self.aliases.get(term.lstrip('-'), term.lstrip('-'))
+            for term in fields
+        ]
+        return super().remove_invalid_fields(queryset, fields, view, request)
+
+
+class PriceViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    cache_actions = {
+        'statistics': ['prices.price', 'prices.fxrate'],
+    }
+    # Ingest bumps prices.price, which also covers last_seen updates
+    conditional_field = 'timestamp'
+    conditional_models = ['prices.price']
     queryset = Price.objects.select_related('product', 'provider', 'variant')
     serializer_class = PriceSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.OrderingFilter]
-    ordering_fields = ['price', 'timestamp']
+    pagination_class = PriceCursorPagination
+    filter_backends = [PriceOrderingFilter]
+    ordering_fields = ['price_base', 'timestamp']
     ordering = ['-timestamp']
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        
-        # Filter by product if provided
-        product_id = self.request.query_params.get('product_id')
-        if product_id:
-            queryset = queryset.filter(product_id=product_id)
-        
-        # Filter by provider if provided
-        provider_id = self.request.query_params.get('provider_id')
-        if provider_id:
-            queryset = queryset.filter(provider_id=provider_id)
-            
-        # Filter by date range
-        days = self.request.query_params.get('days', 30)
+        params = self.request.query_params
+        days = params.get('days', 30)
         try:
             days = int(days)
-            start_date = datetime.now() - timedelta(days=days)
-            queryset = queryset.filter(timestamp__gte=start_date)
         except ValueError:
-            pass
-            
-        return queryset
+            days = None
+        return super().get_queryset().filter_feed(
+            product_id=params.get('product_id'),
+            provider_id=params.get('provider_id'),
+            days=days,
+        )
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser, CSVParser])
+    def bulk(self, request):
+        """Ingest many prices from a JSON array, NDJSON or CSV body"""
+        scrape_log = None
+        scrape_log_id = request.query_params.get('scrape_log')
+        if scrape_log_id:
+            scrape_log = PriceScrapeLog.objects.filter(pk=scrape_log_id).first()
+            if scrape_log is None:
+                return Response({'error': 'scrape_log does not exist'}, status=400)
+
+        # JSON bodies arrive as a list, NDJSON and CSV as a row iterator
+        rows = request.data
+        if not isinstance(rows, (list, Iterator)):
+            return Response({'error': 'Expected a list of prices'}, status=400)
+
+        try:
+            batch_size = max(1, int(request.query_params.get('batch_size', 1000)))
+        except ValueError:
+            return Response({'error': 'batch_size must be an integer'}, status=400)
+
+        skip_unchanged = request.query_params.get('skip_unchanged')
+        if skip_unchanged is not None:
+            skip_unchanged = skip_unchanged in ('1', 'true', 'True')
+
+        writer = PriceWriter(
+            batch_size=batch_size,
+            scrape_log=scrape_log,
+            skip_unchanged=skip_unchanged,
+        )
+        for index, row in enumerate(rows):
+            row_serializer = PriceRowSerializer(data=row)
+            if row_serializer.is_valid():
+                writer.add(index, row_serializer.validated_data)
+            else:
+                writer.add_error(index, row_serializer.errors)
+        result = writer.close()
+
+        if result['created']:
+            status_code = 201
+        elif result['unchanged'] or not result['errors']:
+            status_code = 200
+        else:
+            status_code = 400
+        return Response(result, status=status_code)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def export(self, request):
+        """Stream matching prices as NDJSON, CSV or Parquet"""
+        file_format = request.query_params.get('file_format', 'ndjson')
+        params = request.query_params
+        feed = {}
+        for name, default in (('product_id', None), ('provider_id', None), ('days', 30)):
+            value = params.get(name) or default
+            try:
+                feed[name] = None if value is None else int(value)
+            except ValueError:
+                return Response({'error': f'{name} must be an integer'}, status=400)
+        try:
+            queryset = Price.objects.filter_feed(**feed)
+            chunks = export_chunks(queryset, file_format, archived=archive.read_feed(**feed))
+        except ExportError as exc:
+            return Response({'error': str(exc)}, status=400)
+
+        content_type, extension, _ = FORMATS[file_format]
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        filename = f"prices-{timezone.now():%Y%m%d%H%M%S}.{extension}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def current(self, request):
+        """Get the latest price per provider and variant for a product"""
+        product_id = request.query_params.get('product_id')
+        if not product_id:
+            return Response({'error': 'product_id is required'}, status=400)
+
+        current_prices = CurrentPrice.objects.filter(
+            product_id=product_id
+        ).select_related('product', 'provider', 'variant')
+
+        available_only = request.query_params.get('available')
+        if available_only in ('1', 'true', 'True'):
+            current_prices = current_prices.filter(is_available=True)
+
+        serializer = CurrentPriceSerializer(current_prices, many=True)
+        return Response({'current_prices': serializer.data})
 
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        """Get price statistics"""
+        """Get price statistics over an optional window and provider set"""
         product_id = request.query_params.get('product_id')
         if not product_id:
             return Response({'error': 'product_id is required'}, status=400)
 
-        prices = Price.objects.filter(product_id=product_id, is_available=True)
-        
-        if not prices.exists():
-            return Response({'statistics': None})
+        try:
+            product_id = int(product_id)
+            days = request.query_params.get('days')
+            days = int(days) if days else None
+            provider_ids = [
+                int(provider_id)
+                for value in request.query_params.getlist('provider_id')
+                for provider_id in value.split(',') if provider_id
+            ]
+        except ValueError:
+            return Response({'error': 'product_id, days and provider_id must be integers'}, status=400)
 
-        stats = prices.aggregate(
-            min_price=Min('price'),
-            max_price=Max('price'),
-            avg_price=Avg('price')
-        )
-        
-        stats['count'] = prices.count()
-        return Response({'statistics': stats})
+        stats = price_statistics(product_id, days=days, provider_ids=provider_ids)
+        currency = display_currency(request)
+        if stats:
+            stats = {
+                name: value if name == 'count' else from_base(value, currency)
+                for name, value in stats.items()
+            }
+        return Response({'statistics': stats, 'currency': currency})
 
 
-class PriceAlertViewSet(viewsets.ModelViewSet):
+class PriceAlertViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    conditional_models = ['prices.pricealert', 'prices.currentprice', 'products.product', 'prices.fxrate']
     serializer_class = PriceAlertSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
@@ -72,14 +191,15 @@ class PriceAlertViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Only return current user's alerts"""
-        return PriceAlert.objects.filter(user=self.request.user).select_related('product')
+        return PriceAlert.objects.filter(
+            user=self.request.user
+        ).select_related('product').with_current_price()
 
     @action(detail=False, methods=['get'])
     def triggered(self, request):
         """Get alerts that have been triggered"""
-        alerts = self.get_queryset().filter(is_active=True)
-        triggered_alerts = [alert for alert in alerts if alert.alert_triggered]
-        
+        triggered_alerts = self.get_queryset().triggered()
+
         serializer = self.get_serializer(triggered_alerts, many=True)
         return Response({'triggered_alerts': serializer.data})
 
@@ -88,6 +208,7 @@ class PriceScrapeLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = PriceScrapeLog.objects.select_related('provider', 'product')
     serializer_class = PriceScrapeLogSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ScrapeLogCursorPagination
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['started_at', 'completed_at']
     ordering = ['-started_at']
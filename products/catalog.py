@@ -0,0 +1,62 @@
+"""The category -> subcategory navigation tree, rendered once per change.
+
+The rendered JSON and its ETag are cached under a version number that the
+catalog signals bump whenever a category, subcategory or product changes,
+so serving the tree is a cache read. Versions are never reused, so losing
+the version key cannot resurrect an old tree, and cached trees expire after
+``RESPONSE_CACHE_SECONDS``, which bounds staleness where the cache is not
+shared between processes.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from backend.caching import fresh_version
+
+from .models import Category, Subcategory
+
+VERSION_KEY = 'catalog-tree-version'
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, fresh_version(), None)
+
+
+def build_tree():
+    subcategories = {}
+    for subcategory in Subcategory.objects.with_products_count().order_by('name'):
+        subcategories.setdefault(subcategory.category_id, []).append({
+            'id': subcategory.id,
+            'name': subcategory.name,
+            'slug': subcategory.slug,
+            'image': subcategory.image,
+            'products_count': subcategory.products_count,
+        })
+    return [
+        {
+            'id': category.id,
+            'name': category.name,
+            'slug': category.slug,
+            'image': category.image,
+            'products_count': category.products_count,
+            'subcategories': subcategories.get(category.id, []),
+        }
+        for category in Category.objects.with_products_count().order_by('name')
+    ]
+
+
+def catalog_tree():
+    """(etag, JSON bytes) for the current catalog tree"""
+    version = cache.get_or_set(VERSION_KEY, fresh_version, None)
+    key = f'catalog-tree:{version}'
+    cached = cache.get(key)
+    if cached is None:
+        body = json.dumps({'categories': build_tree()}, separators=(',', ':')).encode()
+        cached = ('"%s"' % hashlib.md5(body).hexdigest(), body)
+        cache.set(key, cached, settings.RESPONSE_CACHE_SECONDS)
+    return cached
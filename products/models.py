@@ -1,12 +1,25 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Count, OuterRef, Q, Subquery
 from django.utils.text import slugify
 
 
+class CatalogQuerySet(models.QuerySet):
+    def with_products_count(self):
+        """Annotate the number of active products in one grouped query"""
+        return self.annotate(
+            products_count=Count('products', filter=Q(products__is_active=True))
+        )
+
+
 class Category(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(max_length=255, unique=True, blank=True)
     image = models.URLField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CatalogQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = "categories"
@@ -27,6 +40,9 @@ class Subcategory(models.Model):
     slug = models.SlugField(max_length=255, blank=True)
     image = models.URLField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CatalogQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = "subcategories"
@@ -56,11 +72,22 @@ class Location(models.Model):
 
 
 class Provider(models.Model):
+    PARSER_CHOICES = [
+        ('auto', 'Automatic (JSON-LD, microdata)'),
+        ('jsonld', 'JSON-LD'),
+        ('microdata', 'Microdata'),
+        ('selector', 'CSS/XPath selectors'),
+        ('custom', 'Custom parser class'),
+    ]
+
     name = models.CharField(max_length=255)
     website = models.URLField(blank=True, null=True)
     logo = models.URLField(blank=True, null=True)
     location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    # Price extraction strategy; see prices.scraping.parsers for config keys
+    parser = models.CharField(max_length=20, choices=PARSER_CHOICES, default='auto')
+    parser_config = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -70,6 +97,22 @@ class Provider(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_lowest_price(self):
+        """Annotate the lowest available price (in the base currency), its provider and timestamp"""
+        from prices.models import CurrentPrice
+        lowest = CurrentPrice.objects.filter(
+            product=OuterRef('pk'),
+            is_available=True,
+            price_base__isnull=False,
+        ).order_by('price_base', '-observed_at')
+        return self.annotate(
+            lowest_price=Subquery(lowest.values('price_base')[:1]),
+            lowest_price_provider=Subquery(lowest.values('provider__name')[:1]),
+            lowest_price_timestamp=Subquery(lowest.values('observed_at')[:1]),
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
@@ -81,6 +124,10 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by products.search on PostgreSQL; unused elsewhere
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
@@ -88,15 +135,18 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    def lowest_price_record(self):
+        """Get the current price row behind the current lowest price"""
+        from prices.models import CurrentPrice
+        return CurrentPrice.objects.lowest_for(self)
+
     @property
     def current_lowest_price(self):
-        """Get the current lowest price for this product"""
-        from prices.models import Price
-        latest_prices = Price.objects.filter(
-            product=self,
-            is_available=True
-        ).order_by('price').first()
-        return latest_prices.price if latest_prices else None
+        """Get the current lowest price for this product in the base currency"""
+        if hasattr(self, 'lowest_price'):
+            return self.lowest_price
+        lowest = self.lowest_price_record()
+        return lowest.price_base if lowest else None
 
 
 class Variant(models.Model):
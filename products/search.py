@@ -0,0 +1,306 @@
+"""Ranked product search with prefix matching and typo tolerance.
+
+On PostgreSQL each product carries a weighted ``tsvector`` (name, then
+brand/model, then category/subcategory, then description) behind a GIN
+index, with a trigram index on the name for misspelled queries. Other
+backends use an in-process inverted index built on first use. Both are
+kept current from the product, category and subcategory signals.
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, connections
+from django.db.models import F
+
+from .models import Category, Product, Subcategory
+
+SEARCH_CONFIG = 'english'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Relative weight of each field in the ranking, best first
+FIELD_WEIGHTS = {
+    'name': 1.0,
+    'brand': 0.6,
+    'model': 0.6,
+    'category__name': 0.4,
+    'subcategory__name': 0.4,
+    'description': 0.2,
+}
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def search_products(queryset, query, limit=20):
+    """Products from ``queryset`` matching ``query``, best match first"""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    if uses_postgres():
+        return _postgres_search(queryset, terms, query, limit)
+    return _index_search(queryset, terms, limit)
+
+
+def index_products(product_ids):
+    """Refresh the search entries for these products"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    if uses_postgres():
+        _update_vectors('p.id = ANY(%s)', [product_ids])
+    else:
+        memory_index.update(product_ids)
+
+
+def index_category(category_id):
+    if uses_postgres():
+        _update_vectors('p.category_id = %s', [category_id])
+    else:
+        memory_index.update(Product.objects.filter(category_id=category_id).values_list('pk', flat=True))
+
+
+def index_subcategory(subcategory_id):
+    if uses_postgres():
+        _update_vectors('p.subcategory_id = %s', [subcategory_id])
+    else:
+        memory_index.update(Product.objects.filter(subcategory_id=subcategory_id).values_list('pk', flat=True))
+
+
+def remove_products(product_ids):
+    # Deleted rows take their search_vector with them on PostgreSQL
+    if not uses_postgres():
+        memory_index.remove(product_ids)
+
+
+def rebuild():
+    """Recompute every search entry; returns the number of products indexed"""
+    if uses_postgres():
+        return _update_vectors('TRUE', [])
+    return memory_index.build()
+
+
+# PostgreSQL
+
+def _update_vectors(where, params):
+    product = Product._meta.db_table
+    category = Category._meta.db_table
+    subcategory = Subcategory._meta.db_table
+
+    def weighted(expression, weight):
+        return f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({expression}, '')), '{weight}')"
+
+    vector = ' || '.join([
+        weighted('p.name', 'A'),
+        weighted("concat_ws(' ', p.brand, p.model)", 'B'),
+        weighted(
+            f"concat_ws(' ', (SELECT c.name FROM {category} c WHERE c.id = p.category_id), "
+            f"(SELECT s.name FROM {subcategory} s WHERE s.id = p.subcategory_id))",
+            'C',
+        ),
+        weighted('p.description', 'D'),
+    ])
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {product} p SET search_vector = {vector} WHERE {where}', params)
+        return cursor.rowcount
+
+
+def create_postgres_indexes(using='default'):
+    """GIN indexes for the search vector and trigram name matching"""
+    table = Product._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_search_gin ON {table} USING gin (search_vector)')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_name_trgm ON {table} USING gin (name gin_trgm_ops)')
+
+
+def _postgres_search(queryset, terms, query, limit):
+    # Every term must match, the last one as a prefix of a longer word
+    raw = ' & '.join(f"'{term}'" for term in terms[:-1])
+    raw = f"{raw} & '{terms[-1]}':*" if raw else f"'{terms[-1]}':*"
+    tsquery = SearchQuery(raw, search_type='raw', config=SEARCH_CONFIG)
+    results = list(
+        queryset.filter(search_vector=tsquery)
+        .annotate(rank=SearchRank(F('search_vector'), tsquery))
+        .order_by('-rank', '-created_at')[:limit]
+    )
+    if len(results) < limit:
+        # Misspelled queries: fall back to trigram similarity on the name
+        found = [product.pk for product in results]
+        results += list(
+            queryset.filter(name__trigram_word_similar=query)
+            .exclude(pk__in=found)
+            .order_by('-created_at')[:limit - len(results)]
+        )
+    return results
+
+
+# In-process index
+
+def _within_distance(a, b, max_distance):
+    """Whether the Levenshtein distance between a and b is at most max_distance"""
+    if abs(len(a) - len(b)) > max_distance:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > max_distance:
+            return False
+        previous = current
+    return previous[-1] <= max_distance
+
+
+def _trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InvertedIndex:
+    """Term -> {product id: field weight} postings with a sorted term list for prefixes"""
+
+    EXACT, PREFIX, FUZZY = 1.0, 0.8, 0.5
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        self._terms = []
+        self._terms_dirty = False
+        self._trigrams = defaultdict(set)
+
+    def build(self):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._trigrams.clear()
+            count = 0
+            for row in self._rows(Product.objects.all()):
+                self._add(*row)
+                count += 1
+            self._terms_dirty = True
+            self._built = True
+            return count
+
+    def update(self, product_ids):
+        product_ids = list(product_ids)
+        with self._lock:
+            if not self._built:
+                return
+            self._discard(product_ids)
+            for row in self._rows(Product.objects.filter(pk__in=product_ids)):
+                self._add(*row)
+            self._terms_dirty = True
+
+    def remove(self, product_ids):
+        with self._lock:
+            if self._built:
+                self._discard(product_ids)
+                self._terms_dirty = True
+
+    def search(self, terms):
+        """Ranked (product id, score) pairs for products matching every term"""
+        with self._lock:
+            if not self._built:
+                self.build()
+            if self._terms_dirty:
+                self._terms = sorted(self._postings)
+                self._terms_dirty = False
+            scores = None
+            for term in terms:
+                matches = self._match(term)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {pk: scores[pk] + score for pk, score in matches.items() if pk in scores}
+                if not scores:
+                    return []
+            # Newest first among equal scores, like the product list
+            return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+    def _rows(self, queryset):
+        fields = list(FIELD_WEIGHTS)
+        for row in queryset.values_list('pk', *fields).iterator(chunk_size=2000):
+            yield row[0], dict(zip(fields, row[1:]))
+
+    def _add(self, pk, values):
+        weights = {}
+        for field, text in values.items():
+            for token in tokenize(text):
+                weights[token] = max(weights.get(token, 0), FIELD_WEIGHTS[field])
+        for token, weight in weights.items():
+            if token not in self._postings:
+                for trigram in _trigrams(token):
+                    self._trigrams[trigram].add(token)
+            self._postings[token][pk] = weight
+        self._documents[pk] = list(weights)
+
+    def _discard(self, product_ids):
+        for pk in product_ids:
+            for token in self._documents.pop(pk, ()):
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(pk, None)
+                if not postings:
+                    del self._postings[token]
+                    for trigram in _trigrams(token):
+                        self._trigrams[trigram].discard(token)
+
+    def _match(self, term):
+        """Best score per product for an exact, prefix or near-miss match of ``term``"""
+        matches = {}
+
+        def collect(token, quality):
+            for pk, weight in self._postings[token].items():
+                score = weight * quality
+                if score > matches.get(pk, 0):
+                    matches[pk] = score
+
+        position = bisect_left(self._terms, term)
+        while position < len(self._terms) and self._terms[position].startswith(term):
+            token = self._terms[position]
+            collect(token, self.EXACT if token == term else self.PREFIX)
+            position += 1
+
+        if len(term) >= 4:
+            max_distance = 1 if len(term) < 8 else 2
+            candidates = set()
+            for trigram in _trigrams(term):
+                candidates |= self._trigrams.get(trigram, set())
+            for token in candidates:
+                if not token.startswith(term) and _within_distance(term, token, max_distance):
+                    collect(token, self.FUZZY)
+        return matches
+
+
+memory_index = InvertedIndex()
+
+
+def _index_search(queryset, terms, limit, batch_size=500):
+    ranked = [pk for pk, _ in memory_index.search(terms)]
+    # Respect the caller's filters, checking candidates best first
+    top = []
+    for start in range(0, len(ranked), batch_size):
+        batch = ranked[start:start + batch_size]
+        allowed = set(queryset.filter(pk__in=batch).values_list('pk', flat=True))
+        top += [pk for pk in batch if pk in allowed]
+        if len(top) >= limit:
+            break
+    top = top[:limit]
+    products = queryset.in_bulk(top)
+    return [products[pk] for pk in top]
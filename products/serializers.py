@@ -1,4 +1,6 @@
 from rest_framework import serializers
+
+from prices.fx import context_currency, from_base
 from .models import Category, Subcategory, Location, Provider, Product, Variant, ProductProvider
 
 
@@ -11,6 +13,8 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'slug', 'created_at']
 
     def get_products_count(self, obj):
+        if hasattr(obj, 'products_count'):
+            return obj.products_count
         return obj.products.filter(is_active=True).count()
 
 
@@ -24,6 +28,8 @@ class SubcategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'slug', 'created_at']
 
     def get_products_count(self, obj):
+        if hasattr(obj, 'products_count'):
+            return obj.products_count
         return obj.products.filter(is_active=True).count()
 
 
@@ -39,7 +45,10 @@ class ProviderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Provider
-        fields = ['id', 'name', 'website', 'logo', 'location', 'location_name', 'is_active', 'created_at']
+        fields = [
+            'id', 'name', 'website', 'logo', 'location', 'location_name', 'is_active',
+            'parser', 'parser_config', 'created_at'
+        ]
         read_only_fields = ['id', 'created_at']
 
 
@@ -54,17 +63,43 @@ class ProductSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     subcategory_name = serializers.CharField(source='subcategory.name', read_only=True)
     variants = VariantSerializer(many=True, read_only=True)
-    current_lowest_price = serializers.ReadOnlyField()
+    current_lowest_price = serializers.SerializerMethodField()
+    current_lowest_price_currency = serializers.SerializerMethodField()
+    current_lowest_price_provider = serializers.SerializerMethodField()
+    current_lowest_price_timestamp = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'description', 'brand', 'model', 'image',
             'category', 'category_name', 'subcategory', 'subcategory_name',
-            'variants', 'current_lowest_price', 'is_active', 'created_at', 'updated_at'
+            'variants', 'current_lowest_price', 'current_lowest_price_currency', 'current_lowest_price_provider',
+            'current_lowest_price_timestamp', 'is_active', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_current_lowest_price(self, obj):
+        price = from_base(obj.current_lowest_price, context_currency(self.context))
+        return None if price is None else str(price)
+
+    def get_current_lowest_price_currency(self, obj):
+        return context_currency(self.context)
+
+    def get_current_lowest_price_provider(self, obj):
+        # List/search querysets are annotated by ProductQuerySet.with_lowest_price
+        if hasattr(obj, 'lowest_price_provider'):
+            return obj.lowest_price_provider
+        lowest = obj.lowest_price_record()
+        return lowest.provider.name if lowest else None
+
+    def get_current_lowest_price_timestamp(self, obj):
+        if hasattr(obj, 'lowest_price_timestamp'):
+            timestamp = obj.lowest_price_timestamp
+        else:
+            lowest = obj.lowest_price_record()
+            timestamp = lowest.observed_at if lowest else None
+        return serializers.DateTimeField().to_representation(timestamp) if timestamp else None
+
 
 class ProductProviderSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
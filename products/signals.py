@@ -0,0 +1,47 @@
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import search
+from .catalog import bump_catalog_version
+from .models import Category, Product, Subcategory
+from .suggest import suggest_index
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.index_products([instance.pk]))
+    transaction.on_commit(lambda: suggest_index.update(instance))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: search.remove_products([pk]))
+    transaction.on_commit(lambda: suggest_index.remove(pk))
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(lambda: search.index_category(instance.pk))
+
+
+@receiver(post_save, sender=Subcategory)
+def reindex_subcategory(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(lambda: search.index_subcategory(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Subcategory)
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_catalog_tree(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_migrate)
+def create_search_indexes(sender, app_config, using, **kwargs):
+    """Indexes Django cannot express portably, created after products migrate"""
+    if app_config.name == 'products' and connections[using].vendor == 'postgresql':
+        search.create_postgres_indexes(using)
@@ -0,0 +1,197 @@
+"""Search-box autocomplete served from memory.
+
+Product names (and every word start within them), brands and models are
+kept in a sorted array and matched by prefix with ``bisect``. Results are
+ranked by how many users watch the product through active price alerts.
+The array is an immutable snapshot that a background thread rebuilds
+every ``SUGGEST_REFRESH_SECONDS``; product saves in between land in a
+small overlay that is consulted alongside it, so lookups never touch the
+database once the first snapshot exists.
+"""
+import heapq
+import itertools
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q
+
+from .models import Product
+from .search import tokenize
+
+MAX_SUGGESTIONS = 20
+# Prefixes this short match too many keys to scan; their top results are precomputed
+SHORT_PREFIX = 2
+# Prefixes matching more keys than this have their results memoised per snapshot
+LARGE_RANGE = 2000
+
+
+def _keys(name, brand, model):
+    """Lookup strings for a product, best field first"""
+    keys = []
+    words = tokenize(name)
+    for start in range(len(words)):
+        keys.append(' '.join(words[start:]))
+    for value in (brand, model):
+        value = ' '.join(tokenize(value))
+        if value and value not in keys:
+            keys.append(value)
+    return keys
+
+
+def _normalize(query):
+    query = query.lower()
+    words = tokenize(query)
+    normalized = ' '.join(words)
+    # Keep a trailing space so "galaxy " only matches whole words
+    return normalized + ' ' if words and query[-1:].isspace() else normalized
+
+
+class Snapshot:
+    """Immutable prefix index over every active product"""
+
+    def __init__(self, products):
+        # products: iterable of (id, name, brand, model, watchers)
+        self.products = {}
+        for pk, name, brand, model, watchers in products:
+            self.products[pk] = {'id': pk, 'name': name, 'brand': brand, 'model': model, 'watchers': watchers}
+        # Keys point at a product's position in ranking order, so the best
+        # matches for a prefix are simply the smallest positions in its range
+        self.ranked = sorted(self.products, key=self.rank)
+        entries = []
+        self.top = {}
+        for position, pk in enumerate(self.ranked):
+            product = self.products[pk]
+            for key in _keys(product['name'], product['brand'], product['model']):
+                entries.append((key, position))
+                # Walking from most to least watched, the first few products
+                # to reach a short prefix are its top suggestions
+                for length in range(1, min(SHORT_PREFIX, len(key)) + 1):
+                    top = self.top.setdefault(key[:length], [])
+                    if len(top) < MAX_SUGGESTIONS and (not top or top[-1] != pk):
+                        top.append(pk)
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.positions = [position for _, position in entries]
+        self._large = {}
+
+    def rank(self, pk):
+        product = self.products[pk]
+        return (-product['watchers'], product['name'], pk)
+
+    def match(self, prefix, limit):
+        if len(prefix) <= SHORT_PREFIX:
+            return self.top.get(prefix, [])[:limit]
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\U0010ffff', start)
+        if end - start > LARGE_RANGE:
+            if prefix not in self._large:
+                self._large[prefix] = self._best(start, end, MAX_SUGGESTIONS)
+            return self._large[prefix][:limit]
+        return self._best(start, end, limit)
+
+    def _best(self, start, end, limit):
+        positions = heapq.nsmallest(limit, set(self.positions[start:end]))
+        return [self.ranked[position] for position in positions]
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._snapshot = None
+        # product id -> (sequence, product dict or None if removed); replaced,
+        # never changed in place, so readers can use it without the lock
+        self._overlay = {}
+        self._sequence = itertools.count(1)
+        # Guards overlay writes and the refresh flag; held only briefly
+        self._lock = threading.Lock()
+        # Serialises the slow database load in rebuild()
+        self._build_lock = threading.Lock()
+        self._refreshing = False
+        self._built_at = 0
+
+    def suggest(self, query, limit=10):
+        prefix = _normalize(query)
+        if not prefix:
+            return []
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.rebuild()
+            snapshot = self._snapshot
+        elif time.monotonic() - self._built_at > settings.SUGGEST_REFRESH_SECONDS:
+            self.refresh_in_background()
+
+        overlay = self._overlay
+        candidates = [
+            snapshot.products[pk] for pk in snapshot.match(prefix, limit + len(overlay))
+            if pk not in overlay
+        ]
+        for _, product in overlay.values():
+            if product and any(key.startswith(prefix) for key in _keys(product['name'], product['brand'], product['model'])):
+                candidates.append(product)
+        candidates.sort(key=lambda product: (-product['watchers'], product['name'], product['id']))
+        return [
+            {'id': product['id'], 'name': product['name'], 'brand': product['brand'], 'model': product['model']}
+            for product in candidates[:limit]
+        ]
+
+    def update(self, product):
+        """Reflect a saved product until the next rebuild picks it up"""
+        entry = None
+        if product.is_active:
+            previous = self._snapshot.products.get(product.pk) if self._snapshot else None
+            entry = {
+                'id': product.pk, 'name': product.name, 'brand': product.brand, 'model': product.model,
+                'watchers': previous['watchers'] if previous else 0,
+            }
+        self._set_overlay(product.pk, entry)
+
+    def remove(self, product_id):
+        self._set_overlay(product_id, None)
+
+    def _set_overlay(self, product_id, entry):
+        with self._lock:
+            overlay = dict(self._overlay)
+            overlay[product_id] = (next(self._sequence), entry)
+            self._overlay = overlay
+
+    def rebuild(self):
+        """Load a fresh snapshot from the database and swap it in"""
+        with self._build_lock:
+            with self._lock:
+                started = next(self._sequence)
+            products = (
+                Product.objects.filter(is_active=True)
+                .annotate(watchers=Count('price_alerts__user', filter=Q(price_alerts__is_active=True), distinct=True))
+                .values_list('pk', 'name', 'brand', 'model', 'watchers')
+                .order_by()
+                .iterator(chunk_size=5000)
+            )
+            snapshot = Snapshot(products)
+            with self._lock:
+                self._snapshot = snapshot
+                self._built_at = time.monotonic()
+                # Drop overlay entries the new snapshot already reflects
+                self._overlay = {
+                    pk: entry for pk, entry in self._overlay.items() if entry[0] > started
+                }
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.rebuild()
+            finally:
+                self._refreshing = False
+                connection.close()
+
+        threading.Thread(target=run, name='suggest-index-refresh', daemon=True).start()
+
+
+suggest_index = SuggestIndex()
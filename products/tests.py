@@ -1,3 +1,504 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from prices import fx
+from prices.models import FXRate, Price, PriceAlert, PriceRollup
+from users.models import User, UserProfile
+from . import search
+from .catalog import VERSION_KEY
+from .models import Category, Product, ProductProvider, Provider, Subcategory, Variant
+from .suggest import SuggestIndex, suggest_index
+
+
+class CatalogTestCase(TestCase):
+    """A small catalog with a client; anonymous responses and FX rates are cached, so each test starts afresh"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Phones')
+        cls.provider = Provider.objects.create(name='Shop')
+        cls.product = Product.objects.create(name='Acme Phone', brand='Acme', category=cls.category)
+
+    def setUp(self):
+        cache.clear()
+        # Rates are held per process; forget those of earlier tests
+        fx.reset_rates()
+        self.client = APIClient()
+
+
+class PriceChartTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Price.objects.create(product=cls.product, provider=cls.provider, price=Decimal('10'))
+
+    def chart(self, **params):
+        return self.client.get(f'/api/products/{self.product.pk}/price_chart/', params)
+
+    def test_resolution_follows_the_range(self):
+        for days, resolution in ((1, 'raw'), (7, 'hour'), (60, 'day')):
+            with self.subTest(days=days):
+                response = self.chart(days=days)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['resolution'], resolution)
+        self.assertEqual(len(self.chart(days=1).json()['points']), 1)
+
+    def test_finer_resolution_than_the_range_allows_is_coarsened(self):
+        cases = [
+            ({'days': 2, 'resolution': 'hour'}, 'hour'),
+            ({'days': 30, 'resolution': 'day'}, 'day'),
+            ({'days': 365, 'resolution': 'raw'}, 'day'),
+            ({'days': 3650, 'resolution': 'hour'}, 'day'),
+            ({'days': 30, 'resolution': 'raw'}, 'hour'),
+        ]
+        for params, resolution in cases:
+            with self.subTest(**params):
+                self.assertEqual(self.chart(**params).json()['resolution'], resolution)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.chart(resolution='minute').status_code, 400)
+        self.assertEqual(self.chart(days='week').status_code, 400)
+        self.assertEqual(self.chart(days=10 ** 9).status_code, 200)
+
+
+class SearchTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.accessories = Category.objects.create(name='Accessories')
+        cls.galaxy = Product.objects.create(name='Galaxy Phone', brand='Samsung', category=cls.category)
+        cls.charger = Product.objects.create(
+            name='Charger', description='Fast charger for Acme handsets', category=cls.accessories,
+        )
+
+    def setUp(self):
+        super().setUp()
+        # Index updates run on commit, which never happens inside a test case
+        search.rebuild()
+
+    def names(self, query, queryset=None):
+        return [product.name for product in search.search_products(queryset or Product.objects.all(), query)]
+
+    def test_name_matches_rank_above_other_fields(self):
+        self.assertEqual(self.names('acme'), ['Acme Phone', 'Charger'])
+        self.assertEqual(self.names('phones'), ['Galaxy Phone', 'Acme Phone'])
+
+    def test_last_term_matches_as_a_prefix(self):
+        self.assertEqual(self.names('acme pho'), ['Acme Phone'])
+        self.assertEqual(self.names('sams'), ['Galaxy Phone'])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.names('acme galaxy'), [])
+        self.assertEqual(self.names('  '), [])
+
+    def test_category_names_are_searchable(self):
+        self.assertEqual(self.names('accessories'), ['Charger'])
+
+    def test_index_follows_product_and_category_changes(self):
+        self.galaxy.name = 'Nebula Phone'
+        self.galaxy.save()
+        search.index_products([self.galaxy.pk])
+        self.assertEqual(self.names('nebula'), ['Nebula Phone'])
+        self.assertEqual(self.names('galaxy'), [])
+
+        self.accessories.name = 'Power'
+        self.accessories.save()
+        search.index_category(self.accessories.pk)
+        self.assertEqual(self.names('power'), ['Charger'])
+
+        pk = self.charger.pk
+        self.charger.delete()
+        search.remove_products([pk])
+        self.assertEqual(self.names('charger'), [])
+
+    def test_misspelled_terms_match_nearby_words(self):
+        index = search.InvertedIndex()
+        ranked = [pk for pk, _ in index.search(['galaxi'])]
+        self.assertEqual(ranked, [self.galaxy.pk])
+        # Too short to correct
+        self.assertEqual(index.search(['acx']), [])
+
+    def test_endpoint_respects_list_filters(self):
+        response = self.client.get('/api/products/search/', {'q': 'acme', 'category_id': self.accessories.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['name'] for product in response.json()['products']], ['Charger'])
+        self.assertEqual(self.client.get('/api/products/search/').json(), {'products': []})
+
+
+class SuggestTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.phone = Product.objects.create(name='Galaxy Phone', brand='Samsung', model='S24', category=cls.category)
+        cls.tab = Product.objects.create(name='Galaxy Tab', brand='Samsung', category=cls.category)
+        Product.objects.create(name='Galaxy Old', brand='Samsung', category=cls.category, is_active=False)
+        users = [User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='pw') for i in range(3)]
+        PriceAlert.objects.create(user=users[0], product=cls.tab)
+        PriceAlert.objects.create(user=users[1], product=cls.tab)
+        PriceAlert.objects.create(user=users[2], product=cls.phone)
+        PriceAlert.objects.create(user=users[0], product=cls.product, is_active=False)
+
+    def setUp(self):
+        super().setUp()
+        self.index = SuggestIndex()
+
+    def names(self, query, limit=10):
+        return [suggestion['name'] for suggestion in self.index.suggest(query, limit)]
+
+    def test_prefixes_match_word_starts_brands_and_models(self):
+        self.assertEqual(self.names('gal'), ['Galaxy Tab', 'Galaxy Phone'])
+        # Only active alerts count as watchers
+        self.assertEqual(self.names('pho'), ['Galaxy Phone', 'Acme Phone'])
+        self.assertEqual(self.names('SAMS'), ['Galaxy Tab', 'Galaxy Phone'])
+        self.assertEqual(self.names('s24'), ['Galaxy Phone'])
+        self.assertEqual(self.names('old'), [])
+        self.assertEqual(self.names('?'), [])
+
+    def test_short_prefixes_and_limits(self):
+        self.assertEqual(self.names('g', limit=1), ['Galaxy Tab'])
+        self.assertEqual(self.names('ga'), self.names('gal'))
+        self.assertEqual(self.names('g', limit=0), ['Galaxy Tab'])
+
+    def test_trailing_space_matches_whole_words(self):
+        self.assertEqual(self.names('gal '), [])
+        self.assertEqual(self.names('galaxy '), ['Galaxy Tab', 'Galaxy Phone'])
+
+    def test_saved_products_are_served_from_the_overlay(self):
+        self.index.rebuild()
+        self.product.name = 'Galaxy Mini'
+        with self.assertNumQueries(0):
+            self.index.update(self.product)
+            self.index.remove(self.tab.pk)
+            self.assertEqual(self.names('galaxy'), ['Galaxy Phone', 'Galaxy Mini'])
+        self.product.is_active = False
+        self.index.update(self.product)
+        self.assertEqual(self.names('galaxy'), ['Galaxy Phone'])
+
+    def test_rebuild_supersedes_earlier_overlay_entries(self):
+        self.index.rebuild()
+        self.index.remove(self.tab.pk)
+        self.assertEqual(self.names('galaxy'), ['Galaxy Phone'])
+        self.index.rebuild()
+        self.assertEqual(self.names('galaxy'), ['Galaxy Tab', 'Galaxy Phone'])
+
+    def test_endpoint(self):
+        suggest_index.rebuild()
+        response = self.client.get('/api/products/suggest/', {'q': 'acme'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'suggestions': [
+            {'id': self.product.pk, 'name': 'Acme Phone', 'brand': 'Acme', 'model': None},
+        ]})
+        self.assertEqual(self.client.get('/api/products/suggest/', {'q': 'acme', 'limit': 'x'}).status_code, 400)
+
+
+class ProductCountTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.smartphones = Subcategory.objects.create(category=cls.category, name='Smartphones')
+        Product.objects.create(name='Galaxy Phone', category=cls.category, subcategory=cls.smartphones)
+        Product.objects.create(name='Old Phone', category=cls.category, subcategory=cls.smartphones, is_active=False)
+        Category.objects.create(name='Empty')
+
+    def counts(self, url):
+        cache.clear()
+        return {row['name']: row['products_count'] for row in self.client.get(url).json()['results']}
+
+    def test_lists_count_active_products(self):
+        self.assertEqual(self.counts('/api/categories/'), {'Empty': 0, 'Phones': 2})
+        self.assertEqual(self.counts('/api/subcategories/'), {'Smartphones': 1})
+        response = self.client.get(f'/api/categories/{self.category.pk}/')
+        self.assertEqual(response.json()['products_count'], 2)
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        def queries(url):
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            return len(context)
+
+        before = queries('/api/categories/'), queries('/api/subcategories/')
+        for i in range(5):
+            category = Category.objects.create(name=f'Category {i}')
+            Subcategory.objects.create(category=category, name=f'Subcategory {i}')
+            Product.objects.create(name=f'Product {i}', category=category)
+        self.assertEqual((queries('/api/categories/'), queries('/api/subcategories/')), before)
+
+    def test_new_instances_are_counted_without_the_annotation(self):
+        self.client.force_authenticate(User.objects.create_user(username='staff', email='staff@example.com', password='pw'))
+        response = self.client.post('/api/categories/', {'name': 'Tablets'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['products_count'], 0)
+
+
+class CatalogTreeTests(CatalogTestCase):
+    url = '/api/catalog/tree/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.smartphones = Subcategory.objects.create(category=cls.category, name='Smartphones')
+
+    def test_tree_lists_subcategories_under_categories(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        [category] = response.json()['categories']
+        self.assertEqual(category['name'], 'Phones')
+        self.assertEqual(category['products_count'], 1)
+        self.assertEqual(
+            [(sub['name'], sub['products_count']) for sub in category['subcategories']],
+            [('Smartphones', 0)],
+        )
+
+    def test_tree_is_served_from_cache_with_an_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"stale", W/{etag}').status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_catalog_changes_replace_the_tree(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Galaxy Phone', category=self.category, subcategory=self.smartphones)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['categories'][0]['subcategories'][0]['products_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.smartphones.delete()
+        self.assertEqual(self.client.get(self.url).json()['categories'][0]['subcategories'], [])
+
+    def test_losing_the_version_does_not_serve_an_old_tree(self):
+        self.client.get(self.url)
+        Category.objects.create(name='Tablets')
+        cache.delete(VERSION_KEY)
+        names = [category['name'] for category in self.client.get(self.url).json()['categories']]
+        self.assertEqual(names, ['Phones', 'Tablets'])
+
+
+class CurrentPriceReadTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = Provider.objects.create(name='Other')
+
+    def price(self, provider, amount, **extra):
+        # Apply the cache invalidation a committed ingest would
+        with self.captureOnCommitCallbacks(execute=True):
+            return Price.objects.create(product=self.product, provider=provider, price=Decimal(amount), **extra)
+
+    def listed(self):
+        response = self.client.get('/api/products/')
+        [product] = response.json()['results']
+        return response['X-Cache'], product['current_lowest_price'], product['current_lowest_price_provider']
+
+    def test_lowest_available_current_price_is_listed_and_retrieved(self):
+        self.price(self.provider, '10')
+        self.price(self.other, '12')
+        self.price(self.provider, '14')
+        self.assertEqual(self.listed(), ('MISS', '12.00', 'Other'))
+        product = self.client.get(f'/api/products/{self.product.pk}/').json()
+        self.assertEqual(product['current_lowest_price'], '12.00')
+        self.assertEqual(product['current_lowest_price_provider'], 'Other')
+
+        self.price(self.other, '9', is_available=False)
+        self.assertEqual(self.listed(), ('MISS', '14.00', 'Shop'))
+
+    def test_ingests_that_keep_the_lowest_price_keep_the_cache(self):
+        self.price(self.provider, '10')
+        self.assertEqual(self.listed(), ('MISS', '10.00', 'Shop'))
+        self.price(self.other, '15')
+        self.assertEqual(self.listed(), ('HIT', '10.00', 'Shop'))
+        self.price(self.other, '8')
+        self.assertEqual(self.listed(), ('MISS', '8.00', 'Other'))
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def test_non_integer_lookup_is_not_found(self):
+        for url in ('/api/products/abc/', '/api/categories/abc/', '/api/subcategories/abc/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get('/api/products/999999/').status_code, 404)
+
+    def test_unchanged_product_is_not_modified(self):
+        url = f'/api/products/{self.product.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_uncached_detail_is_not_modified(self):
+        # Alerts are per user, so they skip the response cache
+        user = User.objects.create_user(username='watcher', email='watcher@example.com', password='pw')
+        alert = PriceAlert.objects.create(user=user, product=self.product, target_price=Decimal('5'))
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get('/api/price-alerts/abc/').status_code, 404)
+        url = f'/api/price-alerts/{alert.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2001 00:00:00 GMT').status_code, 200,
+        )
+
+    def test_list_etag_follows_the_filtered_rows(self):
+        etag = self.client.get('/api/products/')['ETag']
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get('/api/products/?brand=Acme')['ETag'], etag)
+
+
+class CompareTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        FXRate.objects.create(currency='EUR', rate=Decimal('1.10'))
+        cls.other = Provider.objects.create(name='Other')
+        cls.idle = Provider.objects.create(name='Idle')
+        cls.delisted = Provider.objects.create(name='Delisted')
+        for provider in (cls.provider, cls.other, cls.idle):
+            ProductProvider.objects.create(product=cls.product, provider=provider)
+        ProductProvider.objects.create(product=cls.product, provider=cls.delisted, is_active=False)
+        cls.large = Variant.objects.create(product=cls.product, name='Large')
+
+        Price.objects.create(product=cls.product, provider=cls.provider, price=Decimal('12'))
+        Price.objects.create(
+            product=cls.product, provider=cls.provider, variant=cls.large, price=Decimal('9'), is_available=False,
+        )
+        Price.objects.create(product=cls.product, provider=cls.other, price=Decimal('10'), currency='EUR')
+        Price.objects.create(product=cls.product, provider=cls.delisted, price=Decimal('5'))
+
+        cls.tablet = Product.objects.create(name='Acme Tablet', category=cls.category)
+        ProductProvider.objects.create(product=cls.tablet, provider=cls.provider)
+        Price.objects.create(product=cls.tablet, provider=cls.provider, price=Decimal('30'))
+
+    def test_offers_are_ranked_with_deltas_against_the_cheapest(self):
+        response = self.client.get(f'/api/products/{self.product.pk}/compare/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['currency'], 'USD')
+        offers = [
+            (offer['provider_name'], offer['price'], offer['currency'], offer['converted_price'],
+             offer['delta'], offer['delta_percent'])
+            for offer in data['offers']
+        ]
+        self.assertEqual(offers, [
+            ('Other', '10.00', 'EUR', '11.00', '0.00', 0.0),
+            ('Shop', '12.00', 'USD', '12.00', '1.00', 9.09),
+            ('Idle', None, None, None, None, None),
+        ])
+        # The unavailable variant is listed but does not set the headline price
+        [variant] = data['offers'][1]['variants']
+        self.assertEqual((variant['variant_name'], variant['price'], variant['is_available']), ('Large', '9.00', False))
+
+    def test_display_currency(self):
+        offers = self.client.get(f'/api/products/{self.product.pk}/compare/', {'currency': 'eur'}).json()['offers']
+        self.assertEqual([(offer['converted_price'], offer['delta']) for offer in offers[:2]], [
+            ('10.00', '0.00'), ('10.91', '0.91'),
+        ])
+
+    def test_many_products_in_constant_queries(self):
+        def compare(ids):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/api/products/compare/', {'ids': ids})
+            self.assertEqual(response.status_code, 200)
+            return response.json(), len(context)
+
+        fx.current_rates()
+        one, queries = compare(f'{self.product.pk}')
+        both, more_queries = compare(f'{self.tablet.pk},{self.product.pk},999999')
+        self.assertEqual(queries, more_queries)
+        self.assertEqual([entry['product'] for entry in both['products']], [self.product.pk, self.tablet.pk])
+        self.assertEqual(both['products'][0], one['products'][0])
+        self.assertEqual([offer['price'] for offer in both['products'][1]['offers']], ['30.00'])
+
+    def test_invalid_ids(self):
+        for ids in (None, '', '1,x', ','.join(map(str, range(1, 102)))):
+            with self.subTest(ids=ids):
+                params = {} if ids is None else {'ids': ids}
+                self.assertEqual(self.client.get('/api/products/compare/', params).status_code, 400)
+
+
+class DisplayCurrencyTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        FXRate.objects.create(currency='EUR', rate=Decimal('1.25'))
+        Price.objects.create(product=cls.product, provider=cls.provider, price=Decimal('20'), currency='EUR')
+
+    def lowest(self, **params):
+        product = self.client.get(f'/api/products/{self.product.pk}/', params).json()
+        return product['current_lowest_price'], product['current_lowest_price_currency']
+
+    def test_prices_are_shown_in_the_requested_currency(self):
+        self.assertEqual(self.lowest(), ('25.00', 'USD'))
+        self.assertEqual(self.lowest(currency='eur'), ('20.00', 'EUR'))
+        self.assertEqual(self.lowest(currency='XYZ'), ('25.00', 'USD'))
+
+    def test_preferred_currency_of_the_user(self):
+        user = User.objects.create_user(username='reader', email='reader@example.com', password='pw')
+        UserProfile.objects.create(user=user, preferred_currency='EUR')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        self.assertEqual(self.lowest(), ('20.00', 'EUR'))
+        self.assertEqual(self.lowest(currency='USD'), ('25.00', 'USD'))
+
+
+class InsightsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tablet = Product.objects.create(name='Acme Tablet', category=cls.category)
+        Product.objects.create(name='Acme Watch', category=cls.category)
+        today = PriceRollup.bucket_for(timezone.now(), PriceRollup.DAY)
+        PriceRollup.objects.record([
+            (cls.product.pk, cls.provider.pk, Decimal('20'), today - timedelta(days=5)),
+            (cls.product.pk, cls.provider.pk, Decimal('15'), today - timedelta(days=2)),
+            (cls.tablet.pk, cls.provider.pk, Decimal('40'), today - timedelta(days=5)),
+            (cls.tablet.pk, cls.provider.pk, Decimal('38'), today - timedelta(days=2)),
+        ])
+
+    def test_product_insights(self):
+        response = self.client.get(f'/api/products/{self.product.pk}/insights/', {'days': 3})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['currency'], data['days']), ('USD', 3))
+        self.assertEqual(data['current_price'], '15.00')
+        self.assertEqual(data['high_30d'], '20.00')
+        self.assertEqual(data['drop_from_high_percent'], 25.0)
+        self.assertTrue(data['is_all_time_low'])
+        self.assertEqual([point['price'] for point in data['series']], ['15.00', '15.00', '15.00'])
+
+    def test_category_insights_are_ranked_and_leave_out_products_without_prices(self):
+        response = self.client.get(f'/api/categories/{self.category.pk}/insights/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['product_name'] for item in response.json()['products']], ['Acme Phone', 'Acme Tablet'])
+
+        response = self.client.get(f'/api/categories/{self.category.pk}/insights/', {'limit': 1})
+        self.assertEqual([item['product'] for item in response.json()['products']], [self.product.pk])
 
-# Create your tests here.
+    def test_invalid_parameters(self):
+        for params in ({'limit': 0}, {'limit': -1}, {'limit': 'x'}, {'ordering': 'price'}, {'days': 0}):
+            with self.subTest(params=params):
+                response = self.client.get(f'/api/categories/{self.category.pk}/insights/', params)
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get(f'/api/products/{self.product.pk}/insights/', {'days': 'x'})
+        self.assertEqual(response.status_code, 400)
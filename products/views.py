@@ -1,10 +1,23 @@
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
+from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from datetime import timedelta
 
+from backend.caching import CachedResponseMixin
+from backend.conditional import ConditionalGetMixin
+
+from prices.fx import display_currency
+from prices.models import LOWEST_PRICE_LABEL
+
+from .catalog import catalog_tree
+from .search import search_products
+from .suggest import suggest_index
 from .models import Category, Subcategory, Location, Provider, Product, Variant, ProductProvider
 from .serializers import (
     CategorySerializer, SubcategorySerializer, LocationSerializer,
@@ -12,8 +25,30 @@ from .serializers import (
 )
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+INSIGHT_MODELS = ['products.product', 'prices.pricerollup', 'prices.fxrate']
+# Upper bound on the products listed by a category's insights
+MAX_INSIGHT_RESULTS = 200
+
+
+def _insight_days(request):
+    """The ?days= window for insights, or None if it is not an integer from 1 to MAX_DAYS"""
+    from prices.analytics import DEFAULT_DAYS, MAX_DAYS
+
+    try:
+        days = int(request.query_params.get('days', DEFAULT_DAYS))
+    except ValueError:
+        return None
+    return days if 0 < days <= MAX_DAYS else None
+
+
+class CategoryViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    cache_actions = {
+        'list': ['products.category', 'products.product'],
+        'retrieve': ['products.category', 'products.product'],
+        'insights': INSIGHT_MODELS,
+    }
+    conditional_models = ['products.product']
+    queryset = Category.objects.with_products_count()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -21,9 +56,60 @@ class CategoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
 
+    @action(detail=True, methods=['get'])
+    def insights(self, request, pk=None):
+        """Price insights for the category's active products, ranked: ?ordering=drop|volatility&limit="""
+        category = self.get_object()
+        from prices.analytics import MAX_DAYS, RANKINGS, rank_insights
+        from prices.serializers import PriceInsightSerializer
+
+        ordering = request.query_params.get('ordering', 'drop')
+        if ordering not in RANKINGS:
+            return Response(
+                {'error': f'ordering must be one of {", ".join(sorted(RANKINGS))}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        days = _insight_days(request)
+        if days is None:
+            return Response(
+                {'error': f'days must be an integer between 1 and {MAX_DAYS}'}, status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = min(int(request.query_params.get('limit', 50)), MAX_INSIGHT_RESULTS)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({'error': 'limit must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        products = Product.objects.filter(category=category, is_active=True)
+        subcategory = request.query_params.get('subcategory')
+        if subcategory:
+            if not subcategory.isdigit():
+                return Response({'error': 'subcategory must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            products = products.filter(subcategory_id=subcategory)
+        names = dict(products.values_list('pk', 'name'))
+        ranked = rank_insights(names, ordering, limit, days)
+
+        currency = display_currency(request)
+        serializer = PriceInsightSerializer(ranked, many=True, context={'currency': currency})
+        for item in serializer.data:
+            item['product_name'] = names[item['product']]
+        return Response({
+            'category': category.pk,
+            'currency': currency,
+            'ordering': ordering,
+            'days': days,
+            'products': serializer.data,
+        })
 
-class SubcategoryViewSet(viewsets.ModelViewSet):
-    queryset = Subcategory.objects.select_related('category')
+
+class SubcategoryViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    cache_actions = {
+        'list': ['products.category', 'products.subcategory', 'products.product'],
+        'retrieve': ['products.category', 'products.subcategory', 'products.product'],
+    }
+    conditional_models = ['products.category', 'products.product']
+    queryset = Subcategory.objects.select_related('category').with_products_count()
     serializer_class = SubcategorySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -33,6 +119,19 @@ class SubcategoryViewSet(viewsets.ModelViewSet):
     ordering = ['name']
 
 
+class CatalogTreeView(APIView):
+    """The full category -> subcategory tree with active product counts"""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        etag, body = catalog_tree()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
 class LocationViewSet(viewsets.ModelViewSet):
     queryset = Location.objects.all()
     serializer_class = LocationSerializer
@@ -54,7 +153,35 @@ class ProviderViewSet(viewsets.ModelViewSet):
     ordering = ['name']
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+# Listings only show each product's lowest price, so they skip ingests that leave it alone
+PRODUCT_LIST_MODELS = [
+    'products.product', 'products.category', 'products.subcategory', 'products.variant',
+    LOWEST_PRICE_LABEL, 'products.provider', 'prices.fxrate',
+]
+
+COMPARE_MODELS = [
+    'products.product', 'products.productprovider', 'products.provider', 'products.variant',
+    'prices.currentprice', 'prices.fxrate',
+]
+# Upper bound on product ids accepted by the batched comparison
+MAX_COMPARE_PRODUCTS = 100
+# Longest range a price chart covers; longer requests are clamped to it.
+# One point per day keeps it within PriceRollup.MAX_CHART_POINTS
+MAX_CHART_DAYS = 1000
+
+
+class ProductViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    cache_actions = {
+        'list': PRODUCT_LIST_MODELS,
+        'retrieve': PRODUCT_LIST_MODELS,
+        'search': PRODUCT_LIST_MODELS,
+        'price_history': ['products.product', 'prices.price'],
+        'price_chart': ['products.product', 'prices.price', 'prices.pricerollup', 'prices.fxrate'],
+        'compare': COMPARE_MODELS,
+        'compare_many': COMPARE_MODELS,
+        'insights': INSIGHT_MODELS,
+    }
+    conditional_models = [label for label in PRODUCT_LIST_MODELS if label != 'products.product']
     queryset = Product.objects.select_related('category', 'subcategory').prefetch_related('variants')
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
@@ -65,7 +192,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().with_lowest_price()
         
         # Filter by category or subcategory if provided
         category_id = self.request.query_params.get('category_id')
@@ -80,14 +207,148 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def price_history(self, request, pk=None):
-        """Get price history for a specific product"""
+        """Get the latest prices for a product, including archived ones when the database has fewer"""
         product = self.get_object()
+        from prices import archive
         from prices.models import Price
-        from prices.serializers import PriceSerializer
-        
-        prices = Price.objects.filter(product=product).order_by('-timestamp')[:30]
-        serializer = PriceSerializer(prices, many=True)
-        return Response(serializer.data)
+        from prices.serializers import ArchivedPriceSerializer, PriceSerializer
+
+        limit = 30
+        prices = list(
+            Price.objects.filter(product=product)
+            .select_related('product', 'provider', 'variant')
+            .order_by('-timestamp', '-id')[:limit]
+        )
+        # Archived rows only matter if they are newer than the oldest row
+        # shown, which only happens for a sparse or partly archived history
+        since = prices[-1].timestamp if len(prices) == limit else None
+        archived = archive.latest(product.pk, limit, since)
+        if not archived:
+            return Response(PriceSerializer(prices, many=True).data)
+
+        rows = [(price.timestamp, price.pk, PriceSerializer(price).data) for price in prices]
+        rows += [(row['timestamp'], row['id'], ArchivedPriceSerializer(row).data) for row in archived]
+        rows.sort(key=lambda row: row[:2], reverse=True)
+        return Response([data for _, _, data in rows[:limit]])
+
+    @action(detail=True, methods=['get'])
+    def price_chart(self, request, pk=None):
+        """Get OHLC chart points at the coarsest resolution that fits the range"""
+        product = self.get_object()
+        from prices.models import Price, PriceRollup
+        from prices.serializers import PriceRollupSerializer
+
+        try:
+            days = int(request.query_params.get('days', 30))
+            provider_id = request.query_params.get('provider_id')
+            provider_id = int(provider_id) if provider_id else None
+        except ValueError:
+            return Response({'error': 'days and provider_id must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        span = timedelta(days=min(max(days, 1), MAX_CHART_DAYS))
+        start = timezone.now() - span
+
+        requested = request.query_params.get('resolution') or 'raw'
+        if requested not in ('raw', PriceRollup.HOUR, PriceRollup.DAY):
+            return Response({'error': 'resolution must be raw, hour or day'}, status=status.HTTP_400_BAD_REQUEST)
+        # A finer resolution than the range allows is coarsened to stay within MAX_CHART_POINTS
+        resolution = PriceRollup.resolution_for(span, None if requested == 'raw' else requested)
+
+        currency = display_currency(request)
+        if resolution is None:
+            prices = Price.objects.filter(
+                product=product, is_available=True, price_base__isnull=False, timestamp__gte=start,
+            )
+            if provider_id:
+                prices = prices.filter(provider_id=provider_id)
+            points = [
+                {
+                    'bucket_start': timestamp, 'open': price, 'high': price, 'low': price,
+                    'close': price, 'average': price, 'count': 1,
+                }
+                for timestamp, price in prices.order_by('timestamp').values_list('timestamp', 'price_base')
+            ]
+            return Response({
+                'resolution': 'raw',
+                'currency': currency,
+                'points': PriceRollupSerializer(points, many=True, context={'currency': currency}).data,
+            })
+
+        rollups = PriceRollup.objects.filter(
+            product=product,
+            resolution=resolution,
+            provider_id=provider_id or None,
+            bucket_start__gte=PriceRollup.bucket_for(start, resolution),
+        )
+        return Response({
+            'resolution': resolution,
+            'currency': currency,
+            'points': PriceRollupSerializer(rollups, many=True, context={'currency': currency}).data,
+        })
+
+    @action(detail=True, methods=['get'])
+    def compare(self, request, pk=None):
+        """Latest offer from every active provider, with deltas against the cheapest"""
+        product = self.get_object()
+        from prices.compare import compare_products
+        from prices.serializers import ProviderOfferSerializer
+
+        currency = display_currency(request)
+        offers = compare_products([product.pk], currency)[product.pk]
+        return Response({
+            'product': product.pk,
+            'currency': currency,
+            'offers': ProviderOfferSerializer(offers, many=True).data,
+        })
+
+    @action(detail=False, methods=['get'], url_path='compare')
+    def compare_many(self, request):
+        """Provider comparison for several products: ?ids=1,2,3"""
+        from prices.compare import compare_products
+        from prices.serializers import ProviderOfferSerializer
+
+        try:
+            product_ids = sorted({
+                int(product_id)
+                for value in request.query_params.getlist('ids')
+                for product_id in value.split(',') if product_id
+            })
+        except ValueError:
+            return Response({'error': 'ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not product_ids:
+            return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(product_ids) > MAX_COMPARE_PRODUCTS:
+            return Response(
+                {'error': f'At most {MAX_COMPARE_PRODUCTS} products can be compared at once'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        product_ids = list(self.get_queryset().filter(pk__in=product_ids).values_list('pk', flat=True))
+        currency = display_currency(request)
+        comparison = compare_products(product_ids, currency)
+        return Response({
+            'currency': currency,
+            'products': [
+                {'product': product_id, 'offers': ProviderOfferSerializer(comparison[product_id], many=True).data}
+                for product_id in sorted(product_ids)
+            ]
+        })
+
+    @action(detail=True, methods=['get'])
+    def insights(self, request, pk=None):
+        """Moving averages, drop from the 30-day high, volatility and all-time-low flag for a product"""
+        product = self.get_object()
+        from prices.analytics import MAX_DAYS, compute_insights
+        from prices.serializers import PriceInsightSerializer
+
+        days = _insight_days(request)
+        if days is None:
+            return Response(
+                {'error': f'days must be an integer between 1 and {MAX_DAYS}'}, status=status.HTTP_400_BAD_REQUEST,
+            )
+        currency = display_currency(request)
+        insights = compute_insights([product.pk], days, series=True)[product.pk]
+        data = PriceInsightSerializer(insights, context={'currency': currency}).data
+        return Response({'currency': currency, 'days': days, **data})
 
     @action(detail=False, methods=['get'])
     def search(self, request):
@@ -96,18 +357,21 @@ class ProductViewSet(viewsets.ModelViewSet):
         if not query:
             return Response({'products': []})
 
-        products = self.get_queryset().filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(brand__icontains=query) |
-            Q(model__icontains=query) |
-            Q(category__name__icontains=query) |
-            Q(subcategory__name__icontains=query)
-        ).distinct()[:20]
+        products = search_products(self.get_queryset(), query, limit=20)
 
         serializer = self.get_serializer(products, many=True)
         return Response({'products': serializer.data})
 
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """Autocomplete product names, brands and models from memory"""
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        suggestions = suggest_index.suggest(request.query_params.get('q', ''), limit)
+        return Response({'suggestions': suggestions})
+
 
 class VariantViewSet(viewsets.ModelViewSet):
     queryset = Variant.objects.select_related('product')